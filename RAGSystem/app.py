@@ -1,24 +1,157 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Request, Response, current_app, request, jsonify, render_template, send_from_directory, stream_with_context
+import io
 import os
+import shutil
+import tempfile
 from werkzeug.utils import secure_filename
 import uuid
 import json
 from datetime import datetime
+from dotenv import load_dotenv
+
+# Settings may come from a .env file, read before the configuration below
+load_dotenv()
 
 # Import our RAG system
 from rag_system import RAGSystem
+from query_cache import QueryCache
+from llm_backends import create_backend
+from reranker import Reranker
+from ingestion import IngestionQueue, IngestionQueueFull
+from session_store import create_session_store
+from document_registry import DocumentRegistry, file_hash
+from context_builder import ContextBuilder
+from vector_index import validate_where
+
+class UploadRequest(Request):
+    """Request that keeps file uploads in memory up to UPLOAD_SPOOL_SIZE bytes
+    
+    Larger uploads are streamed to a temporary file in UPLOAD_TMP_DIR that
+    outlives the request so an ingestion job can take it over, see
+    take_upload(). Those no route took over are removed when the request ends.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= current_app.config['UPLOAD_SPOOL_SIZE']:
+            return io.BytesIO()
+        spilled = tempfile.NamedTemporaryFile(prefix="upload_", dir=current_app.config['UPLOAD_TMP_DIR'], delete=False)
+        if not hasattr(self, 'spilled_uploads'):
+            self.spilled_uploads = []
+        self.spilled_uploads.append(spilled.name)
+        return spilled
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'txt', 'docx'}
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_SPOOL_SIZE'] = int(os.environ.get('UPLOAD_SPOOL_SIZE', 4 * 1024 * 1024))
+app.config['UPLOAD_TMP_DIR'] = os.environ.get('UPLOAD_TMP_DIR')
+app.config['PERSIST_UPLOADS'] = os.environ.get('PERSIST_UPLOADS', '1') == '1'
+app.config['INGESTION_WORKERS'] = int(os.environ.get('INGESTION_WORKERS', 2))
+app.config['INGESTION_QUEUE_SIZE'] = int(os.environ.get('INGESTION_QUEUE_SIZE', 16))
+app.config['QUERY_CACHE_SIZE'] = int(os.environ.get('QUERY_CACHE_SIZE', 1024))
+app.config['QUERY_CACHE_TTL'] = float(os.environ.get('QUERY_CACHE_TTL', 3600))
+app.config['QUERY_CACHE_THRESHOLD'] = float(os.environ.get('QUERY_CACHE_THRESHOLD', 0.95))
+app.config['LLM_BACKEND'] = os.environ.get('LLM_BACKEND', 'openai')
+app.config['LLM_MODEL'] = os.environ.get('LLM_MODEL')
+app.config['LLM_BASE_URL'] = os.environ.get('LLM_BASE_URL')
+app.config['LLM_BATCH_SIZE'] = int(os.environ.get('LLM_BATCH_SIZE', 8))
+app.config['CHUNK_TOKENS'] = int(os.environ.get('CHUNK_TOKENS', 200))
+app.config['MAX_CHUNK_TOKENS'] = int(os.environ.get('MAX_CHUNK_TOKENS', 254))
+app.config['CHUNK_OVERLAP'] = int(os.environ.get('CHUNK_OVERLAP', 32))
+app.config['EMBEDDING_PROCESSES'] = int(os.environ.get('EMBEDDING_PROCESSES', 0))
+app.config['EMBEDDING_MODEL'] = os.environ.get('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+app.config['EMBEDDING_BACKEND'] = os.environ.get('EMBEDDING_BACKEND', 'torch')
+app.config['EMBEDDING_EXPORT_DIR'] = os.environ.get('EMBEDDING_EXPORT_DIR', './embedding_models')
+app.config['RERANK'] = os.environ.get('RERANK', '0') == '1'
+app.config['RERANK_CANDIDATES'] = int(os.environ.get('RERANK_CANDIDATES', 20))
+app.config['RERANK_THRESHOLD'] = float(os.environ['RERANK_THRESHOLD']) if 'RERANK_THRESHOLD' in os.environ else None
+app.config['RERANK_TOKEN_BUDGET'] = int(os.environ['RERANK_TOKEN_BUDGET']) if 'RERANK_TOKEN_BUDGET' in os.environ else None
+app.config['CONTEXT_TOKEN_BUDGET'] = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1500))
+app.config['CONTEXT_DEDUP_THRESHOLD'] = float(os.environ.get('CONTEXT_DEDUP_THRESHOLD', 0.8))
+app.config['VECTOR_BACKEND'] = os.environ.get('VECTOR_BACKEND', 'chroma')
+app.config['CHAT_BATCH_MAX'] = int(os.environ.get('CHAT_BATCH_MAX', 64))
+app.config['CHAT_BATCH_CONCURRENCY'] = int(os.environ.get('CHAT_BATCH_CONCURRENCY', 8))
+app.config['CPU_WORKERS'] = int(os.environ['CPU_WORKERS']) if 'CPU_WORKERS' in os.environ else None
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'memory')
+app.config['SESSION_DB'] = os.environ.get('SESSION_DB', './sessions.db')
+app.config['SESSION_MAX'] = int(os.environ.get('SESSION_MAX', 10000))
+app.config['SESSION_TTL'] = float(os.environ.get('SESSION_TTL', 30 * 86400))
+app.config['SESSION_MAX_TURNS'] = int(os.environ.get('SESSION_MAX_TURNS', 100))
+app.config['MAX_LISTED_FILES'] = int(os.environ.get('MAX_LISTED_FILES', 10000))
+app.config['CHAT_HISTORY_TURNS'] = int(os.environ.get('CHAT_HISTORY_TURNS', 0))
+app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 50))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 500))
+app.config['DOCUMENT_REGISTRY'] = os.environ.get('DOCUMENT_REGISTRY', './document_registry.db')
+app.config['SYNC_DIRECTORY'] = os.environ.get('SYNC_DIRECTORY')
+app.config['PRELOAD_MODELS'] = os.environ.get('PRELOAD_MODELS', '0') == '1'
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize RAG system
 # rag = RAGSystem(api_key=os.environ.get("OPENAI_API_KEY"))
-rag = RAGSystem()
+rag = RAGSystem(
+    query_cache=QueryCache(
+        capacity=app.config['QUERY_CACHE_SIZE'],
+        ttl=app.config['QUERY_CACHE_TTL'],
+        similarity_threshold=app.config['QUERY_CACHE_THRESHOLD']
+    ),
+    llm=create_backend(
+        app.config['LLM_BACKEND'],
+        model=app.config['LLM_MODEL'],
+        batch_size=app.config['LLM_BATCH_SIZE'],
+        base_url=app.config['LLM_BASE_URL']
+    ),
+    chunk_tokens=app.config['CHUNK_TOKENS'],
+    max_chunk_tokens=app.config['MAX_CHUNK_TOKENS'],
+    chunk_overlap=app.config['CHUNK_OVERLAP'],
+    embedding_processes=app.config['EMBEDDING_PROCESSES'],
+    embedding_model=app.config['EMBEDDING_MODEL'],
+    embedding_backend=app.config['EMBEDDING_BACKEND'],
+    embedding_export_dir=app.config['EMBEDDING_EXPORT_DIR'],
+    reranker=Reranker(
+        score_threshold=app.config['RERANK_THRESHOLD'],
+        token_budget=app.config['RERANK_TOKEN_BUDGET']
+    ) if app.config['RERANK'] else None,
+    rerank_candidates=app.config['RERANK_CANDIDATES'],
+    context_builder=ContextBuilder(
+        token_budget=app.config['CONTEXT_TOKEN_BUDGET'],
+        similarity_threshold=app.config['CONTEXT_DEDUP_THRESHOLD']
+    ),
+    vector_backend=app.config['VECTOR_BACKEND'],
+    cpu_workers=app.config['CPU_WORKERS'],
+    document_registry=DocumentRegistry(app.config['DOCUMENT_REGISTRY'])
+)
+
+# Sessions, their recent turns and the uploaded files, bounded in size. With
+# SESSION_BACKEND=sqlite they survive restarts and are shared by workers.
+session_store = create_session_store(
+    app.config['SESSION_BACKEND'],
+    path=app.config['SESSION_DB'],
+    max_sessions=app.config['SESSION_MAX'],
+    ttl=app.config['SESSION_TTL'],
+    max_turns=app.config['SESSION_MAX_TURNS'],
+    max_files=app.config['MAX_LISTED_FILES']
+)
+
+# Background ingestion so uploads don't block request threads
+ingestion_queue = IngestionQueue(
+    rag,
+    num_workers=app.config['INGESTION_WORKERS'],
+    max_queue_size=app.config['INGESTION_QUEUE_SIZE']
+)
+
+# Models load on first use so the server starts fast. With a pre-forking
+# server (gunicorn --preload), PRELOAD_MODELS=1 loads them once in the parent
+# so workers share the weights; databases and threads are opened per worker.
+if app.config['PRELOAD_MODELS']:
+    rag.warmup(models_only=True)
+
+# Gauges read when /metrics is scraped
+rag.metrics.gauge('ingestion_queue_pending', ingestion_queue.pending)
+rag.metrics.gauge('sessions', session_store.count)
 
 
 # Helper function to check allowed file extensions
@@ -26,9 +159,82 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-# Session storage (would use a database in production)
-sessions = {}
-uploaded_files = []
+def take_upload(file):
+    """The content of an uploaded file for an ingestion job, parsed without saving it first
+    
+    Uploads held in memory are returned as bytes. A spilled upload is
+    returned as its temporary file, opened again, which the request no
+    longer removes: release_upload() must be called once the job is done.
+    """
+    if isinstance(file.stream, io.BytesIO):
+        return file.stream.getvalue()
+    request.spilled_uploads.remove(file.stream.name)
+    return open(file.stream.name, 'rb')
+
+def upload_size(content):
+    return len(content) if isinstance(content, bytes) else os.path.getsize(content.name)
+
+def release_upload(content, file_path=None):
+    """Write the upload to file_path if given and PERSIST_UPLOADS, then remove its temporary file
+    
+    The file is written under a temporary name and swapped in, so readers
+    never see half a file. This runs in the ingestion worker, off the
+    request path.
+    """
+    try:
+        if file_path is not None and app.config['PERSIST_UPLOADS']:
+            tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+            if isinstance(content, bytes):
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+            else:
+                content.close()
+                shutil.move(content.name, tmp_path)
+            os.replace(tmp_path, file_path)
+    finally:
+        if not isinstance(content, bytes):
+            content.close()
+            if os.path.exists(content.name):
+                os.remove(content.name)
+
+def page_args():
+    """offset and limit query parameters of a paginated listing"""
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+    return max(offset, 0), min(max(limit, 0), app.config['MAX_PAGE_SIZE'])
+
+def is_within(path, directory):
+    """Whether path is directory or inside it, after resolving links"""
+    path, directory = os.path.realpath(path), os.path.realpath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+def chat_filter(data):
+    """Metadata filter of a chat request, ValueError if it is malformed
+    
+    "filter" is a where clause (see vector_index.validate_where) and
+    "sources" a shortcut to only search the listed documents.
+    """
+    where = data.get('filter')
+    sources = data.get('sources')
+    if sources is not None:
+        if not isinstance(sources, list) or not sources or not all(isinstance(source, str) for source in sources):
+            raise ValueError("Sources must be a non-empty list of strings")
+        scope = {'source': {'$in': sources}}
+        where = scope if where is None else {'$and': [where, scope]}
+    if where is not None:
+        validate_where(where)
+    return where
+
+def recent_turns(session_id):
+    """The last CHAT_HISTORY_TURNS turns of the session, given to the LLM with the question"""
+    return session_store.recent(session_id, app.config['CHAT_HISTORY_TURNS']) or None
+
+@app.teardown_request
+def remove_spilled_uploads(exc):
+    """Remove the temporary files of uploads no route took over"""
+    for path in getattr(request, 'spilled_uploads', ()):
+        if os.path.exists(path):
+            os.remove(path)
 
 @app.route('/')
 def index():
@@ -53,8 +259,20 @@ def upload_file():
         unique_filename = f"{uuid.uuid4()}_{filename}"
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
         
-        # Save file
-        file.save(file_path)
+        # Parse from memory, the original is written to file_path by the job
+        content = take_upload(file)
+        
+        # The same file uploaded again is already indexed, under its first upload
+        existing = rag.document_registry.find(file_hash(content))
+        if existing is not None:
+            release_upload(content)
+            return jsonify({
+                'success': True,
+                'filename': filename,
+                'source': existing['source'],
+                'chunks': existing['chunks'],
+                'status': 'duplicate'
+            }), 200
         
         # Store file info
         file_info = {
@@ -62,31 +280,46 @@ def upload_file():
             'stored_name': unique_filename,
             'path': file_path,
             'upload_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'size': os.path.getsize(file_path)
+            'size': upload_size(content),
+            'status': 'queued'
         }
         
-        uploaded_files.append(file_info)
+        session_store.add_file(file_info)
+        
+        def on_done(job):
+            if job.status == 'completed':
+                # Keep the original, and update file info with chunk count
+                release_upload(content, file_path)
+                session_store.update_file(unique_filename, chunks=job.chunks, status='completed')
+            else:
+                # Drop the upload if processing fails
+                release_upload(content)
+                session_store.remove_file(unique_filename)
         
-        # Process the document with RAG system
+        # Queue the document for processing with the RAG system
         try:
-            chunk_count = rag.add_document(file_path, {"original_name": filename})
-            
-            # Update file info with chunk count
-            file_info['chunks'] = chunk_count
-            
-            return jsonify({
-                'success': True,
-                'filename': filename,
-                'chunks_processed': chunk_count
-            })
-        except Exception as e:
-            # Remove file if processing fails
-            os.remove(file_path)
-            uploaded_files.pop()
-            return jsonify({'error': str(e)}), 500
+            job = ingestion_queue.submit(file_path, {"original_name": filename},
+                                         filename=filename, on_done=on_done, content=content)
+        except IngestionQueueFull as e:
+            release_upload(content)
+            session_store.remove_file(unique_filename)
+            return jsonify({'error': str(e)}), 429, {'Retry-After': '5'}
+        
+        session_store.update_file(unique_filename, job_id=job.id)
+        
+        return jsonify({
+            'success': True,
+            'filename': filename,
+            'job_id': job.id,
+            'status': job.status
+        }), 202
     
     return jsonify({'error': 'File type not allowed'}), 400
 
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/chat', methods=['POST'])
 def chat():
     data = request.json
@@ -94,70 +327,297 @@ def chat():
     # Check for required fields
     if not data or 'query' not in data:
         return jsonify({'error': 'Query is required'}), 400
+    try:
+        where = chat_filter(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Get session ID or create new one
     session_id = data.get('session_id', str(uuid.uuid4()))
     
     # Initialize session if new
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'history': [],
-            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+    session_store.ensure(session_id)
     
     # Get query
     query = data['query']
     
-    # Generate response
+    # Generate response, with the duration of each stage if asked for
     try:
-        response = rag.generate_response(query)
+        timings = {}
+        response = rag.generate_response(query, timings=timings, history=recent_turns(session_id), where=where)
         
         # Update session history
-        sessions[session_id]['history'].append({
+        session_store.append(session_id, [{
             'query': query,
             'response': response,
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+        }])
         
-        return jsonify({
+        result = {
             'success': True,
             'session_id': session_id,
             'response': response
-        })
+        }
+        if data.get('timings') or request.args.get('timings') == '1':
+            result['timings'] = timings
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answer a list of queries in one request
+    
+    Queries share one embedding call and one index search, and are
+    generated with at most CHAT_BATCH_CONCURRENCY LLM calls in flight.
+    """
+    data = request.json
+    
+    # Check for required fields
+    queries = data.get('queries') if data else None
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) for q in queries):
+        return jsonify({'error': 'Queries must be a non-empty list of strings'}), 400
+    if len(queries) > app.config['CHAT_BATCH_MAX']:
+        return jsonify({'error': f"At most {app.config['CHAT_BATCH_MAX']} queries per batch"}), 400
+    try:
+        where = chat_filter(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    session_store.ensure(session_id)
+    
+    try:
+        timings = {}
+        responses = rag.generate_responses(queries, max_concurrency=app.config['CHAT_BATCH_CONCURRENCY'],
+                                           timings=timings, where=where)
+        
+        # Update session history
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        session_store.append(session_id, [
+            {'query': query, 'response': response, 'timestamp': timestamp}
+            for query, response in zip(queries, responses)
+        ])
+        
+        result = {
+            'success': True,
+            'session_id': session_id,
+            'responses': responses
+        }
+        if data.get('timings') or request.args.get('timings') == '1':
+            result['timings'] = timings
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Same as /chat but streams the answer as Server-Sent Events
+    
+    Emits a "session" event, one "token" event per generated token and a
+    final "done" event with the sources and timings (or an "error" event).
+    """
+    data = request.json
+    
+    # Check for required fields
+    if not data or 'query' not in data:
+        return jsonify({'error': 'Query is required'}), 400
+    try:
+        where = chat_filter(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    session_store.ensure(session_id)
+    query = data['query']
+    history = recent_turns(session_id)
+    
+    def generate():
+        yield sse_event('session', {'session_id': session_id})
+        
+        tokens = []
+        try:
+            for event in rag.generate_response_stream(query, history=history, where=where):
+                if event['type'] == 'token':
+                    tokens.append(event['content'])
+                    yield sse_event('token', {'content': event['content']})
+                else:
+                    response = "".join(tokens)
+                    if event['sources']:
+                        response += "\n\nSources: " + ", ".join(event['sources'])
+                    
+                    # Update session history
+                    session_store.append(session_id, [{
+                        'query': query,
+                        'response': response,
+                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    }])
+                    yield sse_event('done', event)
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/history/<session_id>', methods=['GET'])
 def get_history(session_id):
-    if session_id not in sessions:
+    offset, limit = page_args()
+    history = session_store.history(session_id, offset=offset, limit=limit)
+    if history is None:
         return jsonify({'error': 'Session not found'}), 404
     
     return jsonify({
         'success': True,
-        'history': sessions[session_id]['history']
+        'history': history,
+        'offset': offset,
+        'limit': limit,
+        'total': session_store.message_count(session_id)
     })
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = ingestion_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+@app.route('/jobs', methods=['GET'])
+def get_jobs():
+    return jsonify({
+        'success': True,
+        'pending': ingestion_queue.pending(),
+        'embedding_cache': rag.vector_store.embedding_cache.stats(),
+        'embedding_service': rag.vector_store.embedding_service_stats(),
+        'jobs': [job.to_dict() for job in ingestion_queue.list_jobs()]
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage latency histograms and throughput counters for Prometheus"""
+    return Response(rag.metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/files', methods=['GET'])
 def get_files():
+    offset, limit = page_args()
     return jsonify({
         'success': True,
-        'files': uploaded_files
+        'files': session_store.files(offset=offset, limit=limit),
+        'offset': offset,
+        'limit': limit
     })
 
+@app.route('/documents', methods=['GET'])
+def get_documents():
+    """Indexed documents by source, with their file and chunk count"""
+    offset, limit = page_args()
+    return jsonify({
+        'success': True,
+        'documents': rag.document_registry.documents(offset=offset, limit=limit),
+        'offset': offset,
+        'limit': limit,
+        'total': len(rag.document_registry)
+    })
+
+@app.route('/documents/<path:source>', methods=['DELETE'])
+def delete_document(source):
+    """Remove a document from the indexes, and its upload if it was uploaded"""
+    entry = rag.document_registry.get(source)
+    removed = rag.delete_document(source)
+    if removed is None:
+        return jsonify({'error': 'Document not found'}), 404
+    
+    if entry['path'] and is_within(entry['path'], app.config['UPLOAD_FOLDER']):
+        if os.path.exists(entry['path']):
+            os.remove(entry['path'])
+        session_store.remove_file(source)
+    
+    return jsonify({'success': True, 'source': source, 'chunks_removed': removed})
+
+@app.route('/documents/<path:source>', methods=['PUT'])
+def update_document(source):
+    """Replace an uploaded document, only the chunks that changed are re-indexed"""
+    entry = rag.document_registry.get(source)
+    if entry is None:
+        return jsonify({'error': 'Document not found'}), 404
+    if not entry['path'] or not is_within(entry['path'], app.config['UPLOAD_FOLDER']):
+        return jsonify({'error': 'Only uploaded documents can be replaced'}), 400
+    
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file part'}), 400
+    if os.path.splitext(file.filename)[1].lower() != os.path.splitext(entry['path'])[1].lower():
+        return jsonify({'error': 'File type must match the document'}), 400
+    
+    # Parse from memory, the document is replaced by the job once re-indexed
+    file_path = entry['path']
+    content = take_upload(file)
+    session_store.update_file(source, size=upload_size(content), status='queued',
+                              upload_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    
+    def on_done(job):
+        if job.status == 'completed':
+            release_upload(content, file_path)
+            session_store.update_file(source, chunks=job.chunks, status='completed')
+        else:
+            release_upload(content)
+            session_store.update_file(source, status='failed')
+    
+    try:
+        job = ingestion_queue.submit(file_path, {"original_name": secure_filename(file.filename)},
+                                     filename=source, on_done=on_done, mode="update", source=source,
+                                     content=content)
+    except IngestionQueueFull as e:
+        release_upload(content)
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '5'}
+    
+    session_store.update_file(source, job_id=job.id)
+    
+    return jsonify({
+        'success': True,
+        'source': source,
+        'job_id': job.id,
+        'status': job.status
+    }), 202
+
+@app.route('/documents/sync', methods=['POST'])
+def sync_documents():
+    """Queue a job re-indexing what changed under SYNC_DIRECTORY and dropping the documents that are gone"""
+    if not app.config['SYNC_DIRECTORY']:
+        return jsonify({'error': 'SYNC_DIRECTORY is not configured'}), 404
+    if not os.path.isdir(app.config['SYNC_DIRECTORY']):
+        return jsonify({'error': 'SYNC_DIRECTORY is not a directory'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    delete_missing = data.get('delete_missing', True)
+    if not isinstance(delete_missing, bool):
+        return jsonify({'error': 'delete_missing must be a boolean'}), 400
+    
+    # The result of the sync is reported as the changes of the job
+    try:
+        job = ingestion_queue.submit(app.config['SYNC_DIRECTORY'], mode="sync", delete_missing=delete_missing)
+    except IngestionQueueFull as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '5'}
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status
+    }), 202
+
 @app.route('/sessions', methods=['GET'])
 def get_sessions():
-    # Create a simplified view of sessions
-    session_list = []
-    for session_id, session_data in sessions.items():
-        session_list.append({
-            'id': session_id,
-            'created_at': session_data['created_at'],
-            'message_count': len(session_data['history'])
-        })
-    
+    # Most recently active first, one page at a time
+    offset, limit = page_args()
     return jsonify({
         'success': True,
-        'sessions': session_list
+        'sessions': session_store.sessions(offset=offset, limit=limit),
+        'offset': offset,
+        'limit': limit,
+        'total': session_store.count()
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+"""Asyncio server for the chat endpoints
+
+    python async_app.py [--host 127.0.0.1] [--port 8000]
+
+Serves /chat, /history/<session_id> and /metrics with the RAG system,
+sessions and configuration of app.py, on an aiohttp event loop: a chat
+waiting for the LLM holds a coroutine instead of a thread, so one process
+keeps hundreds of them in flight. The session store is synchronous, its
+calls run in the default thread pool rather than on the loop. Uploads,
+streaming and the web page are served by the Flask app.
+"""
+import argparse
+import asyncio
+import uuid
+from datetime import datetime
+
+from aiohttp import web
+
+import app as flask_app
+
+
+async def chat(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    # Check for required fields
+    if not data or 'query' not in data:
+        return web.json_response({'error': 'Query is required'}, status=400)
+    try:
+        where = flask_app.chat_filter(data)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+
+    session_id = data.get('session_id', str(uuid.uuid4()))
+    session_store = flask_app.session_store
+    await asyncio.to_thread(session_store.ensure, session_id)
+    query = data['query']
+
+    try:
+        timings = {}
+        history = await asyncio.to_thread(flask_app.recent_turns, session_id)
+        response = await request.app['rag'].agenerate_response(query, timings=timings, history=history,
+                                                               where=where)
+
+        # Update session history
+        await asyncio.to_thread(session_store.append, session_id, [{
+            'query': query,
+            'response': response,
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }])
+
+        result = {
+            'success': True,
+            'session_id': session_id,
+            'response': response
+        }
+        if data.get('timings') or request.query.get('timings') == '1':
+            result['timings'] = timings
+        return web.json_response(result)
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+
+
+async def get_history(request):
+    session_id = request.match_info['session_id']
+    try:
+        offset = max(int(request.query.get('offset', 0)), 0)
+        limit = min(max(int(request.query.get('limit', flask_app.app.config['PAGE_SIZE'])), 0),
+                    flask_app.app.config['MAX_PAGE_SIZE'])
+    except ValueError:
+        return web.json_response({'error': 'offset and limit must be integers'}, status=400)
+
+    session_store = flask_app.session_store
+    history = await asyncio.to_thread(session_store.history, session_id, offset=offset, limit=limit)
+    if history is None:
+        return web.json_response({'error': 'Session not found'}, status=404)
+
+    return web.json_response({
+        'success': True,
+        'history': history,
+        'offset': offset,
+        'limit': limit,
+        'total': await asyncio.to_thread(session_store.message_count, session_id)
+    })
+
+
+async def get_metrics(request):
+    return web.Response(text=request.app['rag'].metrics.render(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def create_app(rag=None) -> web.Application:
+    """aiohttp application answering with rag, the one of app.py by default"""
+    application = web.Application()
+    application['rag'] = rag if rag is not None else flask_app.rag
+    application.add_routes([
+        web.post('/chat', chat),
+        web.get('/history/{session_id}', get_history),
+        web.get('/metrics', get_metrics)
+    ])
+    return application
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
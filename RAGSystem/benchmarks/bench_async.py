@@ -0,0 +1,184 @@
+"""Load test of the async serving path against a fake LLM with artificial latency
+
+Starts the fake OpenAI-compatible server of fake_llm_server.py, ingests a
+synthetic corpus (see bench_e2e.py), then sends concurrent /chat requests
+to the asyncio server of async_app.py and to the threaded Flask server of
+app.py. Both share one RAG system whose openai backend points at the fake
+server, and every request asks a different question so none is cached:
+
+    python benchmarks/bench_async.py [--concurrency 200] [--requests 1000] [--latency 0.5]
+
+Reports requests/sec, p50/p99 latency, CPU time per request (of the
+whole process, fake LLM and clients included), errors and the peak number
+of threads while each server is under load.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+import fake_llm_server
+from bench_e2e import build_rag, make_corpus, percentile
+from llm_backends import OpenAIBackend
+
+
+def start_aiohttp(application: web.Application):
+    """Serve application from a thread with its own event loop, return its URL and a stop function"""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(application)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0, backlog=4096)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return f"http://127.0.0.1:{port}", stop
+
+
+def start_flask(application):
+    """Serve application with the threaded development server, as app.run() does"""
+    from werkzeug.serving import ThreadedWSGIServer, make_server
+
+    # One log line per request would slow the server down
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    # The default listen backlog of 128 would refuse connections under load
+    ThreadedWSGIServer.request_queue_size = 4096
+    server = make_server("127.0.0.1", 0, application, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        thread.join()
+
+    return f"http://127.0.0.1:{server.server_port}", stop
+
+
+async def run_load(url: str, queries, concurrency: int, num_requests: int):
+    """Send num_requests /chat requests from concurrency clients"""
+    latencies, statuses = [], []
+    counter = itertools.count()
+    peak_threads = threading.active_count()
+    done = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=600)) as session:
+        async def client():
+            while True:
+                i = next(counter)
+                if i >= num_requests:
+                    return
+                start = time.perf_counter()
+                try:
+                    async with session.post(url + "/chat", json={"query": queries[i % len(queries)]}) as response:
+                        await response.read()
+                        statuses.append(response.status)
+                except aiohttp.ClientError:
+                    statuses.append(0)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        sampler = asyncio.create_task(sample_threads())
+        start, cpu_start = time.perf_counter(), time.process_time()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - cpu_start
+        done.set()
+        await sampler
+
+    return {
+        "rps": round(num_requests / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "cpu_ms_per_request": round(cpu_seconds / num_requests * 1000, 2),
+        "errors": sum(1 for status in statuses if status != 200),
+        "peak_threads": peak_threads
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=40, help="paragraphs per document")
+    parser.add_argument("--concurrency", type=int, default=200, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per fake LLM answer")
+    parser.add_argument("--jitter", type=float, default=0.1, help="up to this many extra seconds")
+    parser.add_argument("--servers", default="async,flask", help="servers to load, in order")
+    parser.add_argument("--backend", choices=["chroma", "quantized"], default="quantized", help="vector index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    import app as app_module
+    import async_app
+
+    rng = random.Random(args.seed)
+    llm_url, stop_llm = start_aiohttp(fake_llm_server.create_app(args.latency, args.jitter))
+    results = {"config": {k: v for k, v in vars(args).items() if k != "json"}}
+    with tempfile.TemporaryDirectory(prefix="bench_async_") as workdir:
+        corpus_dir = os.path.join(workdir, "corpus")
+        index_dir = os.path.join(workdir, "index")
+        os.makedirs(corpus_dir)
+        os.makedirs(index_dir)
+
+        paths, sentences = make_corpus(corpus_dir, args.docs, args.paragraphs, rng)
+        queries = rng.sample(sentences, min(args.requests, len(sentences)))
+
+        rag = build_rag(index_dir, "hash", 0.0, args.backend)
+        rag.llm = OpenAIBackend(api_key="fake-key", base_url=llm_url + "/v1")
+        rag.warmup()
+        for path in paths:
+            rag.add_document(path)
+        app_module.rag = rag
+
+        print(f"{args.requests} requests from {args.concurrency} clients, LLM latency {args.latency}s "
+              f"+ up to {args.jitter}s")
+        print(f"{'server':<8} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'CPU ms':>7} {'errors':>7} {'threads':>8}")
+        for server in args.servers.split(","):
+            rag.query_cache.clear()
+            if server == "async":
+                url, stop = start_aiohttp(async_app.create_app(rag))
+            else:
+                url, stop = start_flask(app_module.app)
+            try:
+                result = asyncio.run(run_load(url, queries, args.concurrency, args.requests))
+            finally:
+                stop()
+            results[server] = result
+            print(f"{server:<8} {result['rps']:>8.1f} {result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                  f"{result['cpu_ms_per_request']:>7.2f} {result['errors']:>7} {result['peak_threads']:>8}")
+    stop_llm()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
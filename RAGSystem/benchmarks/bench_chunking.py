@@ -0,0 +1,85 @@
+"""Compare paragraph chunking with the token-aware chunker
+
+Reports chunks per second, token statistics, chunks the embedding model
+would truncate and the resulting index size for each document, by default
+the PDFs bundled in uploads/:
+
+    python benchmarks/bench_chunking.py [files...] [--tokenizer whitespace]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import Chunker
+from rag_system import DocumentProcessor
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+MODEL_MAX_TOKENS = 256
+
+
+def load_token_counter(name: str):
+    if name == "whitespace":
+        # Offline approximation, one token per word
+        return lambda text: len(text.split())
+
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def measure(processor: DocumentProcessor, file_path: str, count_tokens) -> dict:
+    start = time.perf_counter()
+    chunks = [text for text, _ in processor.iter_chunks(file_path)]
+    elapsed = time.perf_counter() - start
+
+    tokens = [count_tokens(text) for text in chunks]
+    return {
+        'chunks': len(chunks),
+        'chunks_per_s': len(chunks) / elapsed if elapsed else float("inf"),
+        'mean_tokens': sum(tokens) / len(tokens) if tokens else 0,
+        'max_tokens': max(tokens, default=0),
+        'truncated': sum(1 for t in tokens if t > MODEL_MAX_TOKENS - 2),
+        # float32 vectors plus the stored chunk text
+        'index_bytes': len(chunks) * EMBEDDING_DIM * 4 + sum(len(text.encode("utf-8")) for text in chunks)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--tokenizer", default=EMBEDDING_MODEL,
+                        help="tokenizer name, or 'whitespace' to run offline")
+    parser.add_argument("--target-tokens", type=int, default=200)
+    parser.add_argument("--max-tokens", type=int, default=254)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = args.files or sorted(glob.glob(os.path.join(base_dir, "uploads", "*.pdf")))
+    count_tokens = load_token_counter(args.tokenizer)
+
+    processors = {
+        'paragraphs': DocumentProcessor(max_workers=0),
+        'token-aware': DocumentProcessor(max_workers=0, chunker=Chunker(
+            count_tokens, target_tokens=args.target_tokens,
+            max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens
+        ))
+    }
+
+    print(f"{'file':<30} {'chunker':<12} {'chunks':>7} {'chunks/s':>10} {'mean tok':>9} "
+          f"{'max tok':>8} {'truncated':>10} {'index KiB':>10}")
+    for file_path in files:
+        for name, processor in processors.items():
+            result = measure(processor, file_path, count_tokens)
+            print(f"{os.path.basename(file_path)[:30]:<30} {name:<12} {result['chunks']:>7} "
+                  f"{result['chunks_per_s']:>10.0f} {result['mean_tokens']:>9.1f} {result['max_tokens']:>8} "
+                  f"{result['truncated']:>10} {result['index_bytes'] / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
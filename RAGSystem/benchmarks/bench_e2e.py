@@ -0,0 +1,328 @@
+"""End-to-end ingestion and query benchmark on a synthetic corpus
+
+Generates a deterministic corpus of text (and optionally DOCX) documents,
+ingests it with RAGSystem.add_document, then answers queries taken from
+the corpus with generate_response and the stub LLM. Everything lives in a
+scratch directory and runs offline on CPU: by default a hashing encoder
+stands in for the embedding model, --embedder model uses the real one.
+
+    python benchmarks/bench_e2e.py [--docs 50] [--queries 200] [--embedder model]
+    python benchmarks/bench_e2e.py --batch-size 16 --llm-delay 0.05
+    python benchmarks/bench_e2e.py --load 8 --requests 400 [--url http://localhost:5000]
+    python benchmarks/bench_e2e.py --json run.json --compare baseline.json
+
+Reports docs/sec, chunks/sec, query p50/p95/p99, peak RSS and the size of
+the indexes on disk. --batch-size compares generate_responses with as
+many generate_response calls. --load also drives /chat from concurrent
+clients, in process through the Flask test client or against a running
+server (--url).
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_registry import DocumentRegistry
+from embedding_cache import EmbeddingCache
+from lexical_index import BM25Index
+from llm_backends import StubBackend
+from metrics import Metrics
+from query_cache import QueryCache
+from rag_system import RAGSystem, VectorStore
+
+SYLLABLES = ["ba", "ce", "di", "fo", "gu", "la", "me", "ni", "po", "ru", "sa", "te", "vi", "zo", "an", "er", "ou"]
+
+
+class HashingEmbedder:
+    """Offline stand-in for SentenceTransformer: bag of hashed words, L2-normalized"""
+
+    class Tokenizer:
+        @staticmethod
+        def encode(text, add_special_tokens=False):
+            return text.split()
+
+    tokenizer = Tokenizer()
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.zeros((1 if single else len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate([texts] if single else texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % self.dim] += 1
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+        return vectors[0] if single else vectors
+
+
+class DelayedStubBackend(StubBackend):
+    """Stub LLM that takes delay seconds per answer, to model generation latency"""
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__("Réponse de référence.")
+        self.delay = delay
+
+    def generate(self, messages):
+        if self.delay:
+            time.sleep(self.delay)
+        return super().generate(messages)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))] if values else 0.0
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def disk_size_mb(path: str) -> float:
+    total = 0
+    for root, _, names in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    return total / (1024 * 1024)
+
+
+def make_corpus(directory: str, num_docs: int, paragraphs: int, rng: random.Random, docx_ratio: float = 0.0):
+    """Write num_docs documents of random words, return their paths and their sentences"""
+    vocabulary = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(3000)]
+    paths, sentences = [], []
+    for i in range(num_docs):
+        blocks = []
+        for p in range(paragraphs):
+            if p % 5 == 0:
+                blocks.append(f"{p // 5 + 1}. " + " ".join(rng.choice(vocabulary) for _ in range(4)).title())
+            paragraph = []
+            for _ in range(rng.randint(2, 6)):
+                words = [rng.choice(vocabulary) for _ in range(rng.randint(8, 20))]
+                sentence = " ".join(words).capitalize() + "."
+                paragraph.append(sentence)
+                sentences.append(sentence)
+            blocks.append(" ".join(paragraph))
+
+        if rng.random() < docx_ratio:
+            import docx
+            path = os.path.join(directory, f"doc_{i:04d}.docx")
+            document = docx.Document()
+            for block in blocks:
+                document.add_paragraph(block)
+                document.add_paragraph("")
+            document.save(path)
+        else:
+            path = os.path.join(directory, f"doc_{i:04d}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(blocks))
+        paths.append(path)
+    return paths, sentences
+
+
+def build_rag(workdir: str, embedder: str, llm_delay: float, backend: str) -> RAGSystem:
+    metrics = Metrics()
+    store = VectorStore(collection_name="bench_e2e", persist_directory=os.path.join(workdir, backend),
+                        embedding_cache=EmbeddingCache(os.path.join(workdir, "embedding_cache.db")),
+                        lexical_index=BM25Index(os.path.join(workdir, "bm25_index.db")),
+                        metrics=metrics, backend=backend,
+                        embedder=HashingEmbedder() if embedder == "hash" else None)
+    return RAGSystem(llm=DelayedStubBackend(llm_delay), query_cache=QueryCache(), metrics=metrics,
+                     vector_store=store,
+                     document_registry=DocumentRegistry(os.path.join(workdir, "registry.db")))
+
+
+def bench_ingestion(rag: RAGSystem, paths):
+    start = time.perf_counter()
+    chunks = sum(rag.add_document(path) for path in paths)
+    seconds = time.perf_counter() - start
+    return {
+        "docs": len(paths),
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "docs_per_sec": round(len(paths) / seconds, 2),
+        "chunks_per_sec": round(chunks / seconds, 2)
+    }
+
+
+def bench_queries(rag: RAGSystem, queries, use_cache: bool):
+    latencies = []
+    for query in queries:
+        if not use_cache:
+            rag.query_cache.clear()
+        start = time.perf_counter()
+        rag.generate_response(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "queries": len(queries),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "qps": round(len(queries) / (sum(latencies) / 1000), 2)
+    }
+
+
+def bench_batch(rag: RAGSystem, queries, batch_size: int, concurrency: int):
+    """Answer the queries one by one, then in batches of batch_size, on a cold cache each time"""
+    rag.query_cache.clear()
+    start = time.perf_counter()
+    for query in queries:
+        rag.generate_response(query)
+    sequential = time.perf_counter() - start
+
+    rag.query_cache.clear()
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        rag.generate_responses(queries[i:i + batch_size], max_concurrency=concurrency)
+    batched = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "sequential_qps": round(len(queries) / sequential, 2),
+        "batch_qps": round(len(queries) / batched, 2),
+        "speedup": round(sequential / batched, 2)
+    }
+
+
+def bench_load(rag: RAGSystem, queries, concurrency: int, num_requests: int, url: str = None):
+    """Send num_requests /chat requests from concurrency clients"""
+    if url is None:
+        os.environ.setdefault("LLM_BACKEND", "stub")
+        import app as app_module
+        app_module.rag = rag
+        local = threading.local()
+
+        def post(query):
+            if not hasattr(local, "client"):
+                local.client = app_module.app.test_client()
+            return local.client.post("/chat", json={"query": query}).status_code
+    else:
+        def post(query):
+            request = urllib.request.Request(url.rstrip("/") + "/chat", data=json.dumps({"query": query}).encode(),
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+
+    def timed_post(query):
+        start = time.perf_counter()
+        status = post(query)
+        return status, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_post, (queries[i % len(queries)] for i in range(num_requests))))
+    seconds = time.perf_counter() - start
+
+    latencies = [latency for _, latency in results]
+    return {
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "errors": sum(1 for status, _ in results if status != 200),
+        "rps": round(num_requests / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2)
+    }
+
+
+def compare(results, baseline, prefix=""):
+    """Print every numeric result next to the baseline with the relative change"""
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(baseline.get(key), dict):
+            compare(value, baseline[key], prefix=name + ".")
+        elif isinstance(value, (int, float)) and isinstance(baseline.get(key), (int, float)) and baseline[key]:
+            change = (value - baseline[key]) / baseline[key] * 100
+            print(f"  {name:<32} {baseline[key]:>12} -> {value:<12} {change:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--paragraphs", type=int, default=40, help="paragraphs per document")
+    parser.add_argument("--docx-ratio", type=float, default=0.0, help="share of documents written as DOCX")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--cache", action="store_true", help="keep the query cache between queries")
+    parser.add_argument("--embedder", choices=["hash", "model"], default="hash",
+                        help="hash runs offline, model loads the real embedding model")
+    parser.add_argument("--backend", choices=["chroma", "quantized"], default="chroma", help="vector index")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds per stub LLM answer")
+    parser.add_argument("--batch-size", type=int, default=0, help="queries per generate_responses call, 0 to skip")
+    parser.add_argument("--batch-concurrency", type=int, default=8, help="LLM calls in flight per batch")
+    parser.add_argument("--load", type=int, default=0, help="concurrent /chat clients, 0 to skip")
+    parser.add_argument("--requests", type=int, default=200, help="requests sent in --load mode")
+    parser.add_argument("--url", help="running server for --load, default in process")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier --json run to compare with")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="bench_e2e_") as workdir:
+        corpus_dir = os.path.join(workdir, "corpus")
+        index_dir = os.path.join(workdir, "index")
+        os.makedirs(corpus_dir)
+        os.makedirs(index_dir)
+
+        paths, sentences = make_corpus(corpus_dir, args.docs, args.paragraphs, rng, args.docx_ratio)
+        queries = rng.sample(sentences, min(args.queries, len(sentences)))
+
+        rag = build_rag(index_dir, args.embedder, args.llm_delay, args.backend)
+        rag.warmup()
+
+        results = {"config": {k: v for k, v in vars(args).items() if k not in ("json", "compare")}}
+        results["ingestion"] = bench_ingestion(rag, paths)
+        results["query"] = bench_queries(rag, queries, args.cache)
+        if args.batch_size:
+            results["batch"] = bench_batch(rag, queries, args.batch_size, args.batch_concurrency)
+        if args.load:
+            results["load"] = bench_load(rag, queries, args.load, args.requests, args.url)
+        results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        results["index_size_mb"] = round(disk_size_mb(index_dir), 2)
+        results["corpus_size_mb"] = round(disk_size_mb(corpus_dir), 2)
+        results["stage_mean_ms"] = {stage: round(values["mean_ms"], 3)
+                                    for stage, values in rag.metrics.snapshot()["stages"].items()}
+
+    ingestion, query = results["ingestion"], results["query"]
+    print(f"ingestion: {ingestion['docs']} docs, {ingestion['chunks']} chunks in {ingestion['seconds']}s "
+          f"({ingestion['docs_per_sec']} docs/s, {ingestion['chunks_per_sec']} chunks/s)")
+    print(f"query:     p50 {query['p50_ms']} ms, p95 {query['p95_ms']} ms, p99 {query['p99_ms']} ms")
+    if "batch" in results:
+        batch = results["batch"]
+        print(f"batch:     {batch['batch_qps']} q/s in batches of {batch['batch_size']} against "
+              f"{batch['sequential_qps']} q/s one by one ({batch['speedup']}x)")
+    if "load" in results:
+        load = results["load"]
+        print(f"load:      {load['rps']} req/s with {load['concurrency']} clients, p50 {load['p50_ms']} ms, "
+              f"p99 {load['p99_ms']} ms, {load['errors']} errors")
+    print(f"memory:    peak RSS {results['peak_rss_mb']} MB, index {results['index_size_mb']} MB on disk "
+          f"for {results['corpus_size_mb']} MB of text")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare}:")
+        compare({k: v for k, v in results.items() if k != "config"}, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Encode throughput, query latency and retrieval parity of the embedding backends
+
+Chunks the given documents (by default the PDFs in uploads/, or a
+synthetic corpus of --synthetic documents), then for every backend embeds all
+chunks in batches and one sentence per chunk as a single query. Retrieval
+parity compares the top k chunks of every query with those found using
+the embeddings of the PyTorch model:
+
+    python benchmarks/bench_embeddings.py [files... | --synthetic 20] [--backends torch,onnx,onnx-int8] [--threads 4]
+
+ONNX exports are made under --export-dir on first use, not timed.
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_e2e import make_corpus
+from bench_retrieval import make_queries, percentile
+from chunking import Chunker
+from embedding_backends import create_embedder
+from embedding_cache import content_hash
+from rag_system import DocumentProcessor
+
+
+def load_chunks(files, count_tokens, synthetic: int, seed: int):
+    processor = DocumentProcessor(chunker=Chunker(count_tokens))
+    try:
+        if not synthetic:
+            return [text for file_path in files for text, _ in processor.iter_chunks(file_path)]
+        with tempfile.TemporaryDirectory(prefix="bench_embeddings_") as directory:
+            paths, _ = make_corpus(directory, synthetic, 40, random.Random(seed))
+            return [text for file_path in paths for text, _ in processor.iter_chunks(file_path)]
+    finally:
+        processor.close()
+
+
+def top_k(chunk_embeddings: np.ndarray, query_embeddings: np.ndarray, k: int) -> np.ndarray:
+    distances = (chunk_embeddings ** 2).sum(1)[None, :] - 2 * query_embeddings @ chunk_embeddings.T
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--synthetic", type=int, help="embed this many synthetic documents instead of files")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--export-dir", default="./embedding_models")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, help="CPU threads of torch and ONNX Runtime, all cores by default")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = args.files or sorted(glob.glob(os.path.join(base_dir, "uploads", "*.pdf")))
+    backends = args.backends.split(",")
+    reference_backend = "torch" if "torch" in backends else backends[0]
+    backends = [reference_backend] + [name for name in backends if name != reference_backend]
+
+    def make(name):
+        return create_embedder(name, args.model, export_dir=args.export_dir, num_threads=args.threads)
+
+    reference = make(reference_backend)
+    chunks = load_chunks(files, lambda text: len(reference.tokenizer.encode(text, add_special_tokens=False)),
+                         args.synthetic or (0 if files else 20), args.seed)
+    queries = make_queries(chunks, random.Random(args.seed))
+    chunk_ids = [content_hash(chunk) for chunk in chunks]
+
+    print(f"{len(chunks)} chunks, {len(queries)} queries, batch size {args.batch_size}, k={args.k}, "
+          f"reference {reference_backend}")
+    print(f"{'backend':<10} {'load s':>7} {'chunks/s':>9} {'query p50':>10} {'query p99':>10} "
+          f"{'min cos':>8} {'overlap@k':>10} {'recall@k':>9}")
+    expected = None
+    for name in backends:
+        make(name)  # export outside the timings
+        start = time.perf_counter()
+        embedder = make(name)
+        load_seconds = time.perf_counter() - start
+
+        embedder.encode(chunks[:args.batch_size], batch_size=args.batch_size)
+        start = time.perf_counter()
+        chunk_embeddings = np.asarray(embedder.encode(chunks, batch_size=args.batch_size), dtype=np.float32)
+        throughput = len(chunks) / (time.perf_counter() - start)
+
+        latencies, query_embeddings = [], []
+        for query, _ in queries:
+            start = time.perf_counter()
+            query_embeddings.append(np.asarray(embedder.encode(query), dtype=np.float32))
+            latencies.append((time.perf_counter() - start) * 1000)
+        found = top_k(chunk_embeddings, np.stack(query_embeddings), args.k)
+
+        if expected is None:
+            expected = chunk_embeddings, found
+        cosines = (chunk_embeddings * expected[0]).sum(1) / (
+            np.linalg.norm(chunk_embeddings, axis=1) * np.linalg.norm(expected[0], axis=1))
+        overlap = np.mean([len(set(row) & set(reference_row)) / args.k
+                           for row, reference_row in zip(found, expected[1])])
+        recall = np.mean([answer in {chunk_ids[i] for i in row} for row, (_, answer) in zip(found, queries)])
+        print(f"{name:<10} {load_seconds:>7.2f} {throughput:>9.1f} {percentile(latencies, 50):>10.2f} "
+              f"{percentile(latencies, 99):>10.2f} {cosines.min():>8.4f} {overlap:>10.3f} {recall:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Recall@k and latency of dense, lexical and hybrid retrieval
+
+Indexes the given documents (by default the PDFs in uploads/) into a
+scratch collection, then uses one sentence of every chunk as a known-item
+query whose answer is that chunk:
+
+    python benchmarks/bench_retrieval.py [files...] [--k 5]
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import Chunker
+from embedding_cache import EmbeddingCache, content_hash
+from lexical_index import BM25Index
+from rag_system import DocumentProcessor, VectorStore
+
+COLLECTION = "bench_retrieval"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def make_queries(chunks, rng, min_words=5):
+    """One sentence per chunk, paired with the id of the chunk it came from"""
+    queries = []
+    for chunk in chunks:
+        sentences = [s for s in re.split(r"(?<=[.!?])\s+", chunk) if len(s.split()) >= min_words]
+        if sentences:
+            queries.append((rng.choice(sentences), content_hash(chunk)))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = args.files or sorted(glob.glob(os.path.join(base_dir, "uploads", "*.pdf")))
+
+    store = VectorStore(collection_name=COLLECTION, embedding_cache=EmbeddingCache(":memory:"),
+                        lexical_index=BM25Index(None))
+    processor = DocumentProcessor(chunker=Chunker(store.count_tokens))
+    try:
+        chunks = []
+        for file_path in files:
+            file_chunks = [text for text, _ in processor.iter_chunks(file_path)]
+            store.add_documents(file_chunks, [{"source": os.path.basename(file_path)} for _ in file_chunks])
+            chunks.extend(file_chunks)
+
+        queries = make_queries(chunks, random.Random(args.seed))
+        print(f"{len(chunks)} chunks, {len(queries)} queries, k={args.k}")
+        print(f"{'mode':<8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+
+        for mode in ("dense", "lexical", "hybrid"):
+            hits, latencies = 0, []
+            for query, expected in queries:
+                start = time.perf_counter()
+                results = store.search(query, top_k=args.k, mode=mode)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += any(content_hash(r["content"]) == expected for r in results)
+
+            print(f"{mode:<8} {hits / len(queries):>9.3f} {percentile(latencies, 50):>8.2f} "
+                  f"{percentile(latencies, 99):>8.2f}")
+    finally:
+        store.index.drop()
+        processor.close()
+
+
+if __name__ == "__main__":
+    main()
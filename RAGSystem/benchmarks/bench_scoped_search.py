@@ -0,0 +1,107 @@
+"""Latency of source-scoped queries on the quantized index as the corpus grows
+
+Builds QuantizedIndex over a growing number of synthetic documents, one of
+which (the tenant) always has the same number of chunks, then queries it
+unscoped, scoped to the tenant's source, and with a metadata filter on a
+key that is not the partition key:
+
+    python benchmarks/bench_scoped_search.py [--sizes 20000,100000,400000] [--tenant-chunks 2000]
+
+Scoped queries only scan the tenant's partition, so their latency should
+stay flat while the unscoped one grows with the corpus. Recall of the
+scoped top k is measured against exact search within the tenant.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_vector_index import BLOCK, make_block, make_centers, percentile
+from vector_index import QuantizedIndex
+
+TENANT = "tenant.pdf"
+
+
+def build(path: str, n: int, tenant_chunks: int, chunks_per_document: int, centers, seed: int):
+    """Index n vectors, the first tenant_chunks of them from TENANT, and return those"""
+    index = QuantizedIndex(path)
+    tenant = []
+    for start in range(0, n, BLOCK):
+        vectors = make_block(start, min(BLOCK, n - start), centers, seed)
+        rows = range(start, start + len(vectors))
+        index.upsert(ids=[f"v{i}" for i in rows], embeddings=vectors, documents=[""] * len(vectors),
+                     metadatas=[{"source": TENANT if i < tenant_chunks else f"{i // chunks_per_document}.pdf",
+                                 "page": i % 50} for i in rows])
+        tenant.append(vectors[:max(0, tenant_chunks - start)])
+    return index, np.concatenate(tenant)
+
+
+def timed(index, queries, k, where=None):
+    options = {} if where is None else {"where": where}
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.query(query_embeddings=[query], n_results=k, **options)["ids"][0])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="20000,100000,400000")
+    parser.add_argument("--tenant-chunks", type=int, default=2000)
+    parser.add_argument("--chunks-per-document", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    centers = make_centers(args.dim, args.clusters, args.seed)
+    queries = make_block(0, args.queries, centers, args.seed + 1)
+    scoped = {"source": TENANT}
+    filtered = {"$and": [{"source": TENANT}, {"page": {"$lt": 25}}]}
+
+    print(f"tenant of {args.tenant_chunks} chunks, {args.queries} queries, k={args.k}")
+    print(f"{'vectors':>9} {'all p50':>8} {'all p99':>8} {'scoped p50':>11} {'scoped p99':>11} "
+          f"{'filter p50':>11} {'filter p99':>11} {'recall':>7}")
+    report = []
+    for n in (int(size) for size in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory(prefix="bench_scoped_search_") as path:
+            index, tenant = build(path, n, args.tenant_chunks, args.chunks_per_document, centers, args.seed)
+            timed(index, queries[:5], args.k, scoped)  # warm the partition cache
+            unscoped_ms, _ = timed(index, queries, args.k)
+            scoped_ms, results = timed(index, queries, args.k, scoped)
+            filtered_ms, _ = timed(index, queries, args.k, filtered)
+            index.close()
+
+        exact = np.argsort(((tenant[None, :, :] - queries[:, None, :]) ** 2).sum(2), axis=1)[:, :args.k]
+        hits = sum(len({f"v{i}" for i in row} & set(ids)) for row, ids in zip(exact, results))
+        result = {
+            "n": n,
+            "all_p50_ms": round(percentile(unscoped_ms, 50), 2), "all_p99_ms": round(percentile(unscoped_ms, 99), 2),
+            "scoped_p50_ms": round(percentile(scoped_ms, 50), 2), "scoped_p99_ms": round(percentile(scoped_ms, 99), 2),
+            "filter_p50_ms": round(percentile(filtered_ms, 50), 2), "filter_p99_ms": round(percentile(filtered_ms, 99), 2),
+            "scoped_recall": round(hits / (len(queries) * args.k), 4)
+        }
+        report.append(result)
+        print(f"{n:>9} {result['all_p50_ms']:>8.2f} {result['all_p99_ms']:>8.2f} {result['scoped_p50_ms']:>11.2f} "
+              f"{result['scoped_p99_ms']:>11.2f} {result['filter_p50_ms']:>11.2f} {result['filter_p99_ms']:>11.2f} "
+              f"{result['scoped_recall']:>7.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
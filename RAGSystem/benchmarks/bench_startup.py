@@ -0,0 +1,41 @@
+"""Cold start time of the app, and time to the first embedded query
+
+Imports app.py in a fresh interpreter (with the stub LLM backend so no API
+key is needed), then warms it up, reporting both times:
+
+    python benchmarks/bench_startup.py [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.rag.warmup(models_only=True)
+warm = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "warmup_s": warm - imported}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    env = dict(os.environ, LLM_BACKEND=os.environ.get("LLM_BACKEND", "stub"))
+    for run in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        times = json.loads(output.strip().splitlines()[-1])
+        print(f"run {run + 1}: import {times['import_s']:.2f}s, warmup {times['warmup_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Recall, latency, memory and disk use of the vector index backends
+
+Inserts n synthetic clustered embeddings (1M by default) into each backend,
+then runs queries against them and compares the top k with exact search.
+Every backend is built in one process and queried from a fresh one, so the
+RSS reported is that of a process serving an existing index:
+
+    python benchmarks/bench_vector_index.py [--n 1000000] [--backends quantized,chroma] [--json out.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import ChromaIndex, QuantizedIndex
+
+BLOCK = 10000
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def current_rss_mb():
+    """Resident memory, and the part of it that is not file pages the OS can drop"""
+    with open("/proc/self/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    return int(status["VmRSS"].split()[0]) / 1024, int(status["RssAnon"].split()[0]) / 1024
+
+
+def disk_size_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / (1024 * 1024)
+
+
+def make_centers(dim: int, clusters: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(clusters, dim)).astype(np.float32)
+
+
+def make_block(start: int, size: int, centers: np.ndarray, seed: int) -> np.ndarray:
+    """Normalized vectors around random centers, the same for the same start"""
+    rng = np.random.default_rng((seed, start))
+    vectors = centers[rng.integers(0, len(centers), size)] + rng.normal(scale=0.6, size=(size, centers.shape[1]))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(args, centers):
+    rng = np.random.default_rng((args.seed, args.n))
+    queries = make_block(0, args.queries, centers, args.seed + 1)
+    return queries + rng.normal(scale=0.05, size=queries.shape).astype(np.float32)
+
+
+def exact_top_k(args, centers, queries):
+    """Brute force top k ids of every query over the regenerated blocks"""
+    best = np.full((len(queries), 0), 0, dtype=np.int64)
+    best_distances = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(0, args.n, BLOCK):
+        block = make_block(start, min(BLOCK, args.n - start), centers, args.seed)
+        distances = (block ** 2).sum(1)[None, :] - 2 * queries @ block.T
+        ids = np.broadcast_to(np.arange(start, start + len(block)), distances.shape)
+        distances = np.concatenate([best_distances, distances], axis=1)
+        ids = np.concatenate([best, ids], axis=1)
+        keep = np.argsort(distances, axis=1)[:, :args.k]
+        best = np.take_along_axis(ids, keep, axis=1)
+        best_distances = np.take_along_axis(distances, keep, axis=1)
+    return [{f"v{i}" for i in row} for row in best]
+
+
+def open_index(backend: str, path: str):
+    if backend == "quantized":
+        return QuantizedIndex(path)
+    return ChromaIndex("bench_vector_index", persist_directory=path)
+
+
+def run_phase(args):
+    """Child process: build one backend into args.path, or open it and query it, print JSON"""
+    centers = make_centers(args.dim, args.clusters, args.seed)
+    if args.phase == "build":
+        index = open_index(args.backend, args.path)
+        start = time.perf_counter()
+        for block_start in range(0, args.n, BLOCK):
+            vectors = make_block(block_start, min(BLOCK, args.n - block_start), centers, args.seed)
+            ids = [f"v{i}" for i in range(block_start, block_start + len(vectors))]
+            index.upsert(ids=ids, embeddings=vectors.tolist() if args.backend == "chroma" else vectors,
+                         documents=[""] * len(ids), metadatas=[{"n": 0}] * len(ids))
+        build_seconds = time.perf_counter() - start
+        index.close()
+        print(json.dumps({
+            "build_s": round(build_seconds, 1),
+            "build_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "disk_mb": round(disk_size_mb(args.path), 1)
+        }))
+        return
+
+    # A fresh process, as a server would open the index
+    start = time.perf_counter()
+    index = open_index(args.backend, args.path)
+    index.count()
+    open_seconds = time.perf_counter() - start
+
+    queries = make_queries(args, centers)
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = index.query(query_embeddings=[query.tolist()], n_results=args.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(result["ids"][0])
+
+    rss, anonymous = current_rss_mb()
+    print(json.dumps({
+        "open_s": round(open_seconds, 3),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "serve_rss_mb": round(rss, 1),
+        "serve_anon_mb": round(anonymous, 1),
+        "results": results
+    }))
+
+
+def run_child(backend: str, phase: str, path: str) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--backend", backend, "--phase", phase,
+               "--path", path] + sys.argv[1:]
+    output = subprocess.run(command, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1])
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=1000000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backends", default="quantized,chroma")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--phase", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        run_phase(args)
+        return
+
+    centers = make_centers(args.dim, args.clusters, args.seed)
+    truth = exact_top_k(args, centers, make_queries(args, centers))
+
+    print(f"{args.n} vectors of dimension {args.dim}, {args.queries} queries, k={args.k}")
+    print(f"{'backend':<10} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'open s':>7} "
+          f"{'RSS MB':>7} {'anon MB':>8} {'build MB':>9} {'disk MB':>8}")
+    report = []
+    for backend in args.backends.split(","):
+        with tempfile.TemporaryDirectory(prefix="bench_vector_index_") as path:
+            try:
+                result = {"backend": backend, **run_child(backend, "build", path), **run_child(backend, "serve", path)}
+            except RuntimeError as e:
+                print(f"{backend:<10} failed: {e}")
+                continue
+        hits = sum(len(truth_ids & set(ids)) for truth_ids, ids in zip(truth, result.pop("results")))
+        result["recall"] = round(hits / (len(truth) * args.k), 4)
+        report.append(result)
+        print(f"{backend:<10} {result['recall']:>7.3f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+              f"{result['build_s']:>8.1f} {result['open_s']:>7.3f} {result['serve_rss_mb']:>7.1f} {result['serve_anon_mb']:>8.1f} "
+              f"{result['build_peak_rss_mb']:>9.1f} {result['disk_mb']:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""OpenAI-compatible chat completions server that answers after an artificial delay
+
+    python benchmarks/fake_llm_server.py [--port 8001] [--latency 0.5] [--jitter 0.1]
+
+Point the openai backend at it with LLM_BASE_URL=http://127.0.0.1:8001/v1
+to load test the serving path without network access or API costs. Every
+answer takes latency seconds, plus up to jitter, and streamed answers are
+spread over that time.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+ANSWER = "Réponse de référence générée par le faux serveur."
+
+
+def completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    }
+
+
+def chunk(model: str, content: str = None) -> str:
+    delta = {"content": content} if content is not None else {}
+    return "data: " + json.dumps({
+        "id": "chatcmpl-stream",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": None if content is not None else "stop"}]
+    }) + "\n\n"
+
+
+async def chat_completions(request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    delay = request.app["latency"] + random.uniform(0, request.app["jitter"])
+    request.app["requests"] += 1
+
+    if not body.get("stream"):
+        await asyncio.sleep(delay)
+        return web.json_response(completion(model, ANSWER))
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    words = ANSWER.split(" ")
+    for i, word in enumerate(words):
+        await asyncio.sleep(delay / len(words))
+        await response.write(chunk(model, word if i == 0 else " " + word).encode())
+    await response.write(chunk(model).encode())
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+
+def create_app(latency: float = 0.5, jitter: float = 0.0) -> web.Application:
+    application = web.Application()
+    application["latency"] = latency
+    application["jitter"] = jitter
+    application["requests"] = 0
+    application.add_routes([web.post("/v1/chat/completions", chat_completions)])
+    return application
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds")
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency, args.jitter), host=args.host, port=args.port)
@@ -0,0 +1,153 @@
+import re
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Tuple
+
+# A block is (page, char_offset, text): a page of a PDF or a paragraph of a
+# DOCX/TXT file, with the offset of its first character in that page
+Block = Tuple[int, int, str]
+
+PARAGRAPH_RE = re.compile(r"\S(?:.*?\S)?(?=\s*\n\s*\n|\s*$)", re.S)
+SENTENCE_RE = re.compile(r"\S.*?(?:[.!?…]+(?=\s)|$)", re.S)
+NUMBERED_HEADING_RE = re.compile(r"^(\d+(\.\d+)*\.?|[IVXLC]+\.)\s+\S")
+
+
+def is_heading(paragraph: str, max_words: int = 12) -> bool:
+    """Guess whether a paragraph is a title: one short line without final punctuation"""
+    if "\n" in paragraph.strip():
+        return False
+    if paragraph.startswith("#"):
+        return True
+    if len(paragraph.split()) > max_words:
+        return False
+    return bool(NUMBERED_HEADING_RE.match(paragraph)) or paragraph[-1] not in ".!?:;,…"
+
+
+class Unit:
+    """A sentence or heading with its position in the document"""
+
+    __slots__ = ("text", "page", "char_start", "char_end", "tokens", "heading", "new_paragraph")
+
+    def __init__(self, text: str, page: int, char_start: int, tokens: int,
+                 heading: bool = False, new_paragraph: bool = False):
+        self.text = text
+        self.page = page
+        self.char_start = char_start
+        self.char_end = char_start + len(text)
+        self.tokens = tokens
+        self.heading = heading
+        self.new_paragraph = new_paragraph
+
+
+class Chunker:
+    """Groups sentences into chunks sized in tokens of the embedding model
+
+    Chunks grow sentence by sentence until they reach target_tokens, never
+    exceed max_tokens (longer sentences are split on words) and repeat up to
+    overlap_tokens worth of trailing sentences at the start of the next chunk.
+    Headings always start a new chunk. count_tokens is typically the length
+    of the embedding tokenizer's encoding of the text.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], target_tokens: int = 200,
+                 max_tokens: int = 254, overlap_tokens: int = 32):
+        if not 0 < target_tokens <= max_tokens:
+            raise ValueError("target_tokens must be positive and at most max_tokens")
+        if not 0 <= overlap_tokens < target_tokens:
+            raise ValueError("overlap_tokens must be smaller than target_tokens")
+
+        self.count_tokens = count_tokens
+        self.target_tokens = target_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def chunk(self, blocks: Iterable[Block]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (text, metadata) chunks, metadata holding page and char offsets"""
+        # current starts with the overlap of the previous chunk, fresh counts
+        # the units added since, a chunk of overlap only is never emitted
+        current, fresh = [], 0
+        for unit in self._units(blocks):
+            if unit.heading or unit.tokens > self.max_tokens or \
+                    self._size(current) + unit.tokens > self.max_tokens:
+                if fresh:
+                    yield self._emit(current)
+                # No overlap across headings, drop it rather than exceed max_tokens
+                current = [] if unit.heading or not fresh else self._overlap(current)
+                if self._size(current) + unit.tokens > self.max_tokens:
+                    current = []
+                fresh = 0
+
+            if unit.tokens > self.max_tokens:
+                for part in self._split_long(unit):
+                    yield self._emit([part])
+                continue
+
+            current.append(unit)
+            fresh += 1
+            if self._size(current) >= self.target_tokens:
+                yield self._emit(current)
+                current, fresh = self._overlap(current), 0
+
+        if fresh:
+            yield self._emit(current)
+
+    def _units(self, blocks: Iterable[Block]) -> Iterator[Unit]:
+        for page, offset, text in blocks:
+            for paragraph in PARAGRAPH_RE.finditer(text):
+                para_text = paragraph.group()
+                start = offset + paragraph.start()
+                if is_heading(para_text):
+                    yield Unit(para_text, page, start, self.count_tokens(para_text),
+                               heading=True, new_paragraph=True)
+                    continue
+                for i, sentence in enumerate(SENTENCE_RE.finditer(para_text)):
+                    sentence_text = sentence.group()
+                    yield Unit(sentence_text, page, start + sentence.start(),
+                               self.count_tokens(sentence_text), new_paragraph=i == 0)
+
+    def _split_long(self, unit: Unit) -> Iterator[Unit]:
+        """Split a unit longer than max_tokens on word boundaries"""
+        words = [(m.start(), m.group()) for m in re.finditer(r"\S+", unit.text)]
+        part_start, part_end, tokens = None, 0, 0
+        for start, word in words:
+            word_tokens = self.count_tokens(word)
+            if part_start is not None and tokens + word_tokens > self.max_tokens:
+                yield self._part(unit, part_start, part_end, tokens)
+                part_start, tokens = None, 0
+            if part_start is None:
+                part_start = start
+            part_end = start + len(word)
+            tokens += word_tokens
+        if part_start is not None:
+            yield self._part(unit, part_start, part_end, tokens)
+
+    @staticmethod
+    def _part(unit: Unit, start: int, end: int, tokens: int) -> Unit:
+        return Unit(unit.text[start:end], unit.page, unit.char_start + start, tokens,
+                    new_paragraph=unit.new_paragraph and start == 0)
+
+    def _overlap(self, units: List[Unit]) -> List[Unit]:
+        """Trailing units that fit in overlap_tokens, never crossing a heading"""
+        overlap, tokens = [], 0
+        for unit in reversed(units):
+            if unit.heading or tokens + unit.tokens > self.overlap_tokens:
+                break
+            overlap.insert(0, unit)
+            tokens += unit.tokens
+        return overlap
+
+    @staticmethod
+    def _size(units: List[Unit]) -> int:
+        return sum(unit.tokens for unit in units)
+
+    @staticmethod
+    def _emit(units: List[Unit]) -> Tuple[str, Dict[str, Any]]:
+        parts = [units[0].text]
+        for unit in units[1:]:
+            parts.append(("\n\n" if unit.new_paragraph else " ") + unit.text)
+
+        return "".join(parts), {
+            "page": units[0].page,
+            "page_end": units[-1].page,
+            "char_start": units[0].char_start,
+            "char_end": units[-1].char_end,
+            "tokens": sum(unit.tokens for unit in units)
+        }
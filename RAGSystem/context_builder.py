@@ -0,0 +1,68 @@
+import re
+import zlib
+from typing import List, Dict, Any, Callable, Tuple
+
+import numpy as np
+
+# Mersenne prime modulus of the MinHash permutations, a * x stays below 2^62
+MINHASH_PRIME = (1 << 31) - 1
+
+
+class ContextBuilder:
+    """Packs retrieved chunks into the prompt context
+
+    Chunks are taken best first, by "score" when the reranker set one and
+    in retrieval order otherwise. A chunk whose MinHash estimate of word
+    shingle Jaccard similarity with a chunk already kept reaches
+    similarity_threshold is a near duplicate and dropped, as are chunks that
+    would take the context over token_budget tokens. The first chunk is
+    always kept.
+    """
+
+    def __init__(self, token_budget: int = None, similarity_threshold: float = 0.8,
+                 count_tokens: Callable[[str], int] = None, num_perm: int = 64, shingle_size: int = 3,
+                 seed: int = 1):
+        self.token_budget = token_budget
+        self.similarity_threshold = similarity_threshold
+        self.count_tokens = count_tokens
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MINHASH_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MINHASH_PRIME, num_perm, dtype=np.uint64)
+
+    def build(self, docs: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Return the chunks to put in the prompt, and the chunk and token counts of the packing"""
+        if any("score" in doc for doc in docs):
+            docs = sorted(docs, key=lambda doc: doc.get("score", float("-inf")), reverse=True)
+
+        kept, signatures = [], []
+        stats = {"context_candidates": len(docs), "context_duplicates": 0, "context_trimmed": 0,
+                 "context_tokens": 0}
+        for doc in docs:
+            signature = self.signature(doc["content"])
+            if any(np.mean(signature == other) >= self.similarity_threshold for other in signatures):
+                stats["context_duplicates"] += 1
+                continue
+
+            doc_tokens = self.count_tokens(doc["content"]) if self.count_tokens else len(doc["content"].split())
+            if self.token_budget is not None and kept and stats["context_tokens"] + doc_tokens > self.token_budget:
+                # A shorter chunk further down may still fit
+                stats["context_trimmed"] += 1
+                continue
+
+            kept.append(doc)
+            signatures.append(signature)
+            stats["context_tokens"] += doc_tokens
+
+        stats["context_chunks"] = len(kept)
+        return kept, stats
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of the word shingles of text"""
+        words = re.findall(r"\w+", text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        hashes %= np.uint64(MINHASH_PRIME)
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % np.uint64(MINHASH_PRIME)).min(axis=1)
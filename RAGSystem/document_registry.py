@@ -0,0 +1,142 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+from embedding_cache import content_hash
+from process_local import SQLiteConnection
+
+
+def chunk_id(source: str, text: str) -> str:
+    """Id of a chunk in the indexes, the same chunk text in two documents gets two ids"""
+    return content_hash(f"{source}\0{text}")
+
+
+def metadata_hash(metadata: Dict[str, Any]) -> str:
+    """Fingerprint of chunk metadata, to notice chunks that moved without changing"""
+    return hashlib.sha256(json.dumps(metadata, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def file_hash(path: Union[str, bytes, BinaryIO], block_size: int = 1 << 20) -> str:
+    """SHA-256 of the file content, read block by block
+
+    path may also be the content itself, bytes or a binary file that is
+    read from its start and left there.
+    """
+    if isinstance(path, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(path).hexdigest()
+    digest = hashlib.sha256()
+    f = open(path, "rb") if isinstance(path, str) else path
+    try:
+        f.seek(0)
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    finally:
+        if f is path:
+            f.seek(0)
+        else:
+            f.close()
+    return digest.hexdigest()
+
+
+class DocumentRegistry(SQLiteConnection):
+    """Which chunks every indexed document produced, so it can be updated or deleted later
+
+    Documents are keyed by source, the name stored in their chunk metadata,
+    and remember the path and content hash of the file they were built
+    from along with the id and metadata fingerprint of each chunk. Entries
+    live in a SQLite file next to the other indexes.
+    """
+
+    def __init__(self, path: str = "./document_registry.db"):
+        self.path = path
+
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "source TEXT PRIMARY KEY, path TEXT, file_hash TEXT, chunks INTEGER NOT NULL, "
+            "updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS documents_path ON documents (path);"
+            "CREATE INDEX IF NOT EXISTS documents_file_hash ON documents (file_hash);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "source TEXT NOT NULL, chunk_id TEXT NOT NULL, metadata_hash TEXT NOT NULL, "
+            "PRIMARY KEY (source, chunk_id)) WITHOUT ROWID;"
+        )
+        connection.commit()
+        return connection
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        """The entry of the document, or None if it is not registered"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source, path, file_hash, chunks, updated_at FROM documents WHERE source = ?", (source,)
+            ).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def find(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """A document indexed from a file with this content hash, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source, path, file_hash, chunks, updated_at FROM documents WHERE file_hash = ? LIMIT 1",
+                (file_hash,)
+            ).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def chunks(self, source: str) -> Dict[str, str]:
+        """chunk id -> metadata fingerprint of every chunk of the document"""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT chunk_id, metadata_hash FROM chunks WHERE source = ?", (source,)
+            ).fetchall())
+
+    def put(self, source: str, path: str, file_hash: Optional[str], chunks: Dict[str, str]):
+        """Register the document with its chunks, replacing what was registered under source"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (source, path, file_hash, chunks, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (source, path, file_hash, len(chunks), time.time())
+            )
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.executemany(
+                "INSERT INTO chunks (source, chunk_id, metadata_hash) VALUES (?, ?, ?)",
+                [(source, chunk, fingerprint) for chunk, fingerprint in chunks.items()]
+            )
+            self._conn.commit()
+
+    def remove(self, source: str) -> Optional[List[str]]:
+        """Unregister the document and return its chunk ids, None if it was not registered"""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM documents WHERE source = ?", (source,)).fetchone() is None:
+                return None
+            ids = [row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks WHERE source = ?", (source,))]
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.execute("DELETE FROM documents WHERE source = ?", (source,))
+            self._conn.commit()
+        return ids
+
+    def documents(self, offset: int = 0, limit: int = None, path_prefix: str = None) -> List[Dict[str, Any]]:
+        """Registered documents by source, only those whose file is under path_prefix if given"""
+        query = "SELECT source, path, file_hash, chunks, updated_at FROM documents"
+        params = []
+        if path_prefix is not None:
+            # Compare prefixes rather than LIKE, paths may contain % and _
+            query += " WHERE substr(path, 1, ?) = ?"
+            params += [len(path_prefix), path_prefix]
+        query += " ORDER BY source LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    @staticmethod
+    def _entry(row) -> Dict[str, Any]:
+        return {'source': row[0], 'path': row[1], 'file_hash': row[2], 'chunks': row[3], 'updated_at': row[4]}
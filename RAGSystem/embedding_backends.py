@@ -0,0 +1,176 @@
+import json
+import os
+import re
+import threading
+from typing import List, Union
+
+import numpy as np
+
+from lazy import LazyImport
+
+SentenceTransformer = LazyImport("sentence_transformers", "SentenceTransformer")
+AutoTokenizer = LazyImport("transformers", "AutoTokenizer")
+onnxruntime = LazyImport("onnxruntime")
+
+# Description of an export, next to the model files
+CONFIG_FILE = "embedding_config.json"
+
+# Backends whose embeddings differ slightly from the full precision model's
+QUANTIZED_BACKENDS = ("onnx-int8",)
+
+_export_lock = threading.Lock()
+
+
+class ONNXEmbedder:
+    """Sentence embeddings computed by ONNX Runtime from an export of a sentence-transformers model
+
+    Offers the parts of the SentenceTransformer API that VectorStore and
+    EmbeddingService use: encode(), tokenizer and
+    get_sentence_embedding_dimension(). The export only holds the
+    transformer, the pooling and normalization of the original model are
+    applied here, so serving from an existing export never imports torch.
+    """
+
+    def __init__(self, path: str, quantized: bool = False, num_threads: int = None):
+        with open(os.path.join(path, CONFIG_FILE), encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.model_id = self.config["model_id"]
+        self.max_seq_length = self.config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(path, "model.int8.onnx" if quantized else "model.onnx"), options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Embed a sentence or a list of them, float32 rows in the order of sentences"""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        # Batch sentences of similar length together to pad less, as SentenceTransformer does
+        order = np.argsort([-len(sentence) for sentence in sentences], kind="stable")
+        embeddings = np.zeros((len(sentences), self.config["dimension"]), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            batch = order[start:start + batch_size]
+            inputs = self.tokenizer([sentences[i] for i in batch], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: np.asarray(inputs[name], dtype=np.int64) if name in inputs
+                     else np.zeros_like(inputs["input_ids"], dtype=np.int64) for name in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+            embeddings[batch] = self._pool(hidden, feeds["attention_mask"])
+        return embeddings[0] if single else embeddings
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        mask = attention_mask[:, :, None].astype(np.float32)
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        elif self.config["pooling"] == "max":
+            pooled = np.where(mask > 0, hidden, np.finfo(np.float32).min).max(axis=1)
+        else:
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled
+
+
+def export_path(model_name: str, export_dir: str) -> str:
+    """Directory of the ONNX export of model_name under export_dir"""
+    return os.path.join(export_dir, re.sub(r"[^\w.-]+", "--", model_name))
+
+
+def export_onnx(model_name: str, path: str, quantize: bool = False):
+    """Export the transformer of a sentence-transformers model to path/model.onnx
+
+    Also writes the tokenizer and CONFIG_FILE, and with quantize
+    path/model.int8.onnx, the same graph with int8 weights (dynamic
+    quantization). Needs torch and sentence-transformers, onnx too to
+    quantize. Files are written under a temporary name and renamed, so
+    concurrent workers never load a partial export.
+    """
+    import torch
+
+    os.makedirs(path, exist_ok=True)
+    onnx_file = os.path.join(path, "model.onnx")
+    if not os.path.exists(onnx_file):
+        model = SentenceTransformer(model_name, device="cpu")
+        modules = [type(module).__name__ for module in model]
+        if modules not in (["Transformer", "Pooling"], ["Transformer", "Pooling", "Normalize"]):
+            raise ValueError(f"Unsupported modules for the ONNX export of {model_name}: {modules}")
+        transformer, pooling = model[0], model[1]
+        pooling_mode = getattr(pooling, "pooling_mode", None) or pooling.get_pooling_mode_str()
+        if pooling_mode not in ("mean", "cls", "max"):
+            raise ValueError(f"Unsupported pooling for the ONNX export of {model_name}: {pooling_mode}")
+
+        input_names = [name for name in model.tokenizer.model_input_names
+                       if name in ("input_ids", "attention_mask", "token_type_ids")]
+
+        class Encoder(torch.nn.Module):
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+        encoder = Encoder(transformer.auto_model).eval()
+        sample = model.tokenizer(["An example sentence", "Another one"], padding=True, return_tensors="pt")
+        axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+        tmp = f"{onnx_file}.{os.getpid()}.tmp"
+        try:
+            torch.onnx.export(encoder, tuple(sample[name] for name in input_names), tmp, dynamo=False,
+                              input_names=input_names, output_names=["last_hidden_state"], dynamic_axes=axes,
+                              opset_version=17)
+            model.tokenizer.save_pretrained(path)
+            with open(os.path.join(path, CONFIG_FILE), "w", encoding="utf-8") as f:
+                json.dump({
+                    "model_id": model_name,
+                    "dimension": transformer.auto_model.config.hidden_size,
+                    "pooling": pooling_mode,
+                    "normalize": "Normalize" in modules,
+                    "max_seq_length": model.max_seq_length
+                }, f)
+            os.replace(tmp, onnx_file)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    int8_file = os.path.join(path, "model.int8.onnx")
+    if quantize and not os.path.exists(int8_file):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp = f"{int8_file}.{os.getpid()}.tmp"
+        try:
+            quantize_dynamic(onnx_file, tmp, weight_type=QuantType.QInt8)
+            os.replace(tmp, int8_file)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def create_embedder(name: str = "torch", model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                    export_dir: str = "./embedding_models", num_threads: int = None):
+    """Build an embedding model from its backend name ("torch", "onnx" or "onnx-int8")
+
+    "torch" is the SentenceTransformer itself. The ONNX backends run an
+    export of it kept under export_dir, made on first use.
+    """
+    if name == "torch":
+        return SentenceTransformer(model_name)
+    elif name in ("onnx", "onnx-int8"):
+        path = export_path(model_name, export_dir)
+        quantized = name == "onnx-int8"
+        if not os.path.exists(os.path.join(path, "model.int8.onnx" if quantized else "model.onnx")):
+            with _export_lock:
+                export_onnx(model_name, path, quantize=quantized)
+        return ONNXEmbedder(path, quantized=quantized, num_threads=num_threads)
+    else:
+        raise ValueError(f"Unsupported embedding backend: {name}")
@@ -0,0 +1,113 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from process_local import SQLiteConnection
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially reformatted chunks share a cache entry"""
+    return " ".join(text.split())
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of the normalized text, used for cache keys and chunk ids"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(SQLiteConnection):
+    """Disk-backed LRU cache of embeddings keyed by model name and chunk content
+
+    Entries live in a SQLite file so they survive restarts; once more than
+    max_entries are stored the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = "./embedding_cache.db", max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        connection.commit()
+        return connection
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return f"{model_name}:{content_hash(text)}"
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Return the cached embedding for each text, or None on a miss"""
+        keys = [self.key(model_name, text) for text in texts]
+
+        with self._lock:
+            found = {}
+            for key in set(keys):
+                row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    found[key] = np.frombuffer(row[0], dtype=np.float32)
+
+            # Refresh recency of the entries we just used
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found]
+            )
+            self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, model_name: str, texts: List[str], embeddings):
+        """Store embeddings for texts, evicting least recently used entries if needed"""
+        now = time.time()
+        rows = [
+            (self.key(model_name, text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+
+            excess = self._count() - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters and the current number of entries"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': self._count()
+            }
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Dict
+
+import numpy as np
+
+from process_local import SchedulerThread
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingService(SchedulerThread):
+    """Encodes texts for many concurrent callers in shared, tuned batches
+
+    encode() calls from every in-flight ingestion are queued; a scheduler
+    thread waits up to max_wait seconds after the first request for others,
+    then encodes up to max_batch_texts texts in one model call. With
+    num_processes > 0, coalesced batches of at least pool_min_texts texts
+    are sharded across a sentence-transformers multi-process CPU pool.
+    """
+
+    _scheduler_name = "embedding-service"
+
+    def __init__(self, model, batch_size: int = 64, max_batch_texts: int = 1024,
+                 max_wait: float = 0.01, num_processes: int = 0, pool_min_texts: int = 256):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_batch_texts = max_batch_texts
+        self.max_wait = max_wait
+        self.num_processes = num_processes
+        self.pool_min_texts = pool_min_texts
+
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+        self._pool = None
+        self._start_lock = threading.Lock()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, blocking until the batch they were merged into is encoded"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        self._ensure_started()
+        future = Future()
+        self._requests.put((list(texts), future))
+        return future.result()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'texts': self.texts,
+            'mean_batch_texts': self.texts / self.batches if self.batches else 0
+        }
+
+    def close(self):
+        """Stop the scheduler and the process pool"""
+        self._stop_scheduler()
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def _run(self):
+        carry = []
+        while True:
+            request = carry.pop() if carry else self._requests.get()
+            if request is None:
+                return
+
+            batch, size = [request], len(request[0])
+            while size < self.max_batch_texts:
+                try:
+                    request = self._requests.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                if request is None or size + len(request[0]) > self.max_batch_texts:
+                    # Keep it for the next batch, the stop sentinel included
+                    carry.append(request)
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        try:
+            embeddings = self._encode(texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.requests += len(batch)
+        self.batches += 1
+        self.texts += len(texts)
+
+        # Hand every caller its own slice
+        start = 0
+        for request_texts, future in batch:
+            future.set_result(np.asarray(embeddings[start:start + len(request_texts)]))
+            start += len(request_texts)
+
+    def _encode(self, texts: List[str]):
+        # ONNX models have no process pool, ONNX Runtime already spreads a batch over the cores
+        if (self.num_processes > 0 and len(texts) >= self.pool_min_texts
+                and hasattr(self.model, "start_multi_process_pool")):
+            if self._pool is None:
+                logger.info("Starting embedding pool with %d processes", self.num_processes)
+                self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.num_processes)
+            return self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+
+        return self.model.encode(texts, batch_size=self.batch_size)
@@ -0,0 +1,221 @@
+import logging
+import os
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Any, Callable, Union, BinaryIO
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept more jobs"""
+
+
+class IngestionJob:
+    """Tracks the state and progress of one queued document ingestion
+
+    A job given content parses the document from it instead of reading
+    file_path, and lets go of it once on_done has run. A "sync" job's
+    file_path is the directory to synchronize.
+    """
+
+    def __init__(self, file_path: str, metadata: Dict[str, Any] = None, filename: str = None,
+                 on_done: Callable[["IngestionJob"], None] = None, mode: str = "add", source: str = None,
+                 content: Union[bytes, BinaryIO] = None, delete_missing: bool = True):
+        if mode not in ("add", "update", "sync"):
+            raise ValueError(f"Unsupported ingestion mode: {mode}")
+
+        self.id = str(uuid.uuid4())
+        self.file_path = file_path
+        self.metadata = metadata
+        self.filename = filename or file_path
+        self.on_done = on_done
+        self.mode = mode
+        self.source = source
+        self.content = content
+        self.delete_missing = delete_missing
+
+        self.status = "queued"
+        self.progress = {"pages_parsed": 0, "chunks_embedded": 0, "chunks_stored": 0}
+        self.chunks = None
+        self.changes = None
+        self.error = None
+
+        self.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.started_at = None
+        self.finished_at = None
+
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def update(self, stage: str, count: int):
+        """Progress callback passed to RAGSystem.add_document"""
+        with self._lock:
+            self.progress[stage] = self.progress.get(stage, 0) + count
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable view of the job for the /jobs endpoints"""
+        with self._lock:
+            progress = dict(self.progress)
+
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'mode': self.mode,
+            'status': self.status,
+            'progress': progress,
+            'chunks': self.chunks,
+            'changes': self.changes,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class IngestionQueue:
+    """Bounded queue of ingestion jobs drained by a pool of worker threads
+
+    submit() never blocks: when max_queue_size jobs are already waiting it
+    raises IngestionQueueFull so the caller can apply backpressure.
+    """
+
+    def __init__(self, rag_system, num_workers: int = 2, max_queue_size: int = 16,
+                 max_jobs: int = 1000):
+        self.rag_system = rag_system
+        self.num_workers = num_workers
+        self.max_jobs = max_jobs
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+
+        # Workers start with the first job, so a preloading parent process
+        # forks without threads and each child gets its own pool
+        self._workers = []
+        self._workers_pid = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, file_path: str, metadata: Dict[str, Any] = None, filename: str = None,
+               on_done: Callable[[IngestionJob], None] = None, mode: str = "add",
+               source: str = None, content: Union[bytes, BinaryIO] = None,
+               delete_missing: bool = True) -> IngestionJob:
+        """Queue a document for ingestion and return its job
+
+        mode "add" indexes the document with RAGSystem.add_document, "update"
+        re-indexes only what changed with RAGSystem.update_document, and
+        "sync" brings the directory file_path in line with
+        RAGSystem.sync_directory. content, if given, is the document itself
+        (bytes or a binary file) and file_path only names it.
+        """
+        self._ensure_started()
+        job = IngestionJob(file_path, metadata, filename=filename, on_done=on_done, mode=mode, source=source,
+                           content=content, delete_missing=delete_missing)
+
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._prune_jobs()
+
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._jobs_lock:
+                self._jobs.pop(job.id, None)
+            raise IngestionQueueFull("Ingestion queue is full, retry later")
+
+        return job
+
+    def get_job(self, job_id: str) -> IngestionJob:
+        """Return the job with the given id, or None if unknown"""
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[IngestionJob]:
+        """Return all tracked jobs, oldest first"""
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def pending(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers once the jobs already queued are processed"""
+        if self._workers_pid != os.getpid():
+            return
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _ensure_started(self):
+        if self._workers_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._workers_pid != os.getpid():
+                self._workers = [
+                    threading.Thread(target=self._worker, name=f"ingestion-worker-{i}", daemon=True)
+                    for i in range(self.num_workers)
+                ]
+                for worker in self._workers:
+                    worker.start()
+                self._workers_pid = os.getpid()
+
+    def _prune_jobs(self):
+        """Forget the oldest finished jobs beyond max_jobs (caller holds the lock)"""
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:excess]:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: IngestionJob):
+        job.status = "running"
+        job.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        options = {} if job.content is None else {"content": job.content}
+        try:
+            if job.mode == "update":
+                job.changes = self.rag_system.update_document(job.file_path, job.metadata,
+                                                              progress=job.update, source=job.source, **options)
+                job.chunks = job.changes["chunks"]
+            elif job.mode == "sync":
+                job.changes = self.rag_system.sync_directory(job.file_path, metadata=job.metadata,
+                                                             delete_missing=job.delete_missing)
+                job.chunks = job.changes["chunks"]
+            else:
+                job.chunks = self.rag_system.add_document(job.file_path, job.metadata, progress=job.update,
+                                                          **options)
+        except Exception as e:
+            job.error = str(e)
+
+        # Set the final status last so pollers never see a finished job without finished_at
+        job.finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        job.status = "failed" if job.error is not None else "completed"
+
+        if job.on_done:
+            try:
+                job.on_done(job)
+            except Exception:
+                logger.exception("on_done callback failed for ingestion job %s", job.id)
+
+        # Finished jobs are kept around, their documents should not be
+        job.content = None
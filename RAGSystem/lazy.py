@@ -0,0 +1,49 @@
+import importlib
+import threading
+
+
+class LazyImport:
+    """Stand-in for a module, or an attribute of one, imported on first use
+
+    Lets heavy dependencies (torch through sentence_transformers, chromadb,
+    openai...) be named at module level without paying for the import at
+    startup. Attribute reads, writes and calls go to the real object, so
+    patch("module.name.attr") keeps working in tests.
+    """
+
+    def __init__(self, module_name: str, attribute: str = None):
+        object.__setattr__(self, "_module_name", module_name)
+        object.__setattr__(self, "_attribute", attribute)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self):
+        target = object.__getattribute__(self, "_target")
+        if target is None:
+            with object.__getattribute__(self, "_lock"):
+                target = object.__getattribute__(self, "_target")
+                if target is None:
+                    target = importlib.import_module(object.__getattribute__(self, "_module_name"))
+                    attribute = object.__getattribute__(self, "_attribute")
+                    if attribute is not None:
+                        target = getattr(target, attribute)
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        name = object.__getattribute__(self, "_module_name")
+        attribute = object.__getattribute__(self, "_attribute")
+        return f"<lazy import {name}{'.' + attribute if attribute else ''}>"
+
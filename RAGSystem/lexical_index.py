@@ -0,0 +1,169 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Collection, List, Tuple
+
+from process_local import SQLiteConnection
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words with accents removed, so "Résumé" matches "resume" """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_RE.findall(text)
+
+
+def index_path(collection_name: str = "documents", directory: str = None) -> str:
+    """SQLite file of the BM25 index of collection_name, under directory (the working directory by default)"""
+    return os.path.join(directory or ".", f"bm25_{collection_name}.db")
+
+
+class BM25Index(SQLiteConnection):
+    """In-process BM25 inverted index over chunk ids
+
+    Postings are held in memory for fast scoring and written through to a
+    SQLite file at path (None keeps the index in memory only), so the index
+    is reloaded on restart and updated incrementally as chunks are added.
+    Nothing is read from disk until the index is first used. Every write
+    records a new generation in the file, and the other instances sharing
+    it (other workers) reload their postings when they see it change.
+    """
+
+    def __init__(self, path: str = index_path(), k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        self._postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self._doc_terms = {}  # doc_id -> {term: term frequency}
+        self._doc_lengths = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+        self._generation = None
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (doc_id, term))"
+        )
+        connection.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        connection.commit()
+        return connection
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._doc_terms)
+
+    def add(self, doc_ids: List[str], texts: List[str]):
+        """Index texts under doc_ids, replacing what was indexed for those ids"""
+        with self._lock, self._writing():
+            for doc_id, text in zip(doc_ids, texts):
+                self._remove(doc_id)
+                terms = Counter(tokenize(text))
+                self._insert(doc_id, terms)
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in terms.items()]
+                )
+
+    def remove(self, doc_ids: List[str]):
+        """Drop doc_ids from the index"""
+        with self._lock, self._writing():
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def search(self, query: str, top_k: int = 5, doc_ids: Collection[str] = None) -> List[Tuple[str, float]]:
+        """Return up to top_k (doc_id, score) pairs, best first, only among doc_ids if given"""
+        terms = set(tokenize(query))
+
+        with self._lock:
+            self._load()
+            num_docs = len(self._doc_terms)
+            if not num_docs:
+                return []
+            avg_length = self._total_length / num_docs
+
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                if doc_ids is not None:
+                    # Walk the smaller side, a scoped search costs the size of its scope
+                    if len(doc_ids) < len(postings):
+                        postings = {doc_id: postings[doc_id] for doc_id in doc_ids if doc_id in postings}
+                    else:
+                        postings = {doc_id: tf for doc_id, tf in postings.items() if doc_id in doc_ids}
+                for doc_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    @contextmanager
+    def _writing(self):
+        """Write transaction on up to date postings, ending with a new generation (caller holds the lock)
+
+        The file stays locked from the generation check to the commit, so
+        concurrent writers are serialized. A failed write is rolled back and
+        the postings are read again on next use.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._load()
+            yield
+            self._generation = uuid.uuid4().hex
+            self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('generation', ?)", (self._generation,))
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            self._generation = None
+            raise
+
+    def _load(self):
+        """Read the postings from disk if another instance wrote them since (caller holds the lock)"""
+        row = self._conn.execute("SELECT value FROM info WHERE key = 'generation'").fetchone()
+        generation = row[0] if row is not None else ""
+        if generation == self._generation:
+            return
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0
+        terms_by_doc = defaultdict(dict)
+        for term, doc_id, tf in self._conn.execute("SELECT term, doc_id, tf FROM postings"):
+            terms_by_doc[doc_id][term] = tf
+        for doc_id, terms in terms_by_doc.items():
+            self._insert(doc_id, terms)
+        self._generation = generation
+
+    def _insert(self, doc_id: str, terms):
+        self._doc_terms[doc_id] = dict(terms)
+        self._doc_lengths[doc_id] = sum(terms.values())
+        self._total_length += self._doc_lengths[doc_id]
+        for term, tf in terms.items():
+            self._postings[term][doc_id] = tf
+
+    def _remove(self, doc_id: str):
+        """Forget doc_id in memory and on disk (caller holds the lock and commits)"""
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
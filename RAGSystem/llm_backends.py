@@ -0,0 +1,299 @@
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Iterator, Optional
+
+from lazy import LazyImport
+from process_local import SchedulerThread
+
+openai = LazyImport("openai")
+tiktoken = LazyImport("tiktoken")
+
+Messages = List[Dict[str, str]]
+
+
+class LLMBackend:
+    """Interface for the text generators used by RAGSystem
+
+    Subclasses implement generate(); stream(), generate_batch() and the
+    async agenerate() fall back to it when the backend has nothing better
+    to offer.
+    """
+
+    def generate(self, messages: Messages) -> str:
+        raise NotImplementedError
+
+    def stream(self, messages: Messages) -> Iterator[str]:
+        """Yield the answer token by token"""
+        yield self.generate(messages)
+
+    def generate_batch(self, batch: List[Messages]) -> List[str]:
+        """Answer several conversations at once"""
+        return [self.generate(messages) for messages in batch]
+
+    async def agenerate(self, messages: Messages) -> str:
+        """generate() for asyncio callers, in a worker thread unless overridden"""
+        return await asyncio.to_thread(self.generate, messages)
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        """Number of model tokens in text, None when the backend has no tokenizer to count them"""
+        return None
+
+    def warmup(self):
+        """Load whatever the backend loads lazily"""
+
+    def close(self):
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """Chat completions through the OpenAI API, or any server compatible with it (base_url)
+
+    agenerate() awaits the request on an AsyncOpenAI client, so an event
+    loop can keep many completions in flight without a thread for each.
+    """
+
+    def __init__(self, api_key: str = None, model: str = "gpt-3.5-turbo", base_url: str = None):
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("Aucune clé API fournie. Définissez-la en paramètre ou dans le fichier .env.")
+
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+
+        # One async client per event loop, its connection pool is bound to the loop
+        self._async_client = None
+        self._async_loop = None
+
+        # tiktoken encoding of model, loaded on first count (False when there is none)
+        self._encoding = None
+
+    def warmup(self):
+        # Importing openai is what takes time, it happens on first access
+        self._configure()
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        # tiktoken is optional, and does not know the models of other compatible servers
+        if self._encoding is None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except (ImportError, KeyError):
+                self._encoding = False
+        return len(self._encoding.encode(text)) if self._encoding else None
+
+    def _configure(self):
+        openai.api_key = self.api_key
+        if self.base_url:
+            # The module-level client joins paths to base_url only when it ends with a slash
+            openai.base_url = self.base_url.rstrip("/") + "/"
+
+    def generate(self, messages: Messages) -> str:
+        self._configure()
+        response = openai.chat.completions.create(
+            model=self.model,
+            messages=messages
+        )
+        return response.choices[0].message.content
+
+    def stream(self, messages: Messages) -> Iterator[str]:
+        self._configure()
+        response = openai.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def agenerate(self, messages: Messages) -> str:
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+            self._async_loop = loop
+        response = await self._async_client.chat.completions.create(
+            model=self.model,
+            messages=messages
+        )
+        return response.choices[0].message.content
+
+
+class LocalBackend(LLMBackend):
+    """Small instruction-tuned transformers model running on the CPU, no network needed
+
+    generate_batch() pads the conversations together and runs a single
+    model.generate call, wrap it in a BatchingBackend to merge concurrent requests.
+    """
+
+    def __init__(self, model: str = "Qwen/Qwen2.5-0.5B-Instruct", max_new_tokens: int = 256):
+        self.model_name = model
+        self.max_new_tokens = max_new_tokens
+
+        # Loaded on first use, or by warmup()
+        self.tokenizer = None
+        self.model = None
+        self._load_lock = threading.Lock()
+
+    def warmup(self):
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            try:
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+            except ImportError as e:
+                raise ImportError("LocalBackend requires the transformers package (pip install transformers)") from e
+
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name, padding_side="left")
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            model = AutoModelForCausalLM.from_pretrained(self.model_name)
+            model.eval()
+            self.tokenizer, self.model = tokenizer, model
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        self.warmup()
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def generate(self, messages: Messages) -> str:
+        return self.generate_batch([messages])[0]
+
+    def generate_batch(self, batch: List[Messages]) -> List[str]:
+        self.warmup()
+        prompts = [
+            self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            for messages in batch
+        ]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        outputs = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens, do_sample=False,
+                                      pad_token_id=self.tokenizer.pad_token_id)
+
+        # Keep only the generated continuation of each prompt
+        generated = outputs[:, inputs["input_ids"].shape[1]:]
+        return self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+
+    def stream(self, messages: Messages) -> Iterator[str]:
+        from transformers import TextIteratorStreamer
+
+        self.warmup()
+        prompt = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+        thread = threading.Thread(target=self.model.generate, kwargs=dict(
+            **inputs, streamer=streamer, max_new_tokens=self.max_new_tokens, do_sample=False,
+            pad_token_id=self.tokenizer.pad_token_id
+        ), daemon=True)
+        thread.start()
+        for token in streamer:
+            if token:
+                yield token
+        thread.join()
+
+
+class StubBackend(LLMBackend):
+    """Deterministic offline backend for tests and benchmarks"""
+
+    def __init__(self, answer: str = "Ceci est une réponse de test."):
+        self.answer = answer
+        self.calls = 0
+
+    def generate(self, messages: Messages) -> str:
+        self.calls += 1
+        return self.answer
+
+    async def agenerate(self, messages: Messages) -> str:
+        return self.generate(messages)
+
+    def stream(self, messages: Messages) -> Iterator[str]:
+        self.calls += 1
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            yield word if i == 0 else " " + word
+
+
+class BatchingBackend(SchedulerThread, LLMBackend):
+    """Merges concurrent generate() calls into generate_batch() calls on the wrapped backend
+
+    A scheduler thread waits up to max_wait seconds after the first request
+    for more to arrive, then answers up to max_batch_size of them in one pass.
+    """
+
+    _scheduler_name = "llm-batcher"
+
+    def __init__(self, backend: LLMBackend, max_batch_size: int = 8, max_wait: float = 0.02):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._start_lock = threading.Lock()
+
+    def generate(self, messages: Messages) -> str:
+        self._ensure_started()
+        future = Future()
+        self._requests.put((messages, future))
+        return future.result()
+
+    def warmup(self):
+        self.backend.warmup()
+
+    def count_tokens(self, text: str) -> Optional[int]:
+        return self.backend.count_tokens(text)
+
+    def generate_batch(self, batch: List[Messages]) -> List[str]:
+        return self.backend.generate_batch(batch)
+
+    def stream(self, messages: Messages) -> Iterator[str]:
+        # Streams are token by token per request, they are not batched
+        return self.backend.stream(messages)
+
+    def close(self):
+        self._stop_scheduler()
+        self.backend.close()
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+
+            batch = [request]
+            stop = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self._requests.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+
+            try:
+                answers = self.backend.generate_batch([messages for messages, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), answer in zip(batch, answers):
+                    future.set_result(answer)
+
+            if stop:
+                return
+
+
+def create_backend(name: str, api_key: str = None, model: str = None, batch_size: int = 8,
+                   base_url: str = None) -> LLMBackend:
+    """Build a backend from its name ("openai", "local" or "stub")"""
+    if name == "openai":
+        return OpenAIBackend(api_key=api_key, model=model or "gpt-3.5-turbo", base_url=base_url)
+    elif name == "local":
+        backend = LocalBackend(model=model) if model else LocalBackend()
+        return BatchingBackend(backend, max_batch_size=batch_size)
+    elif name == "stub":
+        return StubBackend()
+    else:
+        raise ValueError(f"Unsupported LLM backend: {name}")
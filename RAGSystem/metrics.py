@@ -0,0 +1,146 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Tuple
+
+# Upper bounds in seconds, from a cache hit to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def timed_iter(iterable: Iterable, totals: Dict[str, float], key: str) -> Iterator:
+    """Yield from iterable, adding the seconds spent producing its items to totals[key]"""
+    iterator = iter(iterable)
+    totals.setdefault(key, 0.0)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            totals[key] += time.perf_counter() - start
+        yield item
+
+
+class Histogram:
+    """Bucketed distribution of observed values, as Prometheus histograms count them"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        """(le, count of values <= le) pairs ending with +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), total
+
+
+class Metrics:
+    """Per-stage latency histograms and throughput counters
+
+    Recording is a perf_counter() call, a dict lookup and a bisect under a
+    lock, cheap enough to leave on in production. render() formats
+    everything in the Prometheus text exposition format, stage durations
+    as one histogram labelled by stage.
+    """
+
+    def __init__(self, namespace: str = "rag", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+
+        self._histograms = {}  # stage -> Histogram
+        self._counters = {}  # name -> value
+        self._gauges = {}  # name -> callback
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        """Record that stage took seconds"""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1):
+        """Add value to the counter name"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name: str, callback: Callable[[], float]):
+        """Report callback() as the gauge name every time metrics are rendered"""
+        with self._lock:
+            self._gauges[name] = callback
+
+    @contextmanager
+    def timer(self, stage: str, timings: Dict[str, float] = None):
+        """Time the block as stage, also storing it in timings as "<stage>_ms" if given"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(stage, seconds)
+            if timings is not None:
+                timings[f"{stage}_ms"] = round(seconds * 1000, 1)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Counters and the count, sum and mean of every stage"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'stages': {
+                    stage: {
+                        'count': histogram.count,
+                        'sum_s': histogram.sum,
+                        'mean_ms': histogram.sum / histogram.count * 1000 if histogram.count else 0
+                    }
+                    for stage, histogram in self._histograms.items()
+                }
+            }
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {stage: (list(h.cumulative()), h.sum, h.count) for stage, h in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines = []
+        if histograms:
+            name = f"{self.namespace}_stage_duration_seconds"
+            lines.append(f"# HELP {name} Time spent in each ingestion and query stage")
+            lines.append(f"# TYPE {name} histogram")
+            for stage in sorted(histograms):
+                buckets, total, count = histograms[stage]
+                for le, cumulative in buckets:
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        for counter in sorted(counters):
+            name = f"{self.namespace}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {counters[counter]}")
+
+        for gauge in sorted(gauges):
+            try:
+                value = gauges[gauge]()
+            except Exception:
+                continue
+            name = f"{self.namespace}_{gauge}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,71 @@
+import os
+import queue
+import sqlite3
+import threading
+
+
+class SQLiteConnection:
+    """Mixin for the stores kept in a SQLite file, with one connection per process
+
+    The connection is opened by _connect() on first use, and opened again
+    in a forked child rather than sharing the parent's. Classes using it set
+    self._lock, held around every use of _conn.
+    """
+
+    _connection = None
+    _connection_pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the connection and create the schema"""
+        raise NotImplementedError
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Connection opened on first use, and reopened in a forked child (caller holds the lock)"""
+        if self._connection_pid != os.getpid():
+            self._connection = self._connect()
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection, self._connection_pid = None, None
+
+
+class SchedulerThread:
+    """Mixin for classes answering queued requests from one background thread
+
+    The thread runs _run(), which reads self._requests until it gets None.
+    It is started with the first request, so a preloading parent process
+    forks without threads, and started again with a new queue in a forked
+    child. _scheduler_name names the thread. Classes using it set
+    self._start_lock, held while the thread starts.
+    """
+
+    _scheduler_name = "scheduler"
+    _scheduler = None
+    _scheduler_pid = None
+    _requests = None
+
+    def _run(self):
+        raise NotImplementedError
+
+    def _ensure_started(self):
+        """Start the scheduler thread on first use, and again in a forked child"""
+        if self._scheduler_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._scheduler_pid != os.getpid():
+                self._requests = queue.Queue()
+                self._scheduler = threading.Thread(target=self._run, name=self._scheduler_name, daemon=True)
+                self._scheduler.start()
+                self._scheduler_pid = os.getpid()
+
+    def _stop_scheduler(self):
+        """Wait for the scheduler to answer the requests already queued, then stop it"""
+        if self._scheduler is not None and self._scheduler_pid == os.getpid():
+            self._requests.put(None)
+            self._scheduler.join()
+        self._scheduler, self._scheduler_pid = None, None
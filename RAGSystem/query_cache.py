@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+
+class QueryCache:
+    """Two-tier cache of generated answers
+
+    The first tier matches the normalized query text exactly. The second
+    compares the query embedding with the embeddings of past queries and
+    reuses an answer when the cosine similarity reaches similarity_threshold.
+    Entries expire after ttl seconds and at most capacity entries are kept,
+    evicting the least recently used.
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: float = 3600, similarity_threshold: float = 0.95):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        # Bumped on every clear() so answers computed before it are not stored
+        self.generation = 0
+
+        # normalized query -> (unit query embedding, answer, stored_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return normalize_text(query).lower()
+
+    def get(self, query: str) -> Optional[str]:
+        """Return the answer cached for exactly this query, if any"""
+        key = self.normalize(query)
+
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[1]
+
+    def get_similar(self, query_embedding) -> Optional[str]:
+        """Return the answer of the most similar past query above the threshold"""
+        embedding = self._unit(query_embedding)
+
+        with self._lock:
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            keys = list(self._entries)
+            similarities = np.stack([self._entries[key][0] for key in keys]) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(keys[best])
+            self.semantic_hits += 1
+            return self._entries[keys[best]][1]
+
+    def put(self, query: str, query_embedding, answer: str, generation: int = None):
+        """Cache the answer generated for query
+
+        generation is the value of self.generation read before retrieval; if
+        the cache was cleared since then the answer may be stale and is dropped.
+        """
+        key = self.normalize(query)
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (self._unit(query_embedding), answer, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached answer, called whenever the document collection changes"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'entries': len(self._entries)
+            }
+
+    def _expire(self):
+        """Remove entries older than ttl (caller holds the lock)"""
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, entry in self._entries.items() if entry[2] < cutoff]:
+            del self._entries[key]
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
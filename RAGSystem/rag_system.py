@@ -1,172 +1,1140 @@
+import asyncio
+import io
+import math
+import multiprocessing
 import os
-from typing import List, Dict, Any
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, BinaryIO, Callable, Iterator, Optional, Tuple, Union
 import numpy as np
 
 from dotenv import load_dotenv
 
+# Heavy dependencies are imported on first use to keep startup fast
+from lazy import LazyImport
+
 # Document processing imports
-from PyPDF2 import PdfReader
-import docx
+PdfReader = LazyImport("PyPDF2", "PdfReader")
+docx = LazyImport("docx")
+from chunking import Block, Chunker, PARAGRAPH_RE
 
 # Embedding and vector DB
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
+from embedding_backends import QUANTIZED_BACKENDS, create_embedder
+from vector_index import VectorIndex, create_index, validate_where
+from embedding_cache import EmbeddingCache, content_hash
+from document_registry import DocumentRegistry, chunk_id, file_hash, metadata_hash
+from embedding_service import EmbeddingService
+from lexical_index import BM25Index, index_path
+from query_cache import QueryCache
+from metrics import Metrics, timed_iter
+
+# LLM for generation (OpenAI by default, see llm_backends)
+from llm_backends import LLMBackend, OpenAIBackend
+from reranker import Reranker
+from context_builder import ContextBuilder
+
+# Document data given instead of reading file_path: the bytes or a binary file object
+Content = Union[bytes, BinaryIO]
+
+# Margin on context token counts estimated with the embedding tokenizer, when the LLM has none:
+# the two vocabularies split text differently, and the embedding one may count fewer tokens
+CONTEXT_TOKEN_MARGIN = 1.25
+
+def split_paragraphs(text: str) -> List[str]:
+    """Simple chunking by paragraphs (can be improved)"""
+    return [p for p in text.split("\n\n") if p.strip()]
+
+
+def elapsed_ms(start: float) -> float:
+    """Milliseconds since the time.perf_counter() value start"""
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge ranked id lists, scoring each id by the sum of 1 / (k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0) + 1 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of a PDF, run in worker processes"""
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
 
-# LLM for generation (using OpenAI as example)
-import openai
 
 class DocumentProcessor:
-    """Processes different document types into text chunks"""
+    """Processes different document types into text chunks
     
-    def process_pdf(self, file_path: str) -> List[str]:
-        """Extract text from PDF and split into chunks"""
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
+    The iter_* methods are generators that yield chunks page by page so a
+    large document never has to be held in memory at once; iter_chunks
+    sizes them with the token-aware chunker when one is given. PDF pages are
+    extracted by a process pool, pages_per_task at a time, when the document
+    has more than one task worth of pages; max_workers=0 disables the pool.
+    
+    The *_blocks and iter_chunks methods also parse documents held in
+    memory: given content, file_path only names the document (its extension
+    gives the format) and the data is read from content instead.
+    """
+    
+    supported_extensions = ('.pdf', '.docx', '.txt')
+    
+    def __init__(self, max_workers: int = None, pages_per_task: int = 8, chunker: Chunker = None,
+                 metrics: Metrics = None):
+        self.chunker = chunker
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        self.pages_per_task = pages_per_task
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    
+    def iter_pdf(self, file_path: str, on_page: Callable[[int], None] = None) -> Iterator[str]:
+        """Extract text from PDF and yield its chunks page by page"""
+        for _, _, text in self.iter_pdf_blocks(file_path, on_page=on_page):
+            yield from split_paragraphs(text)
+    
+    def iter_docx(self, file_path: str, on_page: Callable[[int], None] = None) -> Iterator[str]:
+        """Extract text from DOCX and yield its chunks"""
+        for _, _, text in self.iter_docx_blocks(file_path, on_page=on_page):
+            yield text
+    
+    def iter_txt(self, file_path: str, on_page: Callable[[int], None] = None) -> Iterator[str]:
+        """Yield the paragraphs of a plain text file without reading it whole"""
+        for _, _, text in self.iter_txt_blocks(file_path, on_page=on_page):
+            yield text
+    
+    def iter_pdf_blocks(self, file_path: str, on_page: Callable[[int], None] = None,
+                        content: Content = None) -> Iterator[Block]:
+        """Yield (page, 0, text) for every page of a PDF"""
+        reader = PdfReader(self._open(content) if content is not None else file_path)
+        num_pages = len(reader.pages)
+        
+        # Worker processes reopen the PDF, so they need it on disk
+        disk_path = file_path if content is None else self._disk_path(content)
+        if self.max_workers > 0 and num_pages > self.pages_per_task and disk_path is not None:
+            pages = self._iter_pdf_pages_parallel(disk_path, num_pages)
+        else:
+            pages = ([page.extract_text() or ""] for page in reader.pages)
         
-        # Simple chunking by paragraphs (can be improved)
-        chunks = [p for p in text.split("\n\n") if p.strip()]
-        return chunks
+        page_number = 0
+        for page_texts in pages:
+            for text in page_texts:
+                page_number += 1
+                yield page_number, 0, text
+            if on_page:
+                on_page(len(page_texts))
     
-    def process_docx(self, file_path: str) -> List[str]:
-        """Extract text from DOCX and split into chunks"""
-        doc = docx.Document(file_path)
-        text = ""
+    def iter_docx_blocks(self, file_path: str, on_page: Callable[[int], None] = None,
+                         content: Content = None) -> Iterator[Block]:
+        """Yield (1, offset, text) for every group of consecutive DOCX paragraphs"""
+        doc = docx.Document(self._open(content) if content is not None else file_path)
+        
+        # Consecutive paragraphs form one block, empty paragraphs separate blocks.
+        # Offsets are in the document text with paragraphs joined by newlines.
+        group, group_start, offset = [], 0, 0
         for para in doc.paragraphs:
-            text += para.text + "\n"
+            if para.text.strip():
+                if not group:
+                    group_start = offset
+                group.append(para.text)
+            elif group:
+                yield 1, group_start, "\n".join(group)
+                group = []
+            offset += len(para.text) + 1
+        if group:
+            yield 1, group_start, "\n".join(group)
         
-        # Simple chunking by paragraphs
-        chunks = [p for p in text.split("\n\n") if p.strip()]
-        return chunks
+        # DOCX has no page layout, count the whole document as one page
+        if on_page:
+            on_page(1)
     
-    def process_txt(self, file_path: str) -> List[str]:
-        """Process plain text files"""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            text = file.read()
+    def iter_txt_blocks(self, file_path: str, on_page: Callable[[int], None] = None,
+                        content: Content = None) -> Iterator[Block]:
+        """Yield (1, offset, text) for every paragraph of a plain text file"""
+        if content is None:
+            file = open(file_path, 'r', encoding='utf-8')
+        else:
+            file = io.TextIOWrapper(self._open(content), encoding='utf-8')
+        try:
+            lines, block_start, offset = [], 0, 0
+            for line in file:
+                if line.strip():
+                    if not lines:
+                        block_start = offset
+                    lines.append(line)
+                elif lines:
+                    yield 1, block_start, "".join(lines).rstrip("\n")
+                    lines = []
+                offset += len(line)
+            if lines:
+                yield 1, block_start, "".join(lines).rstrip("\n")
+        finally:
+            if content is None:
+                file.close()
+            else:
+                # Leave the caller's content open
+                file.detach()
+        
+        if on_page:
+            on_page(1)
+    
+    def iter_blocks(self, file_path: str, on_page: Callable[[int], None] = None,
+                    content: Content = None) -> Iterator[Block]:
+        """Yield the (page, char_offset, text) blocks of a document based on its file extension"""
+        _, ext = os.path.splitext(file_path)
+        ext = ext.lower()
+        
+        if ext == '.pdf':
+            return self.iter_pdf_blocks(file_path, on_page=on_page, content=content)
+        elif ext == '.docx':
+            return self.iter_docx_blocks(file_path, on_page=on_page, content=content)
+        elif ext == '.txt':
+            return self.iter_txt_blocks(file_path, on_page=on_page, content=content)
+        else:
+            raise ValueError(f"Unsupported file format: {ext}")
+    
+    def iter_chunks(self, file_path: str, on_page: Callable[[int], None] = None,
+                    content: Content = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (text, metadata) chunks, sized by the chunker when one is configured
+        
+        Without a chunker every paragraph is a chunk and the metadata only
+        holds its page and char offsets. The time spent parsing and chunking
+        the document is recorded as the "parse" and "chunk" stages.
+        """
+        def count_pages(count: int):
+            self.metrics.inc("pages_parsed", count)
+            if on_page:
+                on_page(count)
+        
+        # Time spent in the chunker includes pulling blocks from the parser
+        totals = {}
+        blocks = timed_iter(self.iter_blocks(file_path, on_page=count_pages, content=content), totals, "parse")
+        num_chunks = 0
+        try:
+            for chunk in timed_iter(self._chunk_blocks(blocks), totals, "chunk"):
+                num_chunks += 1
+                yield chunk
+        finally:
+            self.metrics.observe("parse", totals.get("parse", 0.0))
+            self.metrics.observe("chunk", totals.get("chunk", 0.0) - totals.get("parse", 0.0))
+            self.metrics.inc("chunks", num_chunks)
+    
+    def _chunk_blocks(self, blocks: Iterator[Block]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        if self.chunker is not None:
+            yield from self.chunker.chunk(blocks)
+            return
         
-        # Simple chunking by paragraphs
-        chunks = [p for p in text.split("\n\n") if p.strip()]
-        return chunks
+        for page, offset, text in blocks:
+            for paragraph in PARAGRAPH_RE.finditer(text):
+                yield paragraph.group(), {
+                    "page": page,
+                    "char_start": offset + paragraph.start(),
+                    "char_end": offset + paragraph.end()
+                }
     
-    def process_document(self, file_path: str) -> List[str]:
+    def iter_document(self, file_path: str, on_page: Callable[[int], None] = None) -> Iterator[str]:
+        """Yield the chunks of a document based on its file extension
+        
+        on_page, if given, is called with the number of pages just parsed
+        so that callers can report ingestion progress.
+        """
+        _, ext = os.path.splitext(file_path)
+        ext = ext.lower()
+        
+        if ext == '.pdf':
+            return self.iter_pdf(file_path, on_page=on_page)
+        elif ext == '.docx':
+            return self.iter_docx(file_path, on_page=on_page)
+        elif ext == '.txt':
+            return self.iter_txt(file_path, on_page=on_page)
+        else:
+            raise ValueError(f"Unsupported file format: {ext}")
+    
+    def process_pdf(self, file_path: str, on_page: Callable[[int], None] = None) -> List[str]:
+        """Extract text from PDF and split into chunks"""
+        return list(self.iter_pdf(file_path, on_page=on_page))
+    
+    def process_docx(self, file_path: str, on_page: Callable[[int], None] = None) -> List[str]:
+        """Extract text from DOCX and split into chunks"""
+        return list(self.iter_docx(file_path, on_page=on_page))
+    
+    def process_txt(self, file_path: str, on_page: Callable[[int], None] = None) -> List[str]:
+        """Process plain text files"""
+        return list(self.iter_txt(file_path, on_page=on_page))
+    
+    def process_document(self, file_path: str, on_page: Callable[[int], None] = None) -> List[str]:
         """Process document based on file extension"""
         _, ext = os.path.splitext(file_path)
         ext = ext.lower()
         
         if ext == '.pdf':
-            return self.process_pdf(file_path)
+            return self.process_pdf(file_path, on_page=on_page)
         elif ext == '.docx':
-            return self.process_docx(file_path)
+            return self.process_docx(file_path, on_page=on_page)
         elif ext == '.txt':
-            return self.process_txt(file_path)
+            return self.process_txt(file_path, on_page=on_page)
         else:
             raise ValueError(f"Unsupported file format: {ext}")
+    
+    @staticmethod
+    def _open(content: Content) -> BinaryIO:
+        """content as a binary file at its start, bytes are wrapped without copying them"""
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return io.BytesIO(content)
+        content.seek(0)
+        return content
+    
+    @staticmethod
+    def _disk_path(content: Content) -> Optional[str]:
+        """Path of the file behind content, if it is a file on disk"""
+        name = getattr(content, "name", None)
+        return name if isinstance(name, str) and os.path.isfile(name) else None
+    
+    def close(self):
+        """Shut down the page extraction pool"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+    
+    def _iter_pdf_pages_parallel(self, file_path: str, num_pages: int) -> Iterator[List[str]]:
+        """Yield page texts in order, keeping at most 2 * max_workers tasks in flight"""
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned, a forked worker would inherit the threads and locks of the ingestion workers
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            pool = self._pool
+        
+        ranges = [(start, min(start + self.pages_per_task, num_pages))
+                  for start in range(0, num_pages, self.pages_per_task)]
+        in_flight = deque()
+        try:
+            for start, stop in ranges:
+                in_flight.append(pool.submit(extract_pdf_pages, file_path, start, stop))
+                if len(in_flight) >= 2 * self.max_workers:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            for future in in_flight:
+                future.cancel()
 
 
 class VectorStore:
-    """Manages document embeddings and retrieval"""
+    """Manages document embeddings and retrieval
     
-    def __init__(self, collection_name: str = "documents"):
-        # Initialize embedding model
-        self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+    Embeddings are stored in index, by default built from backend: "chroma"
+    or "quantized" (see vector_index), under persist_directory. They are
+    computed by model_name run by embedding_backend: "torch", "onnx" or
+    "onnx-int8" (see embedding_backends), or by embedder if given. The
+    index records the model of its embeddings on the first write and is
+    refused by a store using another model.
+    """
+    
+    def __init__(self, collection_name: str = "documents",
+                 model_name: str = 'sentence-transformers/all-MiniLM-L6-v2',
+                 embedding_cache: EmbeddingCache = None, embedding_processes: int = 0,
+                 lexical_index: BM25Index = None, persist_directory: str = None,
+                 metrics: Metrics = None, index: VectorIndex = None, backend: str = "chroma",
+                 embedding_backend: str = "torch", embedding_export_dir: str = "./embedding_models",
+                 embedder=None):
+        # The embedding model and the vector index are loaded on first use, or by warmup()
+        self.collection_name = collection_name
+        self.model_name = model_name
+        self.embedding_backend = embedding_backend
+        self.embedding_export_dir = embedding_export_dir
+        self.embedding_processes = embedding_processes
+        self.persist_directory = persist_directory
+        self.backend = backend
+        self._embedding_model = embedder
+        self._embedding_service = None
+        self._index = index
+        self._index_model = None
+        self._index_checked = False
+        self._init_lock = threading.RLock()
         
-        # Initialize ChromaDB
-        self.client = chromadb.Client(Settings(
-            chroma_db_impl="duckdb+parquet",
-            persist_directory="./chroma_db"
-        ))
+        # Quantized models give slightly different embeddings, cache them apart
+        self.embedding_cache_key = (f"{model_name}#{embedding_backend}" if embedding_backend in QUANTIZED_BACKENDS
+                                    else model_name)
         
-        # Create or get collection
-        try:
-            self.collection = self.client.get_collection(collection_name)
-        except:
-            self.collection = self.client.create_collection(collection_name)
+        # Persistent cache so re-ingested chunks skip re-encoding
+        self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache()
+        
+        # Keyword index kept alongside the collection for hybrid search
+        self.lexical_index = (lexical_index if lexical_index is not None
+                              else BM25Index(index_path(collection_name, persist_directory)))
+        
+        self.metrics = metrics if metrics is not None else Metrics()
+    
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            with self._init_lock:
+                if self._embedding_model is None:
+                    # Initialize embedding model
+                    self._embedding_model = create_embedder(self.embedding_backend, self.model_name,
+                                                            export_dir=self.embedding_export_dir)
+        return self._embedding_model
+    
+    @property
+    def embedding_service(self) -> EmbeddingService:
+        if self._embedding_service is None:
+            with self._init_lock:
+                if self._embedding_service is None:
+                    # Shared encoder batching the chunks of concurrent ingestions
+                    self._embedding_service = EmbeddingService(self.embedding_model,
+                                                               num_processes=self.embedding_processes)
+        return self._embedding_service
     
-    def add_documents(self, documents: List[str], metadata: List[Dict[str, Any]] = None):
-        """Add documents to the vector store"""
+    def embedding_service_stats(self) -> Optional[Dict[str, float]]:
+        """Stats of the embedding service, None while it is not started, so the model is not loaded for them"""
+        service = self._embedding_service
+        return service.stats() if service is not None else None
+    
+    @property
+    def index(self) -> VectorIndex:
+        if not self._index_checked:
+            with self._init_lock:
+                if self._index is None:
+                    self._index = create_index(self.backend, self.collection_name, path=self.persist_directory)
+                if not self._index_checked:
+                    recorded = self._index.embedding_model()
+                    if recorded is not None and recorded["model_id"] != self.model_name:
+                        raise ValueError(f"The index holds embeddings of {recorded['model_id']}, not {self.model_name}: "
+                                         "use that model or re-index the documents into a new collection")
+                    self._index_model = recorded
+                    self._index_checked = True
+        return self._index
+    
+    def warmup(self, models_only: bool = False):
+        """Load the embedding model now instead of on the first request
+        
+        Unless models_only, also open the vector index and the on-disk caches. Use
+        models_only before forking workers: the model weights are then shared
+        copy-on-write while every worker opens its own database connections.
+        """
+        self.embedding_model
+        if not models_only:
+            self.index.count()
+            self.embedding_cache.stats()
+            len(self.lexical_index)
+    
+    def add_documents(self, documents: List[str], metadata: List[Dict[str, Any]] = None,
+                      batch_size: int = 64, progress: Callable[[str, int], None] = None,
+                      ids: List[str] = None):
+        """Add documents to the vector store
+        
+        Documents are embedded and stored in batches of batch_size so that
+        progress ("chunks_embedded", "chunks_stored") can be reported while
+        a large document is still being ingested. Chunk ids are derived from
+        the content unless given, so storing the same chunk again upserts
+        instead of duplicating it.
+        """
         if not documents:
             return
         
-        # Generate embeddings
-        embeddings = self.embedding_model.encode(documents)
-        
-        # Prepare document IDs and metadata
-        ids = [f"doc_{i}_{os.urandom(4).hex()}" for i in range(len(documents))]
         if metadata is None:
             metadata = [{"source": "unknown"} for _ in documents]
+        if ids is None:
+            ids = [content_hash(doc) for doc in documents]
         
-        # Add to collection
-        self.collection.add(
-            documents=documents,
-            embeddings=embeddings, #embeddings=embeddings.tolist(),
-            ids=ids,
-            metadatas=metadata
-        )
+        # Drop repeated chunks, Chroma rejects duplicate ids within one upsert
+        unique = {}
+        for doc_id, doc, meta in zip(ids, documents, metadata):
+            unique.setdefault(doc_id, (doc, meta))
+        ids = list(unique)
+        documents = [unique[doc_id][0] for doc_id in ids]
+        metadata = [unique[doc_id][1] for doc_id in ids]
+        
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            
+            # Generate embeddings
+            with self.metrics.timer("encode"):
+                embeddings = self.embed(batch)
+            if progress:
+                progress("chunks_embedded", len(batch))
+            
+            # Add to collection
+            self._record_embedding_model(len(embeddings[0]))
+            with self.metrics.timer("store"):
+                self.index.upsert(
+                    documents=batch,
+                    embeddings=embeddings,
+                    ids=ids[start:start + batch_size],
+                    metadatas=metadata[start:start + batch_size]
+                )
+            with self.metrics.timer("lexical_index"):
+                self.lexical_index.add(ids[start:start + batch_size], batch)
+            self.metrics.inc("chunks_stored", len(batch))
+            if progress:
+                progress("chunks_stored", len(batch))
+    
+    def _record_embedding_model(self, dimension: int):
+        """Record the model in an index that has none, indexes older than the record adopt it"""
+        index = self.index
+        if self._index_model is None:
+            index.set_embedding_model(self.model_name, dimension)
+            self._index_model = {"model_id": self.model_name, "dimension": dimension}
+        elif self._index_model["dimension"] != dimension:
+            raise ValueError(f"The index holds embeddings of dimension {self._index_model['dimension']}, "
+                             f"{self.model_name} gave {dimension}")
     
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for relevant documents based on query"""
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode(query)
+    def delete(self, ids: List[str]):
+        """Remove chunks from the vector and lexical indexes"""
+        if not ids:
+            return
+        with self.metrics.timer("delete"):
+            self.index.delete(ids)
+            self.lexical_index.remove(ids)
+        self.metrics.inc("chunks_deleted", len(ids))
+    
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, only encoding the ones missing from the embedding cache"""
+        embeddings = self.embedding_cache.get_many(self.embedding_cache_key, texts)
         
-        # Search in collection
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
-        )
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            self.metrics.inc("texts_encoded", len(missing))
+            encoded = self.embedding_service.encode([texts[i] for i in missing])
+            self.embedding_cache.put_many(self.embedding_cache_key, [texts[i] for i in missing], encoded)
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
         
-        # Format results
-        documents = results['documents'][0]
-        metadatas = results['metadatas'][0]
+        return [np.asarray(embedding, dtype=np.float32).tolist() for embedding in embeddings]
+    
+    def count_tokens(self, text: str) -> int:
+        """Number of embedding model tokens in text, without special tokens"""
+        return len(self.embedding_model.tokenizer.encode(text, add_special_tokens=False))
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query"""
+        return np.asarray(self.embedding_model.encode(query), dtype=np.float32).tolist()
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several search queries in one model call"""
+        return np.asarray(self.embedding_model.encode(list(queries)), dtype=np.float32).tolist()
+    
+    def search(self, query: str, top_k: int = 5, query_embedding: List[float] = None,
+               mode: str = "hybrid", timings: Dict[str, float] = None,
+               where: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Search for relevant documents based on query
+        
+        mode is "dense" (embedding similarity), "lexical" (BM25) or "hybrid",
+        which fuses both rankings with reciprocal-rank fusion. If timings is
+        given it receives dense_search_ms and lexical_search_ms. where limits
+        the search to the chunks whose metadata matches it, for instance
+        {"source": {"$in": [...]}}, see vector_index.validate_where().
+        """
+        query_embeddings = [query_embedding] if query_embedding is not None else None
+        return self.search_batch([query], top_k=top_k, query_embeddings=query_embeddings,
+                                 mode=mode, timings=timings, where=where)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 5, query_embeddings: List[List[float]] = None,
+                     mode: str = "hybrid", timings: Dict[str, float] = None,
+                     where: Dict[str, Any] = None) -> List[List[Dict[str, Any]]]:
+        """Search for the relevant documents of several queries at once
+        
+        Same as search() for every query, but the queries are embedded in one
+        batch, looked up in one index query and the chunks found only by the
+        lexical index fetched in one call.
+        """
+        if mode not in ("dense", "lexical", "hybrid"):
+            raise ValueError(f"Unsupported search mode: {mode}")
+        if where is not None:
+            validate_where(where)
+        
+        # Look deeper in each ranking when they are going to be fused
+        depth = top_k * 4 if mode == "hybrid" else top_k
+        
+        rankings = [[] for _ in queries]
+        documents = {}
+        if mode in ("dense", "hybrid"):
+            # Generate query embeddings unless the caller already has them
+            if query_embeddings is None:
+                query_embeddings = self.embed_queries(queries)
+            
+            # Search in collection
+            with self.metrics.timer("dense_search", timings):
+                if where is None:
+                    results = self.index.query(query_embeddings=query_embeddings, n_results=depth)
+                else:
+                    results = self.index.query(query_embeddings=query_embeddings, n_results=depth, where=where)
+            for i, ids in enumerate(results['ids']):
+                documents.update(zip(ids, zip(results['documents'][i], results['metadatas'][i])))
+                rankings[i].append(ids)
         
+        if mode in ("lexical", "hybrid"):
+            with self.metrics.timer("lexical_search", timings):
+                # The chunks the filter allows, the lexical index has no metadata
+                scope = set(self.index.ids(where)) if where is not None else None
+                lexical = [[doc_id for doc_id, _ in self.lexical_index.search(query, top_k=depth, doc_ids=scope)]
+                           for query in queries]
+                missing = list(dict.fromkeys(
+                    doc_id for ids in lexical for doc_id in ids if doc_id not in documents
+                ))
+                if missing:
+                    results = self.index.get(ids=missing)
+                    documents.update(zip(results['ids'], zip(results['documents'], results['metadatas'])))
+            for ranking, ids in zip(rankings, lexical):
+                ranking.append([doc_id for doc_id in ids if doc_id in documents])
+        
+        # Format results
         return [
-            {"content": doc, "metadata": meta}
-            for doc, meta in zip(documents, metadatas)
+            [
+                {"content": documents[doc_id][0], "metadata": documents[doc_id][1]}
+                for doc_id in reciprocal_rank_fusion(ranking)[:top_k]
+            ]
+            for ranking in rankings
         ]
 
 
 class RAGSystem:
     """Main RAG system combining document processing, embedding, and generation"""
     
-    def __init__(self, api_key: str = None):
-        self.document_processor = DocumentProcessor()
-        self.vector_store = VectorStore()
+    def __init__(self, api_key: str = None, query_cache: QueryCache = None, llm: LLMBackend = None,
+                 chunk_tokens: int = 200, max_chunk_tokens: int = 254, chunk_overlap: int = 32,
+                 embedding_processes: int = 0, reranker: Reranker = None, rerank_candidates: int = 20,
+                 top_k: int = 5, metrics: Metrics = None, vector_backend: str = "chroma",
+                 cpu_workers: int = None, document_registry: DocumentRegistry = None,
+                 context_builder: ContextBuilder = None,
+                 embedding_model: str = 'sentence-transformers/all-MiniLM-L6-v2',
+                 embedding_backend: str = "torch", embedding_export_dir: str = "./embedding_models",
+                 vector_store: VectorStore = None):
+        # Stage timings and counters of every component, see /metrics
+        self.metrics = metrics if metrics is not None else Metrics()
+        
+        # The embedding and vector_backend settings only apply to the default store
+        self.vector_store = vector_store if vector_store is not None else VectorStore(
+            model_name=embedding_model, embedding_processes=embedding_processes,
+            metrics=self.metrics, backend=vector_backend,
+            embedding_backend=embedding_backend,
+            embedding_export_dir=embedding_export_dir)
+        
+        # Size chunks in tokens of the embedding model so none get truncated
+        self.document_processor = DocumentProcessor(chunker=Chunker(
+            self.vector_store.count_tokens,
+            target_tokens=chunk_tokens,
+            max_tokens=max_chunk_tokens,
+            overlap_tokens=chunk_overlap
+        ), metrics=self.metrics)
+        self.query_cache = query_cache if query_cache is not None else QueryCache()
+        
+        # Chunk ids of every document, to update or delete it later
+        self.document_registry = document_registry if document_registry is not None else DocumentRegistry()
+        self._document_locks = {}
+        self._document_locks_lock = threading.Lock()
+        
+        # Optional second stage, over-fetches rerank_candidates chunks and keeps the best
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        if reranker is not None and reranker.count_tokens is None:
+            reranker.count_tokens = self.vector_store.count_tokens
+        self.top_k = top_k
         
-        # Setup OpenAI (if API key is provided)
-        # if api_key:
-        #     openai.api_key = api_key
         load_dotenv(override=True)
         
-        # Prioriser la clé API fournie en paramètre
-        api_key = api_key or os.getenv("HUGGINGFACEHUB_API_TOKEN")
-
-        # Vérification si la clé API est bien récupérée
-        if not api_key:
-            raise ValueError("Aucune clé API fournie. Définissez-la en paramètre ou dans le fichier .env.")
+        # Default to OpenAI, which validates the API key
+        self.llm = llm if llm is not None else OpenAIBackend(api_key=api_key)
+        
+        # Deduplicates the retrieved chunks and fits them in the prompt token budget, counted in LLM tokens
+        self.context_builder = context_builder if context_builder is not None else ContextBuilder()
+        if self.context_builder.count_tokens is None:
+            self.context_builder.count_tokens = self.count_context_tokens
+        
+        # Threads for the embedding and search work of the async methods, started on first use
+        self.cpu_workers = cpu_workers or os.cpu_count() or 4
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+    
+    def count_context_tokens(self, text: str) -> int:
+        """Number of LLM tokens in text, estimated from the embedding tokenizer when the LLM has none"""
+        tokens = self.llm.count_tokens(text)
+        if tokens is None:
+            tokens = math.ceil(self.vector_store.count_tokens(text) * CONTEXT_TOKEN_MARGIN)
+        return tokens
+    
+    def warmup(self, models_only: bool = False):
+        """Load models (and unless models_only, open the databases) ahead of the first request"""
+        self.vector_store.warmup(models_only=models_only)
+        if self.reranker is not None:
+            self.reranker.model
+        self.llm.warmup()
     
-    def add_document(self, file_path: str, metadata: Dict[str, Any] = None):
-        """Process and add a document to the system"""
-        # Process document into chunks
-        chunks = self.document_processor.process_document(file_path)
+    def add_document(self, file_path: str, metadata: Dict[str, Any] = None,
+                     progress: Callable[[str, int], None] = None, batch_size: int = 64,
+                     source: str = None, content: Content = None) -> int:
+        """Process and add a document to the system
         
-        # Prepare metadata for each chunk
-        if metadata is None:
-            metadata = {"source": os.path.basename(file_path)}
+        progress, if given, is called as progress(stage, count) with stage one
+        of "pages_parsed", "chunks_embedded" or "chunks_stored". The document
+        is registered under source, its file name by default: adding it again
+        replaces its chunks, see update_document. If content is given the
+        document is parsed from it, bytes or a binary file, and file_path is
+        only its name. Returns the number of chunks.
+        """
+        return self._index_document(file_path, metadata, progress, batch_size, source,
+                                    digest=file_hash(file_path if content is None else content),
+                                    incremental=False, content=content)["chunks"]
+    
+    def update_document(self, file_path: str, metadata: Dict[str, Any] = None,
+                        progress: Callable[[str, int], None] = None, batch_size: int = 64,
+                        source: str = None, content: Content = None) -> Dict[str, Any]:
+        """Re-index a document, only embedding and storing the chunks that changed
+        
+        A file with the content hash it was indexed from is not even parsed.
+        Otherwise chunks with new text are embedded and stored, chunks that
+        only moved (new page or offsets) are stored again with their cached
+        embedding, and chunks that are gone are deleted. Returns the number
+        of chunks of the document, of each kind, and whether it was skipped.
+        content is read instead of file_path as in add_document.
+        """
+        return self._index_document(file_path, metadata, progress, batch_size, source,
+                                    digest=file_hash(file_path if content is None else content), content=content)
+    
+    def delete_document(self, source: str) -> Optional[int]:
+        """Remove every chunk of a document, returns their number or None if it is not registered"""
+        with self._document_lock(source):
+            ids = self.document_registry.remove(source)
+            if ids is None:
+                return None
+            self.vector_store.delete(ids)
+        
+        # Cached answers may quote the deleted document
+        if ids:
+            self.query_cache.clear()
+        return len(ids)
+    
+    def _index_document(self, file_path: str, metadata: Dict[str, Any], progress: Callable[[str, int], None],
+                        batch_size: int, source: str, digest: str = None, incremental: bool = True,
+                        content: Content = None) -> Dict[str, Any]:
+        """Store the chunks of a document under source, only the changes if incremental
+        
+        digest, the content hash of the file, is registered with the document.
+        """
+        source = source or os.path.basename(file_path)
+        
+        with self._document_lock(source):
+            if incremental:
+                entry = self.document_registry.get(source)
+                if entry is not None and entry["file_hash"] == digest:
+                    return {"chunks": entry["chunks"], "added": 0, "updated": 0, "removed": 0,
+                            "unchanged": entry["chunks"], "skipped": True}
+            known = self.document_registry.chunks(source)
+            
+            # Stream chunks out of the document, pages are parsed while earlier
+            # batches are being embedded and stored
+            options = {} if content is None else {"content": content}
+            if progress is None:
+                chunks = self.document_processor.iter_chunks(file_path, **options)
+            else:
+                chunks = self.document_processor.iter_chunks(
+                    file_path, on_page=lambda count: progress("pages_parsed", count), **options
+                )
+            
+            # Prepare metadata for each chunk
+            if metadata is None:
+                metadata = {"source": source}
+            else:
+                metadata["source"] = source
+            
+            # Add to vector store batch by batch, chunk metadata holds page and offsets
+            counts = {"added": 0, "updated": 0, "unchanged": 0}
+            fingerprints = {}
+            with self.metrics.timer("ingest"):
+                batch, batch_metadata, batch_ids = [], [], []
+                written = []
+                try:
+                    for chunk, chunk_metadata in chunks:
+                        chunk_metadata = {**metadata, **chunk_metadata}
+                        doc_id = chunk_id(source, chunk)
+                        if doc_id in fingerprints:
+                            continue
+                        fingerprints[doc_id] = metadata_hash(chunk_metadata)
+                        if incremental and known.get(doc_id) == fingerprints[doc_id]:
+                            counts["unchanged"] += 1
+                            continue
+                        
+                        counts["updated" if doc_id in known else "added"] += 1
+                        batch.append(chunk)
+                        batch_metadata.append(chunk_metadata)
+                        batch_ids.append(doc_id)
+                        if len(batch) == batch_size:
+                            written.extend(batch_ids)
+                            self.vector_store.add_documents(batch, batch_metadata, progress=progress, ids=batch_ids)
+                            batch, batch_metadata, batch_ids = [], [], []
+                    if batch:
+                        written.extend(batch_ids)
+                        self.vector_store.add_documents(batch, batch_metadata, progress=progress, ids=batch_ids)
+                except Exception:
+                    # Drop the chunks this run added before failing, the registry still
+                    # describes the previous version of the document
+                    self.vector_store.delete([doc_id for doc_id in written if doc_id not in known])
+                    self.query_cache.clear()
+                    raise
+                
+                # Chunks of the previous version that are not in this one
+                removed = [doc_id for doc_id in known if doc_id not in fingerprints]
+                self.vector_store.delete(removed)
+                self.document_registry.put(source, os.path.abspath(file_path), digest, fingerprints)
+        self.metrics.inc("documents_ingested")
+        
+        # Cached answers may no longer reflect the collection
+        if counts["added"] or counts["updated"] or removed:
+            self.query_cache.clear()
+        
+        return {"chunks": len(fingerprints), **counts, "removed": len(removed), "skipped": False}
+    
+    def _document_lock(self, source: str) -> threading.Lock:
+        """Lock serializing the updates of one document"""
+        with self._document_locks_lock:
+            return self._document_locks.setdefault(source, threading.Lock())
+    
+    def ingest_directory(self, path: str, recursive: bool = True, num_workers: int = 4,
+                         metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Add every supported document under path, num_workers documents at a time
+        
+        Documents are parsed concurrently so their chunks are merged into
+        shared embedding batches. Every document is registered under its path
+        relative to path, as in sync_directory, so files with the same name in
+        different directories stay apart. Returns the number of files and
+        chunks added and the error of every file that failed.
+        """
+        root = os.path.abspath(path)
+        result = {"files": 0, "chunks": 0, "failed": {}}
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {
+                executor.submit(self.add_document, file_path, dict(metadata) if metadata else None,
+                                source=os.path.relpath(file_path, root).replace(os.sep, "/")): file_path
+                for file_path in self._list_documents(root, recursive)
+            }
+            for future in as_completed(futures):
+                try:
+                    result["chunks"] += future.result()
+                    result["files"] += 1
+                except Exception as e:
+                    result["failed"][futures[future]] = str(e)
+        
+        return result
+    
+    def sync_directory(self, path: str, recursive: bool = True, num_workers: int = 4,
+                       metadata: Dict[str, Any] = None, delete_missing: bool = True) -> Dict[str, Any]:
+        """Bring the indexes in line with the documents under path
+        
+        Every document is registered under its path relative to path and
+        re-indexed with update_document, so unchanged files are skipped and
+        edited ones only re-embed the chunks that changed. Unless
+        delete_missing is false, documents indexed from under path whose file
+        is gone are deleted. Returns the number of files and chunks of each
+        kind, the deleted sources and the error of every file that failed.
+        """
+        root = os.path.abspath(path)
+        result = {"files": 0, "skipped": 0, "chunks": 0, "added": 0, "updated": 0, "removed": 0,
+                  "unchanged": 0, "deleted": [], "failed": {}}
+        sources = set()
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {}
+            for file_path in self._list_documents(root, recursive):
+                source = os.path.relpath(file_path, root).replace(os.sep, "/")
+                sources.add(source)
+                futures[executor.submit(self.update_document, file_path,
+                                        dict(metadata) if metadata else None, source=source)] = file_path
+            for future in as_completed(futures):
+                try:
+                    changes = future.result()
+                except Exception as e:
+                    result["failed"][futures[future]] = str(e)
+                    continue
+                result["files"] += 1
+                result["skipped"] += changes["skipped"]
+                for key in ("chunks", "added", "updated", "removed", "unchanged"):
+                    result[key] += changes[key]
+        
+        if delete_missing:
+            for entry in self.document_registry.documents(path_prefix=root + os.sep):
+                if entry["source"] not in sources and not os.path.exists(entry["path"]):
+                    result["removed"] += self.delete_document(entry["source"]) or 0
+                    result["deleted"].append(entry["source"])
+        
+        return result
+    
+    @staticmethod
+    def _list_documents(path: str, recursive: bool) -> List[str]:
+        """Supported documents under path, sorted"""
+        if recursive:
+            file_paths = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
         else:
-            metadata["source"] = os.path.basename(file_path)
+            file_paths = [os.path.join(path, name) for name in os.listdir(path)]
+        return sorted(
+            file_path for file_path in file_paths
+            if os.path.splitext(file_path)[1].lower() in DocumentProcessor.supported_extensions
+        )
+    
+    def generate_response(self, query: str, timings: Dict[str, float] = None,
+                          history: List[Dict[str, str]] = None, where: Dict[str, Any] = None) -> str:
+        """Generate a response to the user query
+        
+        Answers are served from the query cache when the same or a
+        semantically similar question was answered since the last upload.
+        If timings is given it is filled with the duration of each stage in
+        milliseconds, the same stages that are recorded in self.metrics.
+        history is a list of earlier {'query', 'response'} turns of the
+        conversation, given to the LLM before the question. where restricts
+        retrieval to the chunks whose metadata matches it, see
+        VectorStore.search(). Answers that depend on history or where are
+        not cached.
+        """
+        if timings is None:
+            timings = {}
+        self.metrics.inc("queries")
+        with self.metrics.timer("total", timings):
+            return self._generate_response(query, timings, history, where)
+    
+    def _generate_response(self, query: str, timings: Dict[str, float],
+                           history: List[Dict[str, str]] = None, where: Dict[str, Any] = None) -> str:
+        cached, query_embedding, messages, unique_sources, generation = self._prepare(query, timings, history, where)
+        if cached is not None:
+            return cached
         
-        chunk_metadata = [metadata.copy() for _ in chunks]
+        # Generate response with the configured LLM backend
+        with self.metrics.timer("generation", timings):
+            answer = self.llm.generate(messages)
         
-        # Add to vector store
-        self.vector_store.add_documents(chunks, chunk_metadata)
+        return self._finish(query, query_embedding, answer, unique_sources, generation)
+    
+    async def agenerate_response(self, query: str, timings: Dict[str, float] = None,
+                                 history: List[Dict[str, str]] = None, where: Dict[str, Any] = None) -> str:
+        """generate_response() for asyncio servers
         
-        return len(chunks)
+        Embedding, retrieval and prompt building run in a thread of the CPU
+        executor and the LLM call is awaited, so the event loop keeps serving
+        other requests during both.
+        """
+        if timings is None:
+            timings = {}
+        self.metrics.inc("queries")
+        with self.metrics.timer("total", timings):
+            cached, query_embedding, messages, unique_sources, generation = await self._run_blocking(
+                self._prepare, query, timings, history, where
+            )
+            if cached is not None:
+                return cached
+            
+            with self.metrics.timer("generation", timings):
+                answer = await self.llm.agenerate(messages)
+            
+            return self._finish(query, query_embedding, answer, unique_sources, generation)
+    
+    async def aretrieve(self, query: str, query_embedding: List[float] = None,
+                        timings: Dict[str, float] = None, where: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Embed the query if needed and retrieve its documents, in the CPU executor"""
+        if timings is None:
+            timings = {}
+        if query_embedding is None:
+            with self.metrics.timer("embed", timings):
+                query_embedding = await self._run_blocking(self.vector_store.embed_query, query)
+        return await self._run_blocking(self._retrieve, query, query_embedding, timings, where)
     
-    def generate_response(self, query: str) -> str:
-        """Generate a response to the user query"""
+    def _prepare(self, query: str, timings: Dict[str, float], history: List[Dict[str, str]] = None,
+                 where: Dict[str, Any] = None):
+        """Everything before generation
+        
+        Returns (cached answer, None, None, None, None) on a cache hit, else
+        (None, query embedding, messages, unique sources, cache generation),
+        the generation being None when the answer must not be cached.
+        """
+        # The cache holds answers over the whole collection without history
+        cacheable = not history and where is None
+        cached = self.query_cache.get(query) if cacheable else None
+        if cached is not None:
+            self.metrics.inc("query_cache_hits")
+            return cached, None, None, None, None
+        
+        generation = self.query_cache.generation if cacheable else None
+        with self.metrics.timer("embed", timings):
+            query_embedding = self.vector_store.embed_query(query)
+        cached = self.query_cache.get_similar(query_embedding) if cacheable else None
+        if cached is not None:
+            self.metrics.inc("query_cache_hits")
+            return cached, None, None, None, None
+        
         # Retrieve relevant documents
-        relevant_docs = self.vector_store.search(query)
+        relevant_docs = self._retrieve(query, query_embedding, timings, where)
+        
+        with self.metrics.timer("prompt", timings):
+            messages, unique_sources = self._build_messages(query, relevant_docs, history)
+        
+        return None, query_embedding, messages, unique_sources, generation
+    
+    def _finish(self, query: str, query_embedding: List[float], answer: str, unique_sources: List[str],
+                generation: int) -> str:
+        """Append the sources to a generated answer and cache it unless generation is None"""
+        # Add sources if any were found
+        if unique_sources:
+            sources_text = "\n\nSources: " + ", ".join(unique_sources)
+            answer += sources_text
+        
+        if generation is not None:
+            self.query_cache.put(query, query_embedding, answer, generation=generation)
+        
+        return answer
+    
+    def _run_blocking(self, func: Callable, *args) -> asyncio.Future:
+        """Run func(*args) in the CPU executor, started on first use and again in a forked child"""
+        if self._executor_pid != os.getpid():
+            with self._executor_lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="rag-cpu")
+                    self._executor_pid = os.getpid()
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    def generate_responses(self, queries: List[str], max_concurrency: int = 8,
+                           timings: Dict[str, float] = None, where: Dict[str, Any] = None) -> List[str]:
+        """Answer several queries at once, in order
+        
+        Cached answers are reused and repeated questions answered once. The
+        other queries are embedded in one batch and retrieved with one index
+        query, then answered by up to max_concurrency concurrent LLM calls.
+        If timings is given it is filled with the duration of each batch
+        stage in milliseconds. where applies to every query and bypasses the
+        cache, as in generate_response().
+        """
+        if timings is None:
+            timings = {}
+        self.metrics.inc("queries", len(queries))
+        
+        with self.metrics.timer("batch_total", timings):
+            answers = [self.query_cache.get(query) if where is None else None for query in queries]
+            generation = self.query_cache.generation if where is None else None
+            
+            # One entry per distinct question that missed the exact cache
+            pending = {}
+            for i, answer in enumerate(answers):
+                if answer is None:
+                    pending.setdefault(QueryCache.normalize(queries[i]), []).append(i)
+            groups = list(pending.values())
+            
+            misses = []
+            if groups:
+                with self.metrics.timer("batch_embed", timings):
+                    embeddings = self.vector_store.embed_queries([queries[group[0]] for group in groups])
+                
+                for group, embedding in zip(groups, embeddings):
+                    cached = self.query_cache.get_similar(embedding) if where is None else None
+                    if cached is None:
+                        misses.append((group, embedding))
+                    for i in group:
+                        answers[i] = cached
+                
+                if misses:
+                    self._answer_batch(queries, misses, answers, generation, max_concurrency, timings, where)
+            
+            self.metrics.inc("query_cache_hits", len(queries) - sum(len(group) for group, _ in misses))
+        
+        return answers
+    
+    def _answer_batch(self, queries: List[str], misses, answers: List[str], generation: Optional[int],
+                      max_concurrency: int, timings: Dict[str, float], where: Dict[str, Any] = None):
+        """Retrieve and generate the answers of misses, a list of (query indices, embedding)
+        
+        Answers are cached unless generation is None.
+        """
+        batch_queries = [queries[group[0]] for group, _ in misses]
+        
+        top_k = self.rerank_candidates if self.reranker is not None else self.top_k
+        with self.metrics.timer("batch_retrieval", timings):
+            relevant_docs = self.vector_store.search_batch(
+                batch_queries, top_k=top_k, query_embeddings=[embedding for _, embedding in misses], where=where
+            )
+        if self.reranker is not None:
+            with self.metrics.timer("batch_rerank", timings):
+                relevant_docs = [self.reranker.rerank(query, docs) for query, docs in zip(batch_queries, relevant_docs)]
+        
+        prompts = [self._build_messages(query, docs) for query, docs in zip(batch_queries, relevant_docs)]
+        
+        # Concurrent calls, a BatchingBackend merges them into batched generations
+        with self.metrics.timer("batch_generation", timings):
+            with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(prompts)))) as executor:
+                generated = list(executor.map(self.llm.generate, [messages for messages, _ in prompts]))
+        
+        for (group, embedding), (_, unique_sources), answer, query in zip(misses, prompts, generated, batch_queries):
+            if unique_sources:
+                answer += "\n\nSources: " + ", ".join(unique_sources)
+            if generation is not None:
+                self.query_cache.put(query, embedding, answer, generation=generation)
+            for i in group:
+                answers[i] = answer
+    
+    def generate_response_stream(self, query: str, history: List[Dict[str, str]] = None,
+                                 where: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+        """Generate a response to the user query, yielding tokens as they arrive
+        
+        Yields {"type": "token", "content": ...} events followed by one
+        {"type": "done", "sources": [...], "timings": {...}} event, with
+        timings in milliseconds: the duration of the retrieval and rerank
+        stages, and first_token_ms and total_ms since the request started. A
+        cached answer is yielded as a single token that already contains its
+        sources line.
+        """
+        start = time.perf_counter()
+        self.metrics.inc("queries")
+        
+        timings = {}
+        cached, query_embedding, messages, unique_sources, generation = self._prepare(query, timings, history, where)
+        if cached is not None:
+            self.metrics.observe("total", time.perf_counter() - start)
+            yield {"type": "token", "content": cached}
+            yield {"type": "done", "sources": [], "cached": True,
+                   "timings": {"first_token_ms": elapsed_ms(start), "total_ms": elapsed_ms(start)}}
+            return
+        
+        # Stream response from the configured LLM backend
+        tokens = []
+        for token in self.llm.stream(messages):
+            if not tokens:
+                timings["first_token_ms"] = elapsed_ms(start)
+                self.metrics.observe("first_token", time.perf_counter() - start)
+            tokens.append(token)
+            yield {"type": "token", "content": token}
+        
+        timings["total_ms"] = elapsed_ms(start)
+        self.metrics.observe("total", time.perf_counter() - start)
+        self.metrics.inc("tokens_streamed", len(tokens))
+        
+        self._finish(query, query_embedding, "".join(tokens), unique_sources, generation)
+        
+        yield {"type": "done", "sources": unique_sources, "cached": False, "timings": timings}
+    
+    def _retrieve(self, query: str, query_embedding: List[float], timings: Dict[str, float],
+                  where: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Search the vector store, then rerank the over-fetched candidates if enabled"""
+        top_k = self.rerank_candidates if self.reranker is not None else self.top_k
+        with self.metrics.timer("retrieval", timings):
+            relevant_docs = self.vector_store.search(query, top_k=top_k, query_embedding=query_embedding,
+                                                     timings=timings, where=where)
+        
+        if self.reranker is not None:
+            with self.metrics.timer("rerank", timings):
+                relevant_docs = self.reranker.rerank(query, relevant_docs)
+        
+        return relevant_docs
+    
+    def _build_messages(self, query: str, relevant_docs: List[Dict[str, Any]],
+                        history: List[Dict[str, str]] = None):
+        """Build the chat messages for the LLM and the list of unique sources
+        
+        The chunks are packed by the context builder, its chunk and token
+        counts are added to the context_* counters of self.metrics.
+        """
+        relevant_docs, stats = self.context_builder.build(relevant_docs)
+        for name in ("context_chunks", "context_tokens", "context_duplicates", "context_trimmed"):
+            self.metrics.inc(name, stats[name])
         
         # Format context for the LLM
         context = "\n\n".join([doc["content"] for doc in relevant_docs])
@@ -186,20 +1154,15 @@ class RAGSystem:
         Answer in French language as it's the user's preferred language.
         """
         
-        # Generate response using OpenAI
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that answers questions based on the provided documents."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant that answers questions based on the provided documents."}
+        ]
         
-        answer = response.choices[0].message.content
+        # Earlier turns of the conversation, without their sources line
+        for turn in history or []:
+            messages.append({"role": "user", "content": turn["query"]})
+            messages.append({"role": "assistant", "content": turn["response"].split("\n\nSources: ")[0]})
         
-        # Add sources if any were found
-        if unique_sources:
-            sources_text = "\n\nSources: " + ", ".join(unique_sources)
-            answer += sources_text
+        messages.append({"role": "user", "content": prompt})
         
-        return answer
\ No newline at end of file
+        return messages, unique_sources
\ No newline at end of file
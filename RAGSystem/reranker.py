@@ -0,0 +1,69 @@
+import threading
+from typing import List, Dict, Any, Callable
+
+
+class Reranker:
+    """Rescores retrieved chunks against the query with a small CPU cross-encoder
+
+    Candidates are scored batch_size at a time in retrieval order. Once
+    enough chunks are kept, scoring stops at the first batch without any
+    chunk above score_threshold, so the effective candidate depth adapts to
+    how quickly relevance drops off. The chunks kept are the best scoring
+    ones above score_threshold, at most top_k and within token_budget.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+                 batch_size: int = 16, top_k: int = 5, score_threshold: float = None,
+                 token_budget: int = None, count_tokens: Callable[[str], int] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.top_k = top_k
+        self.score_threshold = score_threshold
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens
+
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The cross-encoder, loaded on first use"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the kept candidates, best first, each with a "score" added"""
+        scored = []
+        for start in range(0, len(candidates), self.batch_size):
+            batch = candidates[start:start + self.batch_size]
+            scores = self.model.predict([(query, doc["content"]) for doc in batch],
+                                        batch_size=self.batch_size)
+            batch_scored = [dict(doc, score=float(score)) for doc, score in zip(batch, scores)]
+            scored.extend(batch_scored)
+
+            # Stop digging once the deeper candidates stop being relevant
+            if self.score_threshold is not None and len(self._passing(scored)) >= self.top_k and \
+                    not self._passing(batch_scored):
+                break
+
+        scored.sort(key=lambda doc: doc["score"], reverse=True)
+
+        kept, tokens = [], 0
+        for doc in self._passing(scored):
+            if len(kept) == self.top_k:
+                break
+            doc_tokens = self.count_tokens(doc["content"]) if self.count_tokens else len(doc["content"].split())
+            if self.token_budget is not None and kept and tokens + doc_tokens > self.token_budget:
+                break
+            kept.append(doc)
+            tokens += doc_tokens
+        return kept
+
+    def _passing(self, scored: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.score_threshold is None:
+            return scored
+        return [doc for doc in scored if doc["score"] >= self.score_threshold]
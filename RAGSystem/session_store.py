@@ -0,0 +1,339 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from process_local import SQLiteConnection
+
+Turn = Dict[str, str]
+
+
+def now_string() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class SessionStore:
+    """Chat sessions, their recent turns and the uploaded files, with bounded size
+
+    At most max_sessions sessions are kept, the least recently active are
+    evicted first, and sessions idle for more than ttl seconds expire. Each
+    keeps its last max_turns turns ({'query', 'response', 'timestamp'}) and
+    at most max_files uploads are listed, so memory stays flat however long
+    the server runs. Listings are paginated with offset and limit.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 30 * 86400, max_turns: int = 100,
+                 max_files: int = 10000):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_files = max_files
+
+    def ensure(self, session_id: str):
+        """Create the session if it does not exist"""
+        raise NotImplementedError
+
+    def append(self, session_id: str, turns: List[Turn]):
+        """Add turns to the history of the session, creating it if needed"""
+        raise NotImplementedError
+
+    def history(self, session_id: str, offset: int = 0, limit: int = None) -> Optional[List[Turn]]:
+        """Turns of the session, oldest first, or None if there is no such session"""
+        raise NotImplementedError
+
+    def recent(self, session_id: str, n: int) -> List[Turn]:
+        """The last n turns of the session, oldest first"""
+        history = self.history(session_id) or []
+        return history[-n:] if n > 0 else []
+
+    def sessions(self, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """{'id', 'created_at', 'message_count'} of each session, most recently active first"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Number of live sessions"""
+        raise NotImplementedError
+
+    def message_count(self, session_id: str) -> int:
+        raise NotImplementedError
+
+    def add_file(self, file_info: Dict[str, Any]):
+        """Register an upload, file_info['stored_name'] identifies it"""
+        raise NotImplementedError
+
+    def update_file(self, stored_name: str, **fields):
+        raise NotImplementedError
+
+    def remove_file(self, stored_name: str):
+        raise NotImplementedError
+
+    def files(self, offset: int = 0, limit: int = None) -> List[Dict[str, Any]]:
+        """Uploads in the order they were added"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.history(session_id, limit=0) is not None
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in an LRU-ordered dict, lost on restart and private to the process"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # session_id -> {'created_at', 'last_active', 'history'}, least recently active first
+        self._sessions = OrderedDict()
+        self._files = OrderedDict()  # stored_name -> file info
+        self._lock = threading.Lock()
+
+    def ensure(self, session_id):
+        with self._lock:
+            self._touch(session_id)
+
+    def append(self, session_id, turns):
+        with self._lock:
+            self._touch(session_id)['history'].extend(turns)
+
+    def history(self, session_id, offset=0, limit=None):
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            stop = None if limit is None else offset + limit
+            return [dict(turn) for turn in list(session['history'])[offset:stop]]
+
+    def sessions(self, offset=0, limit=50):
+        with self._lock:
+            self._expire()
+            # Walk from the most recent end, only as far as the page
+            listing = []
+            for i, session_id in enumerate(reversed(self._sessions)):
+                if i >= offset + limit:
+                    break
+                if i >= offset:
+                    session = self._sessions[session_id]
+                    listing.append({
+                        'id': session_id,
+                        'created_at': session['created_at'],
+                        'message_count': len(session['history'])
+                    })
+            return listing
+
+    def count(self):
+        with self._lock:
+            self._expire()
+            return len(self._sessions)
+
+    def message_count(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return len(session['history']) if session is not None else 0
+
+    def add_file(self, file_info):
+        with self._lock:
+            self._files[file_info['stored_name']] = file_info
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+
+    def update_file(self, stored_name, **fields):
+        with self._lock:
+            if stored_name in self._files:
+                self._files[stored_name].update(fields)
+
+    def remove_file(self, stored_name):
+        with self._lock:
+            self._files.pop(stored_name, None)
+
+    def files(self, offset=0, limit=None):
+        with self._lock:
+            stop = None if limit is None else offset + limit
+            return [dict(info) for info in list(self._files.values())[offset:stop]]
+
+    def _touch(self, session_id):
+        """Return the session, created if needed and marked as the most recent (caller holds the lock)"""
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = {
+                'created_at': now_string(),
+                'history': deque(maxlen=self.max_turns)
+            }
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        session['last_active'] = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _expire(self):
+        """Drop idle sessions, they are all at the front (caller holds the lock)"""
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session['last_active'] >= cutoff:
+                break
+            del self._sessions[session_id]
+
+
+class SQLiteSessionStore(SQLiteConnection, SessionStore):
+    """Sessions in a SQLite file in WAL mode, kept across restarts and shared by worker processes"""
+
+    def __init__(self, path: str = "./sessions.db", **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        # Readers do not block the writer, and workers share the file
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, created_at TEXT NOT NULL, last_active REAL NOT NULL, "
+            "message_count INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active);"
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, turn TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, seq)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS files ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, stored_name TEXT UNIQUE NOT NULL, info TEXT NOT NULL);"
+        )
+        connection.commit()
+        return connection
+
+    def ensure(self, session_id):
+        with self._lock:
+            self._touch(session_id)
+            self._conn.commit()
+
+    def append(self, session_id, turns):
+        if not turns:
+            return self.ensure(session_id)
+        with self._lock:
+            self._touch(session_id)
+            last = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) FROM turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO turns (session_id, seq, turn) VALUES (?, ?, ?)",
+                [(session_id, last + 1 + i, json.dumps(turn)) for i, turn in enumerate(turns)]
+            )
+            # Keep the last max_turns turns
+            self._conn.execute("DELETE FROM turns WHERE session_id = ? AND seq <= ?",
+                               (session_id, last + len(turns) - self.max_turns))
+            self._conn.execute(
+                "UPDATE sessions SET message_count = (SELECT COUNT(*) FROM turns WHERE session_id = ?) WHERE id = ?",
+                (session_id, session_id)
+            )
+            self._conn.commit()
+
+    def history(self, session_id, offset=0, limit=None):
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT 1 FROM sessions WHERE id = ? AND last_active >= ?", (session_id, time.time() - self.ttl)
+            ).fetchone()
+            if found is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT turn FROM turns WHERE session_id = ? ORDER BY seq LIMIT ? OFFSET ?",
+                (session_id, -1 if limit is None else limit, offset)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def recent(self, session_id, n):
+        if n <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT turn FROM turns JOIN sessions ON sessions.id = turns.session_id "
+                "WHERE session_id = ? AND last_active >= ? ORDER BY seq DESC LIMIT ?",
+                (session_id, time.time() - self.ttl, n)
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def sessions(self, offset=0, limit=50):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, created_at, message_count FROM sessions WHERE last_active >= ? "
+                "ORDER BY last_active DESC LIMIT ? OFFSET ?",
+                (time.time() - self.ttl, limit, offset)
+            ).fetchall()
+        return [{'id': row[0], 'created_at': row[1], 'message_count': row[2]} for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE last_active >= ?", (time.time() - self.ttl,)
+            ).fetchone()[0]
+
+    def message_count(self, session_id):
+        with self._lock:
+            row = self._conn.execute("SELECT message_count FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def add_file(self, file_info):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO files (stored_name, info) VALUES (?, ?)",
+                               (file_info['stored_name'], json.dumps(file_info)))
+            self._conn.execute(
+                "DELETE FROM files WHERE seq <= (SELECT MAX(seq) FROM files) - ?", (self.max_files,)
+            )
+            self._conn.commit()
+
+    def update_file(self, stored_name, **fields):
+        with self._lock:
+            row = self._conn.execute("SELECT info FROM files WHERE stored_name = ?", (stored_name,)).fetchone()
+            if row is None:
+                return
+            info = json.loads(row[0])
+            info.update(fields)
+            self._conn.execute("UPDATE files SET info = ? WHERE stored_name = ?", (json.dumps(info), stored_name))
+            self._conn.commit()
+
+    def remove_file(self, stored_name):
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE stored_name = ?", (stored_name,))
+            self._conn.commit()
+
+    def files(self, offset=0, limit=None):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT info FROM files ORDER BY seq LIMIT ? OFFSET ?", (-1 if limit is None else limit, offset)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _touch(self, session_id):
+        """Create or refresh the session, evicting the expired and the least recently active (caller holds the lock)"""
+        now = time.time()
+        updated = self._conn.execute("UPDATE sessions SET last_active = ? WHERE id = ?", (now, session_id)).rowcount
+        if updated:
+            return
+        self._conn.execute("INSERT INTO sessions (id, created_at, last_active) VALUES (?, ?, ?)",
+                           (session_id, now_string(), now))
+
+        # Sessions are only added here, so this is the only place the bounds can be exceeded
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT id FROM sessions WHERE last_active < ? UNION "
+            "SELECT id FROM (SELECT id FROM sessions ORDER BY last_active DESC LIMIT -1 OFFSET ?)",
+            (now - self.ttl, self.max_sessions)
+        )]
+        if expired:
+            self._conn.executemany("DELETE FROM turns WHERE session_id = ?", [(sid,) for sid in expired])
+            self._conn.executemany("DELETE FROM sessions WHERE id = ?", [(sid,) for sid in expired])
+
+
+def create_session_store(name: str = "memory", path: str = None, **kwargs) -> SessionStore:
+    """Build a session store from its name ("memory" or "sqlite")"""
+    if name == "memory":
+        return MemorySessionStore(**kwargs)
+    elif name == "sqlite":
+        return SQLiteSessionStore(path or "./sessions.db", **kwargs)
+    else:
+        raise ValueError(f"Unknown session store: {name}")
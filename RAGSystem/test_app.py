@@ -1,7 +1,13 @@
+import io
 import unittest
 from unittest.mock import patch, MagicMock
 import os
+import tempfile
+import app as app_module
 from app import RAGSystem
+from ingestion import IngestionQueueFull
+from session_store import create_session_store
+from document_registry import DocumentRegistry, file_hash
 from rag_system import DocumentProcessor, VectorStore
 
 class TestDocumentProcessor(unittest.TestCase):
@@ -75,9 +81,9 @@ class TestRAGSystem(unittest.TestCase):
     def setUp(self, MockVectorStore):
         """Setup RAGSystem with mocks."""
         self.mock_vector_store = MockVectorStore.return_value
-        self.rag = RAGSystem(api_key="test-key")
+        self.rag = RAGSystem(api_key="test-key", document_registry=DocumentRegistry(":memory:"))
 
-    @patch.object(DocumentProcessor, "process_document", return_value=["Chunk 1", "Chunk 2"])
+    @patch.object(DocumentProcessor, "iter_chunks", return_value=iter([("Chunk 1", {"page": 1}), ("Chunk 2", {"page": 1})]))
     def test_add_document(self, mock_process_document):
         """Test adding a document."""
         num_chunks = self.rag.add_document("dummy.txt")
@@ -88,3 +94,330 @@ class TestRAGSystem(unittest.TestCase):
     def test_generate_response(self, mock_openai):
         """Test generating a response with OpenAI mock."""
         self.mock_vect
+
+
+class TestUploadRoutes(unittest.TestCase):
+
+    def setUp(self):
+        """Setup a test client with a mocked ingestion queue."""
+        self.client = app_module.app.test_client()
+        patcher = patch.object(app_module, "ingestion_queue")
+        self.mock_queue = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(app_module.rag, "document_registry", DocumentRegistry(":memory:"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_upload_returns_job(self):
+        """Test that uploads are queued and return a job id right away."""
+        self.mock_queue.submit.return_value = MagicMock(id="job-1", status="queued")
+        with patch("werkzeug.datastructures.FileStorage.save"), patch("app.os.path.getsize", return_value=10):
+            response = self.client.post("/upload", data={"file": (io.BytesIO(b"Hello"), "hello.txt")})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()["job_id"], "job-1")
+
+    def test_upload_queue_full(self):
+        """Test backpressure when the ingestion queue is full."""
+        self.mock_queue.submit.side_effect = IngestionQueueFull("Ingestion queue is full, retry later")
+        with patch("werkzeug.datastructures.FileStorage.save"), patch("app.os.path.getsize", return_value=10), \
+                patch("app.os.remove"):
+            response = self.client.post("/upload", data={"file": (io.BytesIO(b"Hello"), "hello.txt")})
+        self.assertEqual(response.status_code, 429)
+
+    def test_upload_is_parsed_from_memory(self):
+        """Test that uploads reach the job as bytes and are only written once indexed."""
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(app_module.app.config, {"UPLOAD_FOLDER": tmp}):
+            self.mock_queue.submit.return_value = MagicMock(id="job-1", status="queued")
+            response = self.client.post("/upload", data={"file": (io.BytesIO(b"Hello"), "hello.txt")})
+            self.assertEqual(response.status_code, 202)
+            file_path = self.mock_queue.submit.call_args.args[0]
+            self.assertEqual(self.mock_queue.submit.call_args.kwargs["content"], b"Hello")
+            self.assertFalse(os.path.exists(file_path))
+
+            self.mock_queue.submit.call_args.kwargs["on_done"](MagicMock(status="completed", chunks=1))
+            with open(file_path, "rb") as f:
+                self.assertEqual(f.read(), b"Hello")
+
+    def test_large_upload_spills_to_temporary_file(self):
+        """Test that large uploads are handed over as a temporary file removed once released."""
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(app_module.app.config, {
+                "UPLOAD_FOLDER": tmp, "UPLOAD_SPOOL_SIZE": 10, "UPLOAD_TMP_DIR": tmp, "PERSIST_UPLOADS": False}):
+            self.mock_queue.submit.return_value = MagicMock(id="job-1", status="queued")
+            response = self.client.post("/upload", data={"file": (io.BytesIO(b"Hello" * 100), "hello.txt")})
+            self.assertEqual(response.status_code, 202)
+            content = self.mock_queue.submit.call_args.kwargs["content"]
+            self.assertEqual(content.read(), b"Hello" * 100)
+            self.assertEqual(os.listdir(tmp), [os.path.basename(content.name)])
+
+            self.mock_queue.submit.call_args.kwargs["on_done"](MagicMock(status="completed", chunks=1))
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_rejected_upload_leaves_no_temporary_file(self):
+        """Test that spilled uploads no route took over are removed."""
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(app_module.app.config, {
+                "UPLOAD_SPOOL_SIZE": 10, "UPLOAD_TMP_DIR": tmp}):
+            response = self.client.post("/upload", data={"file": (io.BytesIO(b"Hello" * 100), "hello.exe")})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_same_upload_is_indexed_once(self):
+        """Test that uploading a file again does not index its chunks a second time."""
+        with tempfile.TemporaryDirectory() as tmp, patch.dict(app_module.app.config, {"UPLOAD_FOLDER": tmp}), \
+                patch.object(app_module.rag, "document_processor") as mock_processor, \
+                patch.object(app_module.rag, "vector_store") as mock_vector_store:
+            mock_processor.iter_chunks.side_effect = lambda file_path, content: iter([(content.decode(), {})])
+
+            def submit(file_path, metadata, filename, on_done, content):
+                chunks = app_module.rag.add_document(file_path, metadata, content=content)
+                on_done(MagicMock(status="completed", chunks=chunks))
+                return MagicMock(id="job-1", status="completed")
+            self.mock_queue.submit.side_effect = submit
+
+            first = self.client.post("/upload", data={"file": (io.BytesIO(b"Hello"), "hello.txt")})
+            second = self.client.post("/upload", data={"file": (io.BytesIO(b"Hello"), "hello.txt")})
+            self.assertEqual(first.status_code, 202)
+            self.assertEqual(second.status_code, 200)
+            self.assertEqual(second.get_json()["status"], "duplicate")
+            self.assertEqual(self.mock_queue.submit.call_count, 1)
+            self.assertEqual(len(app_module.rag.document_registry), 1)
+            self.assertEqual(mock_vector_store.add_documents.call_count, 1)
+            self.assertEqual(len(os.listdir(tmp)), 1)
+
+    def test_duplicate_upload_response(self):
+        """Test that a duplicate answers with the indexed document and no job to poll."""
+        app_module.rag.document_registry.put("abc_hello.txt", "/uploads/abc_hello.txt", file_hash(b"Hello"),
+                                             {"c1": "m1", "c2": "m2"})
+        response = self.client.post("/upload", data={"file": (io.BytesIO(b"Hello"), "hello.txt")})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"success": True, "filename": "hello.txt", "source": "abc_hello.txt",
+                                               "chunks": 2, "status": "duplicate"})
+        self.mock_queue.submit.assert_not_called()
+
+    def test_jobs_do_not_load_the_embedding_model(self):
+        """Test that listing jobs reports no embedding stats rather than starting the embedding service."""
+        self.mock_queue.pending.return_value = 0
+        self.mock_queue.list_jobs.return_value = []
+        with patch.object(app_module.rag.vector_store, "embedding_cache") as mock_cache, \
+                patch.object(app_module.rag.vector_store, "_embedding_service", None), \
+                patch("rag_system.create_embedder") as mock_create_embedder:
+            mock_cache.stats.return_value = {"hits": 0}
+            response = self.client.get("/jobs")
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.get_json()["embedding_service"])
+            self.assertIsNone(app_module.rag.vector_store._embedding_service)
+        mock_create_embedder.assert_not_called()
+
+    def test_unknown_job(self):
+        """Test job lookup for an unknown id."""
+        self.mock_queue.get_job.return_value = None
+        response = self.client.get("/jobs/missing")
+        self.assertEqual(response.status_code, 404)
+
+
+class TestChatStreamRoute(unittest.TestCase):
+
+    def setUp(self):
+        """Setup a test client with a mocked RAG system."""
+        self.client = app_module.app.test_client()
+        patcher = patch.object(app_module, "rag")
+        self.mock_rag = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_chat_stream(self):
+        """Test that tokens are sent as Server-Sent Events."""
+        self.mock_rag.generate_response_stream.return_value = iter([
+            {"type": "token", "content": "Bon"},
+            {"type": "token", "content": "jour"},
+            {"type": "done", "sources": ["a.txt"], "cached": False, "timings": {"total_ms": 1.0}}
+        ])
+        response = self.client.post("/chat/stream", json={"query": "Hello", "session_id": "s1"})
+        body = response.get_data(as_text=True)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertIn('event: token\ndata: {"content": "Bon"}', body)
+        self.assertIn("event: done", body)
+        self.assertEqual(app_module.session_store.recent("s1", 1)[0]["response"], "Bonjour\n\nSources: a.txt")
+
+    def test_chat_stream_requires_query(self):
+        """Test that a query is required."""
+        response = self.client.post("/chat/stream", json={})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestMetricsRoute(unittest.TestCase):
+
+    def setUp(self):
+        """Setup a test client with a mocked RAG system."""
+        self.client = app_module.app.test_client()
+        patcher = patch.object(app_module, "rag")
+        self.mock_rag = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_metrics(self):
+        """Test that metrics are served in the Prometheus text format."""
+        self.mock_rag.metrics.render.return_value = "rag_queries_total 1\n"
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/plain")
+        self.assertIn("rag_queries_total 1", response.get_data(as_text=True))
+
+    def test_chat_timings(self):
+        """Test that the timing breakdown is only returned when asked for."""
+        def generate_response(query, timings, history=None, where=None):
+            timings["total_ms"] = 12.5
+            return "Bonjour"
+        self.mock_rag.generate_response.side_effect = generate_response
+        response = self.client.post("/chat", json={"query": "Hello", "timings": True})
+        self.assertEqual(response.get_json()["timings"], {"total_ms": 12.5})
+        response = self.client.post("/chat", json={"query": "Hello"})
+        self.assertNotIn("timings", response.get_json())
+
+    def test_chat_filter(self):
+        """Test that sources and filters scope the retrieval, and bad ones are rejected."""
+        self.mock_rag.generate_response.return_value = "Bonjour"
+        response = self.client.post("/chat", json={"query": "Hello", "sources": ["a.txt"],
+                                                   "filter": {"page": {"$lte": 3}}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.mock_rag.generate_response.call_args.kwargs["where"],
+                         {"$and": [{"page": {"$lte": 3}}, {"source": {"$in": ["a.txt"]}}]})
+        for body in ({"query": "Hello", "sources": "a.txt"}, {"query": "Hello", "filter": {"page": {"$near": 3}}},
+                     {"query": "Hello", "filter": {'page") OR ("': 3}}):
+            self.assertEqual(self.client.post("/chat", json=body).status_code, 400)
+        self.assertEqual(self.mock_rag.generate_response.call_count, 1)
+
+
+class TestDocumentRoutes(unittest.TestCase):
+
+    def setUp(self):
+        """Setup a test client with a mocked RAG system over an in-memory registry."""
+        self.client = app_module.app.test_client()
+        patcher = patch.object(app_module, "rag")
+        self.mock_rag = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(app_module, "ingestion_queue")
+        self.mock_queue = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_rag.document_registry = DocumentRegistry(":memory:")
+        upload = os.path.join(app_module.app.config['UPLOAD_FOLDER'], "abc_doc.txt")
+        self.mock_rag.document_registry.put("abc_doc.txt", os.path.abspath(upload), "hash", {"c1": "m1"})
+        self.mock_rag.document_registry.put("docs/other.txt", "/elsewhere/other.txt", "hash", {"c2": "m2"})
+
+    def test_documents_are_listed(self):
+        """Test that registered documents are listed with the total."""
+        data = self.client.get("/documents?limit=1").get_json()
+        self.assertEqual([doc["source"] for doc in data["documents"]], ["abc_doc.txt"])
+        self.assertEqual(data["total"], 2)
+
+    def test_delete_document(self):
+        """Test that deleting removes the chunks, and unknown sources are 404."""
+        self.mock_rag.delete_document.return_value = 1
+        with patch("app.os.path.exists", return_value=True), patch("app.os.remove") as mock_remove:
+            response = self.client.delete("/documents/abc_doc.txt")
+        self.assertEqual(response.get_json()["chunks_removed"], 1)
+        mock_remove.assert_called_once()
+
+        self.mock_rag.delete_document.return_value = None
+        self.assertEqual(self.client.delete("/documents/missing.txt").status_code, 404)
+
+    def test_update_document(self):
+        """Test that replacing an upload queues an update job."""
+        self.mock_queue.submit.return_value = MagicMock(id="job-2", status="queued")
+        with patch("werkzeug.datastructures.FileStorage.save"), patch("app.os.replace"), \
+                patch("app.os.path.getsize", return_value=10):
+            response = self.client.put("/documents/abc_doc.txt", data={"file": (io.BytesIO(b"New"), "doc.txt")})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.mock_queue.submit.call_args.kwargs["mode"], "update")
+        self.assertEqual(self.mock_queue.submit.call_args.kwargs["source"], "abc_doc.txt")
+
+    def test_update_rejects_documents_outside_uploads(self):
+        """Test that only uploaded documents can be replaced."""
+        response = self.client.put("/documents/docs/other.txt", data={"file": (io.BytesIO(b"New"), "other.txt")})
+        self.assertEqual(response.status_code, 400)
+        self.mock_queue.submit.assert_not_called()
+
+    def test_sync_requires_directory(self):
+        """Test that syncing is only available with SYNC_DIRECTORY."""
+        with patch.dict(app_module.app.config, {"SYNC_DIRECTORY": None}):
+            self.assertEqual(self.client.post("/documents/sync").status_code, 404)
+        self.mock_queue.submit.return_value = MagicMock(id="job-3", status="queued")
+        with patch.dict(app_module.app.config, {"SYNC_DIRECTORY": "."}):
+            response = self.client.post("/documents/sync", json={"delete_missing": False})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()["job_id"], "job-3")
+        self.mock_queue.submit.assert_called_once_with(".", mode="sync", delete_missing=False)
+        self.mock_rag.sync_directory.assert_not_called()
+
+    def test_sync_validates_delete_missing(self):
+        """Test that delete_missing must be a JSON boolean, and a full queue is 429."""
+        with patch.dict(app_module.app.config, {"SYNC_DIRECTORY": "."}):
+            response = self.client.post("/documents/sync", json={"delete_missing": "false"})
+            self.assertEqual(response.status_code, 400)
+            self.mock_queue.submit.assert_not_called()
+
+            self.mock_queue.submit.side_effect = IngestionQueueFull("Ingestion queue is full, retry later")
+            self.assertEqual(self.client.post("/documents/sync").status_code, 429)
+
+
+class TestSessionRoutes(unittest.TestCase):
+
+    def setUp(self):
+        """Setup a test client with a mocked RAG system and an empty session store."""
+        self.client = app_module.app.test_client()
+        patcher = patch.object(app_module, "rag")
+        self.mock_rag = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(app_module, "session_store", create_session_store("memory"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_rag.generate_response.return_value = "Bonjour"
+
+    def test_history_is_paginated(self):
+        """Test that history pages are returned oldest first with the total."""
+        for i in range(5):
+            self.client.post("/chat", json={"query": f"Q{i}", "session_id": "s1"})
+        data = self.client.get("/history/s1?offset=1&limit=2").get_json()
+        self.assertEqual([turn["query"] for turn in data["history"]], ["Q1", "Q2"])
+        self.assertEqual(data["total"], 5)
+        self.assertEqual(self.client.get("/history/unknown").status_code, 404)
+
+    def test_sessions_are_paginated(self):
+        """Test that sessions are listed most recently active first."""
+        for session_id in ("a", "b", "c"):
+            self.client.post("/chat", json={"query": "Hello", "session_id": session_id})
+        data = self.client.get("/sessions?limit=2").get_json()
+        self.assertEqual([session["id"] for session in data["sessions"]], ["c", "b"])
+        self.assertEqual(data["total"], 3)
+
+    def test_recent_turns_are_given_to_the_llm(self):
+        """Test that the configured window of earlier turns is passed with the query."""
+        with patch.dict(app_module.app.config, {"CHAT_HISTORY_TURNS": 2}):
+            for i in range(3):
+                self.client.post("/chat", json={"query": f"Q{i}", "session_id": "s1"})
+        history = self.mock_rag.generate_response.call_args.kwargs["history"]
+        self.assertEqual([turn["query"] for turn in history], ["Q0", "Q1"])
+
+
+class TestChatBatchRoute(unittest.TestCase):
+
+    def setUp(self):
+        """Setup a test client with a mocked RAG system."""
+        self.client = app_module.app.test_client()
+        patcher = patch.object(app_module, "rag")
+        self.mock_rag = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_chat_batch(self):
+        """Test that every query gets its answer and its history entry."""
+        self.mock_rag.generate_responses.return_value = ["Un", "Deux"]
+        response = self.client.post("/chat/batch", json={"queries": ["One?", "Two?"]})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data["responses"], ["Un", "Deux"])
+        history = self.client.get(f"/history/{data['session_id']}").get_json()["history"]
+        self.assertEqual([entry["query"] for entry in history], ["One?", "Two?"])
+
+    def test_chat_batch_invalid(self):
+        """Test that empty, malformed and oversized batches are rejected."""
+        for body in ({}, {"queries": []}, {"queries": "One?"},
+                     {"queries": ["?"] * (app_module.app.config["CHAT_BATCH_MAX"] + 1)}):
+            self.assertEqual(self.client.post("/chat/batch", json=body).status_code, 400)
+        self.mock_rag.generate_responses.assert_not_called()
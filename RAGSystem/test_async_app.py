@@ -0,0 +1,65 @@
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+import async_app
+
+
+class TestAsyncChat(AioHTTPTestCase):
+
+    async def get_application(self):
+        """Serve the async routes with a mocked RAG system."""
+        self.mock_rag = MagicMock()
+        self.mock_rag.agenerate_response = AsyncMock(return_value="Bonjour")
+        return async_app.create_app(self.mock_rag)
+
+    async def test_chat(self):
+        """Test that the answer is awaited and stored in the session history."""
+        response = await self.client.post("/chat", json={"query": "Hello"})
+        self.assertEqual(response.status, 200)
+        data = await response.json()
+        self.assertEqual(data["response"], "Bonjour")
+        self.assertNotIn("timings", data)
+
+        response = await self.client.get(f"/history/{data['session_id']}")
+        history = (await response.json())["history"]
+        self.assertEqual([entry["query"] for entry in history], ["Hello"])
+
+    async def test_session_store_runs_off_the_loop(self):
+        """Test that the blocking session store calls are not made on the event loop thread."""
+        threads = []
+        session_store = MagicMock()
+        session_store.ensure.side_effect = lambda session_id: threads.append(threading.current_thread())
+        session_store.recent.return_value = []
+        with patch.object(async_app.flask_app, "session_store", session_store):
+            response = await self.client.post("/chat", json={"query": "Hello"})
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(threads, [])
+        self.assertIsNot(threads[0], threading.current_thread())
+        session_store.append.assert_called_once()
+
+    async def test_chat_requires_query(self):
+        """Test that a request without a query is rejected."""
+        response = await self.client.post("/chat", json={})
+        self.assertEqual(response.status, 400)
+        self.mock_rag.agenerate_response.assert_not_called()
+
+    async def test_chat_error(self):
+        """Test that a failing answer is reported as a server error."""
+        self.mock_rag.agenerate_response.side_effect = RuntimeError("LLM down")
+        response = await self.client.post("/chat", json={"query": "Hello"})
+        self.assertEqual(response.status, 500)
+        self.assertEqual((await response.json())["error"], "LLM down")
+
+    async def test_metrics(self):
+        """Test that metrics are served in the Prometheus text format."""
+        self.mock_rag.metrics.render.return_value = "rag_queries_total 1\n"
+        response = await self.client.get("/metrics")
+        self.assertEqual(response.content_type, "text/plain")
+        self.assertIn("rag_queries_total 1", await response.text())
+
+
+if __name__ == "__main__":
+    unittest.main()
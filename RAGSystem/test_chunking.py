@@ -0,0 +1,51 @@
+import unittest
+from chunking import Chunker, is_heading
+
+def count_words(text):
+    """Whitespace tokenizer standing in for the embedding tokenizer"""
+    return len(text.split())
+
+class TestChunker(unittest.TestCase):
+    """Tests for Chunker"""
+
+    def chunk(self, text, page=1, **kwargs):
+        return list(Chunker(count_words, **kwargs).chunk([(page, 0, text)]))
+
+    def test_sentences_are_grouped_up_to_target(self):
+        """Test that sentences are kept whole and grouped to the target size"""
+        chunks = self.chunk("One two three. Four five six. Seven eight nine.",
+                            target_tokens=6, max_tokens=8, overlap_tokens=0)
+        self.assertEqual([text for text, _ in chunks], ["One two three. Four five six.", "Seven eight nine."])
+
+    def test_overlap(self):
+        """Test that trailing sentences are repeated in the next chunk"""
+        chunks = self.chunk("One two three. Four five six. Seven eight nine.",
+                            target_tokens=6, max_tokens=8, overlap_tokens=3)
+        self.assertEqual([text for text, _ in chunks],
+                         ["One two three. Four five six.", "Four five six. Seven eight nine."])
+
+    def test_long_sentence_is_split(self):
+        """Test that no chunk exceeds max_tokens"""
+        chunks = self.chunk(" ".join(["word"] * 25) + ".", target_tokens=8, max_tokens=10, overlap_tokens=2)
+        self.assertEqual([meta["tokens"] for _, meta in chunks], [10, 10, 5])
+
+    def test_heading_starts_chunk(self):
+        """Test that headings are not merged into the previous chunk"""
+        chunks = self.chunk("Some intro text here.\n\n2.1 Methods\n\nWe did things.",
+                            target_tokens=50, max_tokens=60, overlap_tokens=5)
+        self.assertEqual([text for text, _ in chunks], ["Some intro text here.", "2.1 Methods\n\nWe did things."])
+
+    def test_offsets(self):
+        """Test that chunks carry page and char offsets"""
+        chunker = Chunker(count_words, target_tokens=3, max_tokens=4, overlap_tokens=0)
+        chunks = list(chunker.chunk([(1, 0, "Alpha beta gamma."), (2, 0, "Delta epsilon zeta.")]))
+        self.assertEqual(chunks[1][1], {"page": 2, "page_end": 2, "char_start": 0, "char_end": 19, "tokens": 3})
+
+    def test_is_heading(self):
+        """Test heading detection"""
+        self.assertTrue(is_heading("Introduction"))
+        self.assertTrue(is_heading("# Results"))
+        self.assertFalse(is_heading("This is a full sentence."))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from context_builder import ContextBuilder
+
+def doc(content, source="a.txt", **fields):
+    return {"content": content, "metadata": {"source": source}, **fields}
+
+PARAGRAPH = "The quarterly report shows revenue growth in every region, driven by the new subscription plans"
+
+class TestContextBuilder(unittest.TestCase):
+    """Tests for ContextBuilder"""
+
+    def test_drops_near_duplicates(self):
+        """Test that repeated and overlapping chunks are kept once"""
+        builder = ContextBuilder()
+        docs = [doc(PARAGRAPH), doc(PARAGRAPH, source="b.txt"), doc(PARAGRAPH + " and lower churn."),
+                doc("Unrelated text about the office move next spring")]
+        kept, stats = builder.build(docs)
+        self.assertEqual([d["content"] for d in kept], [PARAGRAPH, docs[3]["content"]])
+        self.assertEqual((stats["context_duplicates"], stats["context_chunks"]), (2, 2))
+
+    def test_orders_by_score(self):
+        """Test that reranked chunks are packed best first"""
+        kept, _ = ContextBuilder().build([doc("first chunk", score=0.1), doc("second chunk", score=0.9)])
+        self.assertEqual([d["content"] for d in kept], ["second chunk", "first chunk"])
+
+    def test_token_budget(self):
+        """Test that chunks over the budget are skipped and shorter ones still packed"""
+        builder = ContextBuilder(token_budget=6, count_tokens=lambda text: len(text.split()))
+        docs = [doc("one two three four"), doc("five six seven eight"), doc("nine ten")]
+        kept, stats = builder.build(docs)
+        self.assertEqual([d["content"] for d in kept], ["one two three four", "nine ten"])
+        self.assertEqual((stats["context_tokens"], stats["context_trimmed"]), (6, 1))
+
+    def test_keeps_first_chunk_over_budget(self):
+        """Test that the best chunk is kept even if it alone exceeds the budget"""
+        kept, stats = ContextBuilder(token_budget=1).build([doc("too long for it"), doc("x")])
+        self.assertEqual([d["content"] for d in kept], ["too long for it"])
+
+    def test_short_and_empty_chunks(self):
+        """Test signatures of chunks shorter than a shingle"""
+        builder = ContextBuilder()
+        kept, _ = builder.build([doc("Paris"), doc("Lyon"), doc("")])
+        self.assertEqual(len(kept), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from document_registry import DocumentRegistry, chunk_id, file_hash, metadata_hash
+
+class TestDocumentRegistry(unittest.TestCase):
+    """Tests for DocumentRegistry"""
+
+    def setUp(self):
+        """Set up a registry in a temporary database"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "registry.db")
+        self.registry = DocumentRegistry(self.path)
+        self.addCleanup(self.registry.close)
+
+    def test_put_and_get(self):
+        """Test that a document is registered with its chunks"""
+        self.registry.put("a.txt", "/docs/a.txt", "hash-a", {"c1": "m1", "c2": "m2"})
+        entry = self.registry.get("a.txt")
+        self.assertEqual((entry["path"], entry["file_hash"], entry["chunks"]), ("/docs/a.txt", "hash-a", 2))
+        self.assertEqual(self.registry.chunks("a.txt"), {"c1": "m1", "c2": "m2"})
+        self.assertIsNone(self.registry.get("b.txt"))
+        self.assertEqual(self.registry.chunks("b.txt"), {})
+
+    def test_put_replaces_chunks(self):
+        """Test that registering a document again replaces its chunks"""
+        self.registry.put("a.txt", "/docs/a.txt", "hash-a", {"c1": "m1", "c2": "m2"})
+        self.registry.put("a.txt", "/docs/a.txt", "hash-b", {"c2": "m3"})
+        self.assertEqual(self.registry.chunks("a.txt"), {"c2": "m3"})
+        self.assertEqual(self.registry.get("a.txt")["file_hash"], "hash-b")
+        self.assertEqual(len(self.registry), 1)
+
+    def test_remove(self):
+        """Test that removing a document returns its chunk ids"""
+        self.registry.put("a.txt", "/docs/a.txt", None, {"c1": "m1"})
+        self.assertEqual(self.registry.remove("a.txt"), ["c1"])
+        self.assertIsNone(self.registry.remove("a.txt"))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_documents_by_path_prefix(self):
+        """Test listing documents, paginated and under a directory"""
+        self.registry.put("a.txt", "/docs/a.txt", None, {})
+        self.registry.put("b.txt", "/docs_100%/b.txt", None, {})
+        self.registry.put("c.txt", "/docs/sub/c.txt", None, {})
+        self.assertEqual([d["source"] for d in self.registry.documents()], ["a.txt", "b.txt", "c.txt"])
+        self.assertEqual([d["source"] for d in self.registry.documents(offset=1, limit=1)], ["b.txt"])
+        self.assertEqual([d["source"] for d in self.registry.documents(path_prefix="/docs/")], ["a.txt", "c.txt"])
+
+    def test_persists(self):
+        """Test that documents survive reopening the database"""
+        self.registry.put("a.txt", "/docs/a.txt", "hash-a", {"c1": "m1"})
+        self.registry.close()
+        registry = DocumentRegistry(self.path)
+        self.addCleanup(registry.close)
+        self.assertEqual(registry.chunks("a.txt"), {"c1": "m1"})
+
+    def test_hashes(self):
+        """Test chunk ids, metadata and file fingerprints"""
+        self.assertNotEqual(chunk_id("a.txt", "text"), chunk_id("b.txt", "text"))
+        self.assertEqual(chunk_id("a.txt", "text"), chunk_id("a.txt", "text"))
+        self.assertEqual(metadata_hash({"a": 1, "b": 2}), metadata_hash({"b": 2, "a": 1}))
+        self.assertNotEqual(metadata_hash({"page": 1}), metadata_hash({"page": 2}))
+
+        path = os.path.join(self.tmp.name, "a.txt")
+        with open(path, "wb") as f:
+            f.write(b"content")
+        digest = file_hash(path, block_size=3)
+        with open(path, "wb") as f:
+            f.write(b"changed")
+        self.assertNotEqual(file_hash(path), digest)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from embedding_backends import ONNXEmbedder, create_embedder, export_path
+
+WORDS = "the a of to and in is it for on how do i reset my password error code printer network invoice".split()
+
+def tiny_model(path):
+    """A randomly initialized two layer BERT as a sentence-transformers model, nothing downloaded"""
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS
+    BertModel(BertConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=4,
+                         intermediate_size=64)).save_pretrained(os.path.join(path, "bert"))
+    BertTokenizerFast(vocab={word: i for i, word in enumerate(vocab)}).save_pretrained(os.path.join(path, "bert"))
+    transformer = models.Transformer(os.path.join(path, "bert"), max_seq_length=64)
+    SentenceTransformer(modules=[transformer, models.Pooling(32, "mean"), models.Normalize()],
+                        device="cpu").save(os.path.join(path, "model"))
+    return os.path.join(path, "model")
+
+class TestONNXEmbedder(unittest.TestCase):
+    """Tests for the ONNX embedding backends"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Export a tiny model once for every test"""
+        from sentence_transformers import SentenceTransformer
+
+        cls.tmp = tempfile.mkdtemp()
+        cls.model_name = tiny_model(cls.tmp)
+        cls.export_dir = os.path.join(cls.tmp, "exports")
+        cls.texts = [" ".join(WORDS[i % 7:i % 7 + 1 + i % 11]) for i in range(40)] + ["unknown words only"]
+        cls.expected = SentenceTransformer(cls.model_name, device="cpu").encode(cls.texts)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def test_onnx_matches_torch(self):
+        """Test that the export gives the embeddings of the original model, in order"""
+        embedder = create_embedder("onnx", self.model_name, export_dir=self.export_dir)
+        self.assertIsInstance(embedder, ONNXEmbedder)
+        embeddings = embedder.encode(self.texts, batch_size=8)
+        self.assertEqual(embeddings.dtype, np.float32)
+        np.testing.assert_allclose(embeddings, self.expected, atol=1e-5)
+        np.testing.assert_allclose(embedder.encode(self.texts[3]), self.expected[3], atol=1e-5)
+        self.assertEqual(embedder.get_sentence_embedding_dimension(), 32)
+        self.assertEqual(embedder.tokenizer.encode("reset password", add_special_tokens=False), [5 + WORDS.index("reset"), 5 + WORDS.index("password")])
+
+    def test_int8_is_close_to_torch(self):
+        """Test that the quantized export keeps the embeddings nearly unchanged"""
+        embedder = create_embedder("onnx-int8", self.model_name, export_dir=self.export_dir)
+        cosines = (embedder.encode(self.texts) * self.expected).sum(axis=1)
+        self.assertGreater(cosines.min(), 0.98)
+        files = os.listdir(export_path(self.model_name, self.export_dir))
+        self.assertTrue({"model.onnx", "model.int8.onnx", "embedding_config.json"} <= set(files))
+        self.assertFalse([name for name in files if name.endswith(".tmp")])
+
+    def test_export_is_reused(self):
+        """Test that an existing export is loaded without exporting again"""
+        create_embedder("onnx", self.model_name, export_dir=self.export_dir)
+        with patch("embedding_backends.export_onnx") as mock_export:
+            create_embedder("onnx", self.model_name, export_dir=self.export_dir)
+        mock_export.assert_not_called()
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_embedder("tensorrt", self.model_name)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from embedding_cache import EmbeddingCache, content_hash
+
+class TestEmbeddingCache(unittest.TestCase):
+    """Tests for EmbeddingCache"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.cache = EmbeddingCache(":memory:", max_entries=2)
+
+    def tearDown(self):
+        """Close the cache"""
+        self.cache.close()
+
+    def test_miss_then_hit(self):
+        """Test that stored embeddings are returned and counted"""
+        self.assertEqual(self.cache.get_many("model", ["Hello"]), [None])
+        self.cache.put_many("model", ["Hello"], [[0.5, 0.25]])
+        result = self.cache.get_many("model", ["Hello"])[0]
+        self.assertEqual(result.tolist(), [0.5, 0.25])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_keyed_by_model(self):
+        """Test that entries from another model are not reused"""
+        self.cache.put_many("model-a", ["Hello"], [[1.0]])
+        self.assertEqual(self.cache.get_many("model-b", ["Hello"]), [None])
+
+    def test_whitespace_is_normalized(self):
+        """Test that reformatted chunks share a key"""
+        self.assertEqual(content_hash("Hello  world\n"), content_hash("Hello world"))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        self.cache.put_many("model", ["a"], [[1.0]])
+        self.cache.put_many("model", ["b"], [[2.0]])
+        self.cache.get_many("model", ["a"])
+        self.cache.put_many("model", ["c"], [[3.0]])
+        self.assertIsNone(self.cache.get_many("model", ["b"])[0])
+        self.assertIsNotNone(self.cache.get_many("model", ["a"])[0])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_persists_to_disk(self):
+        """Test that entries survive reopening the cache file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.db")
+            cache = EmbeddingCache(path)
+            cache.put_many("model", ["Hello"], [[1.0]])
+            cache.close()
+            cache = EmbeddingCache(path)
+            self.assertIsNotNone(cache.get_many("model", ["Hello"])[0])
+            cache.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+from embedding_service import EmbeddingService
+
+class TestEmbeddingService(unittest.TestCase):
+    """Tests for EmbeddingService"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.model = MagicMock()
+        self.model.encode.side_effect = lambda texts, batch_size: [[float(len(text))] for text in texts]
+
+    def test_encode(self):
+        """Test that each caller gets the embeddings of its own texts"""
+        service = EmbeddingService(self.model)
+        self.assertEqual(service.encode(["a", "bb"]).tolist(), [[1.0], [2.0]])
+        service.close()
+
+    def test_concurrent_requests_are_coalesced(self):
+        """Test that concurrent requests share one model call"""
+        service = EmbeddingService(self.model, max_wait=0.5, max_batch_texts=6)
+        results = {}
+        def encode(texts):
+            results[texts[0]] = service.encode(texts).tolist()
+        threads = [threading.Thread(target=encode, args=([text] * 2,)) for text in ["a", "bb", "ccc"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        service.close()
+
+        self.assertEqual(results, {"a": [[1.0], [1.0]], "bb": [[2.0], [2.0]], "ccc": [[3.0], [3.0]]})
+        self.assertEqual(self.model.encode.call_count, 1)
+        self.assertEqual(service.stats()["mean_batch_texts"], 6)
+
+    def test_large_batches_use_process_pool(self):
+        """Test that big batches are sharded across the multi-process pool"""
+        self.model.encode_multi_process.return_value = [[0.0]] * 4
+        service = EmbeddingService(self.model, num_processes=2, pool_min_texts=4)
+        service.encode(["a", "b"])
+        service.encode(["a", "b", "c", "d"])
+        service.close()
+
+        self.assertEqual(self.model.encode.call_count, 1)
+        self.model.start_multi_process_pool.assert_called_once_with(target_devices=["cpu", "cpu"])
+        self.model.stop_multi_process_pool.assert_called_once()
+
+    def test_errors_are_propagated(self):
+        """Test that model errors are raised to the caller"""
+        self.model.encode.side_effect = RuntimeError("out of memory")
+        service = EmbeddingService(self.model)
+        with self.assertRaises(RuntimeError):
+            service.encode(["a"])
+        service.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+from ingestion import IngestionQueue, IngestionQueueFull
+
+class TestIngestionQueue(unittest.TestCase):
+    """Tests for IngestionQueue"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.rag = MagicMock()
+        self.queues = []
+
+    def tearDown(self):
+        """Stop worker threads"""
+        for q in self.queues:
+            q.shutdown()
+
+    def make_queue(self, **kwargs):
+        q = IngestionQueue(self.rag, **kwargs)
+        self.queues.append(q)
+        return q
+
+    def test_workers_start_on_first_submit(self):
+        """Test that no thread is started before a job is submitted"""
+        self.rag.add_document.return_value = 1
+        q = self.make_queue(num_workers=2)
+        self.assertEqual(q._workers, [])
+        q.submit("test.txt")
+        self.assertEqual(len(q._workers), 2)
+
+    def test_job_completes_with_progress(self):
+        """Test that a job runs add_document and records its progress"""
+        def add_document(file_path, metadata, progress):
+            progress("pages_parsed", 3)
+            progress("chunks_embedded", 5)
+            progress("chunks_stored", 5)
+            return 5
+        self.rag.add_document.side_effect = add_document
+        done = threading.Event()
+
+        q = self.make_queue(num_workers=1)
+        job = q.submit("test.pdf", {"original_name": "test.pdf"}, on_done=lambda job: done.set())
+        self.assertTrue(done.wait(5))
+
+        result = q.get_job(job.id).to_dict()
+        self.assertEqual(result["status"], "completed")
+        self.assertEqual(result["chunks"], 5)
+        self.assertEqual(result["progress"], {"pages_parsed": 3, "chunks_embedded": 5, "chunks_stored": 5})
+
+    def test_job_failure(self):
+        """Test that processing errors mark the job as failed"""
+        self.rag.add_document.side_effect = ValueError("Unsupported file format: .xyz")
+        done = threading.Event()
+
+        q = self.make_queue(num_workers=1)
+        job = q.submit("test.xyz", on_done=lambda job: done.set())
+        self.assertTrue(done.wait(5))
+
+        self.assertEqual(job.status, "failed")
+        self.assertIn("Unsupported", job.error)
+
+    def test_queue_full(self):
+        """Test backpressure once the queue is full"""
+        release = threading.Event()
+        started = threading.Event()
+        def add_document(file_path, metadata, progress):
+            started.set()
+            release.wait(5)
+            return 1
+        self.rag.add_document.side_effect = add_document
+
+        q = self.make_queue(num_workers=1, max_queue_size=1)
+        q.submit("running.txt")
+        self.assertTrue(started.wait(5))
+        q.submit("waiting.txt")
+
+        with self.assertRaises(IngestionQueueFull):
+            q.submit("rejected.txt")
+        self.assertEqual(len(q.list_jobs()), 2)
+        release.set()
+
+    def test_finished_jobs_are_pruned(self):
+        """Test that only max_jobs jobs are remembered"""
+        self.rag.add_document.return_value = 1
+        q = self.make_queue(num_workers=1, max_jobs=2)
+        for i in range(5):
+            q.submit(f"file_{i}.txt")
+            q._queue.join()
+
+        self.assertEqual([job.file_path for job in q.list_jobs()], ["file_3.txt", "file_4.txt"])
+
+    def test_update_job(self):
+        """Test that update jobs re-index the document with update_document"""
+        self.rag.update_document.return_value = {"chunks": 3, "added": 1, "updated": 0, "removed": 0,
+                                                 "unchanged": 2, "skipped": False}
+        q = self.make_queue(num_workers=1)
+        job = q.submit("doc.txt", mode="update", source="docs/doc.txt")
+        q._queue.join()
+
+        self.assertEqual(job.status, "completed")
+        self.assertEqual(job.to_dict()["changes"]["added"], 1)
+        self.assertEqual(job.chunks, 3)
+        self.assertEqual(self.rag.update_document.call_args.kwargs["source"], "docs/doc.txt")
+        self.rag.add_document.assert_not_called()
+
+    def test_sync_job(self):
+        """Test that sync jobs run sync_directory and report its result as changes"""
+        self.rag.sync_directory.return_value = {"files": 2, "skipped": 1, "chunks": 7, "deleted": ["gone.txt"]}
+        q = self.make_queue(num_workers=1)
+        job = q.submit("docs", mode="sync", delete_missing=False)
+        q._queue.join()
+
+        self.assertEqual(job.status, "completed")
+        self.assertEqual(job.to_dict()["mode"], "sync")
+        self.assertEqual(job.to_dict()["changes"]["deleted"], ["gone.txt"])
+        self.assertEqual(job.chunks, 7)
+        self.rag.sync_directory.assert_called_once_with("docs", metadata=None, delete_missing=False)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from lexical_index import BM25Index, index_path, tokenize
+from rag_system import reciprocal_rank_fusion
+
+class TestBM25Index(unittest.TestCase):
+    """Tests for BM25Index"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.index = BM25Index(None)
+        self.index.add(["a", "b", "c"], [
+            "Le résumé du contrat de maintenance",
+            "Invoice INV-2024-117 for maintenance",
+            "Nothing to see here"
+        ])
+
+    def test_tokenize(self):
+        """Test lowercasing and accent folding"""
+        self.assertEqual(tokenize("Résumé INV-2024"), ["resume", "inv", "2024"])
+
+    def test_search_ranks_exact_identifiers(self):
+        """Test that documents containing the query terms rank first"""
+        results = self.index.search("INV-2024-117")
+        self.assertEqual(results[0][0], "b")
+        self.assertEqual(len(results), 1)
+
+    def test_accent_insensitive(self):
+        """Test that French accents do not prevent matches"""
+        self.assertEqual(self.index.search("resume")[0][0], "a")
+
+    def test_search_within_doc_ids(self):
+        """Test that a scoped search only scores the given documents"""
+        self.assertEqual([doc_id for doc_id, _ in self.index.search("maintenance", doc_ids={"a", "c"})], ["a"])
+        self.assertEqual(self.index.search("maintenance", doc_ids=set()), [])
+        self.assertEqual(len(self.index.search("maintenance", doc_ids=["a", "b", "c", "d"])), 2)
+
+    def test_update_and_remove(self):
+        """Test incremental updates"""
+        self.index.add(["c"], ["maintenance schedule"])
+        self.assertIn("c", [doc_id for doc_id, _ in self.index.search("maintenance")])
+        self.index.remove(["c"])
+        self.assertEqual(self.index.search("schedule"), [])
+        self.assertEqual(len(self.index), 2)
+
+    def test_persistence(self):
+        """Test that the index is reloaded from disk"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bm25.db")
+            index = BM25Index(path)
+            index.add(["a"], ["persistent document"])
+            index.close()
+            index = BM25Index(path)
+            self.assertEqual(index.search("persistent")[0][0], "a")
+            index.close()
+
+    def test_instances_share_path(self):
+        """Test that the writes of an instance are seen by another one on the same file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bm25.db")
+            first, second = BM25Index(path), BM25Index(path)
+            first.add(["a"], ["shared document"])
+            self.assertEqual(second.search("shared")[0][0], "a")
+            second.add(["b"], ["another shared document"])
+            first.remove(["a"])
+            self.assertEqual([doc_id for doc_id, _ in second.search("shared")], ["b"])
+            self.assertEqual(len(first), 1)
+            first.close()
+            second.close()
+
+    def test_failed_write_is_dropped(self):
+        """Test that a write failing halfway leaves neither the file nor the postings changed"""
+        with patch("lexical_index.tokenize", side_effect=[["partial"], RuntimeError]):
+            with self.assertRaises(RuntimeError):
+                self.index.add(["d", "e"], ["partial", "failing"])
+        self.assertEqual(self.index.search("partial"), [])
+        self.assertEqual(len(self.index), 3)
+
+    def test_index_path(self):
+        """Test that every collection gets its own file"""
+        self.assertNotEqual(index_path("documents"), index_path("archive"))
+        self.assertEqual(index_path("documents", "data"), os.path.join("data", "bm25_documents.db"))
+
+class TestReciprocalRankFusion(unittest.TestCase):
+    """Tests for reciprocal_rank_fusion"""
+
+    def test_fusion(self):
+        """Test that ids ranked well in both lists come first"""
+        self.assertEqual(reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]]), ["b", "a", "d", "c"])
+
+if __name__ == "__main__":
+    unittest.main()
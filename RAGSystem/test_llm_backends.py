@@ -0,0 +1,103 @@
+import asyncio
+import os
+import threading
+import unittest
+from unittest.mock import patch, AsyncMock, MagicMock
+from llm_backends import BatchingBackend, LLMBackend, OpenAIBackend, StubBackend, create_backend
+
+class TestBackends(unittest.TestCase):
+    """Tests for the LLM backends"""
+
+    def test_stub_stream(self):
+        """Test that the stub streams its answer word by word"""
+        backend = StubBackend("Bonjour le monde")
+        self.assertEqual(list(backend.stream([])), ["Bonjour", " le", " monde"])
+        self.assertEqual(backend.generate([]), "Bonjour le monde")
+
+    @patch("llm_backends.openai.chat.completions.create")
+    def test_openai_generate(self, mock_openai):
+        """Test OpenAI completion"""
+        mock_openai.return_value.choices = [MagicMock(message=MagicMock(content="Generated response"))]
+        backend = OpenAIBackend(api_key="fake-key")
+        self.assertEqual(backend.generate([{"role": "user", "content": "Hello"}]), "Generated response")
+
+    @patch("llm_backends.openai.AsyncOpenAI")
+    def test_openai_agenerate(self, mock_client):
+        """Test that async completions are awaited on an AsyncOpenAI client per event loop"""
+        create = mock_client.return_value.chat.completions.create = AsyncMock()
+        create.return_value.choices = [MagicMock(message=MagicMock(content="Generated response"))]
+        backend = OpenAIBackend(api_key="fake-key", base_url="http://localhost:8001/v1")
+        for _ in range(2):
+            answer = asyncio.run(backend.agenerate([{"role": "user", "content": "Hello"}]))
+            self.assertEqual(answer, "Generated response")
+        mock_client.assert_called_with(api_key="fake-key", base_url="http://localhost:8001/v1")
+        self.assertEqual(mock_client.call_count, 2)
+
+    def test_agenerate_falls_back_to_generate(self):
+        """Test that backends without an async client answer from a worker thread"""
+        class ThreadBackend(LLMBackend):
+            def generate(self, messages):
+                return threading.current_thread().name
+
+        self.assertNotEqual(asyncio.run(ThreadBackend().agenerate([])), threading.current_thread().name)
+
+    def test_openai_requires_api_key(self):
+        """Test that a missing API key is reported"""
+        with patch.dict(os.environ, {}, clear=True):
+            with self.assertRaises(ValueError):
+                OpenAIBackend()
+
+    def test_openai_count_tokens(self):
+        """Test that tokens are counted by the tiktoken encoding of the model, or not at all without one"""
+        # A MagicMock given as new, patch would otherwise import tiktoken to inspect it
+        with patch("llm_backends.tiktoken", MagicMock()) as mock_tiktoken:
+            mock_tiktoken.encoding_for_model.return_value.encode.side_effect = lambda text: text.split()
+            backend = OpenAIBackend(api_key="fake-key", model="gpt-4o-mini")
+            self.assertEqual(backend.count_tokens("un deux trois"), 3)
+            mock_tiktoken.encoding_for_model.assert_called_once_with("gpt-4o-mini")
+            self.assertEqual(BatchingBackend(backend).count_tokens("un deux"), 2)
+
+            mock_tiktoken.encoding_for_model.side_effect = KeyError("llama3")
+            self.assertIsNone(OpenAIBackend(api_key="fake-key", model="llama3").count_tokens("un deux"))
+            mock_tiktoken.encoding_for_model.side_effect = ImportError("No module named 'tiktoken'")
+            self.assertIsNone(OpenAIBackend(api_key="fake-key").count_tokens("un deux"))
+        self.assertIsNone(StubBackend().count_tokens("un deux"))
+
+    def test_unknown_backend(self):
+        """Test that unknown backend names are rejected"""
+        with self.assertRaises(ValueError):
+            create_backend("unknown")
+
+class TestBatchingBackend(unittest.TestCase):
+    """Tests for BatchingBackend"""
+
+    def test_concurrent_requests_are_batched(self):
+        """Test that concurrent generate calls share one generate_batch call"""
+        inner = MagicMock()
+        inner.generate_batch.side_effect = lambda batch: [messages[0]["content"].upper() for messages in batch]
+        backend = BatchingBackend(inner, max_batch_size=4, max_wait=0.5)
+
+        results = {}
+        def ask(text):
+            results[text] = backend.generate([{"role": "user", "content": text}])
+        threads = [threading.Thread(target=ask, args=(text,)) for text in ["a", "b", "c", "d"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        backend.close()
+
+        self.assertEqual(results, {"a": "A", "b": "B", "c": "C", "d": "D"})
+        self.assertEqual(inner.generate_batch.call_count, 1)
+
+    def test_errors_are_propagated(self):
+        """Test that a failing batch raises in every caller"""
+        inner = MagicMock()
+        inner.generate_batch.side_effect = RuntimeError("model crashed")
+        backend = BatchingBackend(inner, max_wait=0.01)
+        with self.assertRaises(RuntimeError):
+            backend.generate([{"role": "user", "content": "Hello"}])
+        backend.close()
+
+if __name__ == "__main__":
+    unittest.main()
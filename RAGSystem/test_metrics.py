@@ -0,0 +1,52 @@
+import unittest
+from metrics import Metrics, Histogram, timed_iter
+
+class TestMetrics(unittest.TestCase):
+    """Tests for Metrics"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.metrics = Metrics(buckets=(0.01, 0.1, 1.0))
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that each bucket counts the values up to its bound"""
+        histogram = Histogram((0.01, 0.1))
+        for value in (0.005, 0.01, 0.05, 3.0):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [("0.01", 2), ("0.1", 3), ("+Inf", 4)])
+        self.assertAlmostEqual(histogram.sum, 3.065)
+
+    def test_timer_fills_timings(self):
+        """Test that a timed block is observed and reported in milliseconds"""
+        timings = {}
+        with self.metrics.timer("embed", timings):
+            pass
+        self.assertIn("embed_ms", timings)
+        self.assertEqual(self.metrics.snapshot()["stages"]["embed"]["count"], 1)
+
+    def test_timed_iter(self):
+        """Test that time spent producing items is accumulated"""
+        totals = {}
+        self.assertEqual(list(timed_iter(iter([1, 2, 3]), totals, "parse")), [1, 2, 3])
+        self.assertGreaterEqual(totals["parse"], 0)
+
+    def test_render_prometheus_format(self):
+        """Test the text exposition format"""
+        self.metrics.observe("generation", 0.5)
+        self.metrics.inc("queries", 2)
+        self.metrics.gauge("pending", lambda: 3)
+        text = self.metrics.render()
+        self.assertIn("# TYPE rag_stage_duration_seconds histogram", text)
+        self.assertIn('rag_stage_duration_seconds_bucket{stage="generation",le="0.1"} 0', text)
+        self.assertIn('rag_stage_duration_seconds_bucket{stage="generation",le="1.0"} 1', text)
+        self.assertIn('rag_stage_duration_seconds_count{stage="generation"} 1', text)
+        self.assertIn("rag_queries_total 2", text)
+        self.assertIn("rag_pending 3", text)
+
+    def test_failing_gauge_is_skipped(self):
+        """Test that a broken gauge callback does not break the endpoint"""
+        self.metrics.gauge("broken", lambda: 1 / 0)
+        self.assertNotIn("rag_broken", self.metrics.render())
+
+if __name__ == '__main__':
+    unittest.main()
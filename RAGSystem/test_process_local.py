@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import threading
+import unittest
+from process_local import SchedulerThread, SQLiteConnection
+
+class Echo(SchedulerThread):
+    """Answers each queued (value, event, answers) by appending the value"""
+
+    _scheduler_name = "echo"
+
+    def __init__(self):
+        self._start_lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            value, done, answers = request
+            answers.append(value)
+            done.set()
+
+    def ask(self, value):
+        self._ensure_started()
+        done, answers = threading.Event(), []
+        self._requests.put((value, done, answers))
+        done.wait(5)
+        return answers
+
+class Store(SQLiteConnection):
+    """Opens an in-memory database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        self.opened += 1
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+class TestSchedulerThread(unittest.TestCase):
+    """Tests for SchedulerThread"""
+
+    def test_instances_have_their_own_thread(self):
+        """Test that every instance starts, locks and stops its own scheduler"""
+        first, second = Echo(), Echo()
+        self.assertEqual(first.ask(1), [1])
+        self.assertEqual(second.ask(2), [2])
+        self.assertIsNot(first._scheduler, second._scheduler)
+        self.assertIsNot(first._start_lock, second._start_lock)
+        first._stop_scheduler()
+        self.assertIsNone(first._scheduler)
+        self.assertTrue(second._scheduler.is_alive())
+        self.assertEqual(first.ask(3), [3])
+        first._stop_scheduler()
+        second._stop_scheduler()
+
+    def test_started_again_after_fork(self):
+        """Test that a child process does not reuse the scheduler of its parent"""
+        echo = Echo()
+        echo.ask(1)
+        echo._scheduler_pid = os.getpid() + 1  # as seen from a forked child
+        parent, parent_requests = echo._scheduler, echo._requests
+        self.assertEqual(echo.ask(2), [2])
+        self.assertIsNot(echo._scheduler, parent)
+        echo._stop_scheduler()
+        parent_requests.put(None)
+        parent.join()
+
+class TestSQLiteConnection(unittest.TestCase):
+    """Tests for SQLiteConnection"""
+
+    def test_connection_per_process(self):
+        """Test that the connection is opened once, again in a forked child and after close"""
+        store = Store()
+        self.assertIs(store._conn, store._conn)
+        self.assertEqual(store.opened, 1)
+        store._connection_pid = os.getpid() + 1  # as seen from a forked child
+        store._conn
+        self.assertEqual(store.opened, 2)
+        store.close()
+        store._conn
+        self.assertEqual(store.opened, 3)
+        store.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch
+from query_cache import QueryCache
+
+class TestQueryCache(unittest.TestCase):
+    """Tests for QueryCache"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.cache = QueryCache(capacity=2, ttl=60, similarity_threshold=0.9)
+
+    def test_exact_match_is_normalized(self):
+        """Test that case and whitespace do not matter for exact hits"""
+        self.cache.put("What is AI?", [1.0, 0.0], "Answer")
+        self.assertEqual(self.cache.get("  what is   AI? "), "Answer")
+        self.assertEqual(self.cache.stats()["exact_hits"], 1)
+
+    def test_semantic_match_threshold(self):
+        """Test that only sufficiently similar embeddings hit"""
+        self.cache.put("What is AI?", [1.0, 0.0], "Answer")
+        self.assertEqual(self.cache.get_similar([0.99, 0.1]), "Answer")
+        self.assertIsNone(self.cache.get_similar([0.0, 1.0]))
+        self.assertEqual(self.cache.stats()["semantic_hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_lru_capacity(self):
+        """Test that the least recently used entry is evicted"""
+        self.cache.put("a", [1.0, 0.0], "A")
+        self.cache.put("b", [0.0, 1.0], "B")
+        self.cache.get("a")
+        self.cache.put("c", [1.0, 1.0], "C")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), "A")
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after ttl seconds"""
+        with patch("query_cache.time.monotonic", return_value=100):
+            self.cache.put("a", [1.0, 0.0], "A")
+        with patch("query_cache.time.monotonic", return_value=161):
+            self.assertIsNone(self.cache.get("a"))
+
+    def test_clear_drops_stale_puts(self):
+        """Test that answers computed before a clear are not stored"""
+        generation = self.cache.generation
+        self.cache.clear()
+        self.cache.put("a", [1.0, 0.0], "A", generation=generation)
+        self.assertIsNone(self.cache.get("a"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,21 @@
+import asyncio
+import io
 import unittest
 import os
+import shutil
+import tempfile
 from unittest.mock import patch, MagicMock
 from rag_system import DocumentProcessor, VectorStore, RAGSystem
+from embedding_cache import EmbeddingCache
+from lexical_index import BM25Index
+from llm_backends import StubBackend
+from document_registry import DocumentRegistry
+from vector_index import QuantizedIndex
+
+def fake_stream(tokens):
+    """Local fake LLM that streams tokens like openai with stream=True"""
+    for token in tokens:
+        yield MagicMock(choices=[MagicMock(delta=MagicMock(content=token))])
 
 class TestDocumentProcessor(unittest.TestCase):
     """Tests for DocumentProcessor"""
@@ -32,6 +46,18 @@ class TestDocumentProcessor(unittest.TestCase):
         os.remove("test.txt")  # Clean up after test
         self.assertEqual(result, ["Test line 1", "Test line 2"])
 
+    def test_iter_chunks_records_stages(self):
+        """Test that parsing and chunking are timed and counted"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("Test line 1\n\nTest line 2")
+            self.assertEqual(len(list(self.processor.iter_chunks(path))), 2)
+        snapshot = self.processor.metrics.snapshot()
+        self.assertEqual(snapshot["counters"], {"pages_parsed": 1, "chunks": 2})
+        self.assertEqual(snapshot["stages"]["parse"]["count"], 1)
+        self.assertEqual(snapshot["stages"]["chunk"]["count"], 1)
+
     def test_process_document(self):
         """Test document processing based on file extension"""
         with patch.object(self.processor, "process_pdf", return_value=["PDF text"]) as mock_pdf:
@@ -39,34 +65,229 @@ class TestDocumentProcessor(unittest.TestCase):
             mock_pdf.assert_called_once()
             self.assertEqual(result, ["PDF text"])
 
+    @patch("rag_system.PdfReader")
+    def test_iter_pdf_pages(self, mock_pdf_reader):
+        """Test that PDF chunks are yielded page by page with progress"""
+        mock_pdf_reader.return_value.pages = [
+            MagicMock(extract_text=lambda: "Page 1 a\n\nPage 1 b"),
+            MagicMock(extract_text=lambda: "Page 2")
+        ]
+        on_page = MagicMock()
+        chunks = self.processor.iter_pdf("test.pdf", on_page=on_page)
+        self.assertEqual(next(chunks), "Page 1 a")
+        on_page.assert_not_called()
+        self.assertEqual(list(chunks), ["Page 1 b", "Page 2"])
+        self.assertEqual(on_page.call_count, 2)
+
+    @patch("rag_system.ProcessPoolExecutor")
+    @patch("rag_system.PdfReader")
+    def test_iter_pdf_parallel(self, mock_pdf_reader, mock_pool):
+        """Test that large PDFs are extracted by the process pool in page ranges"""
+        mock_pdf_reader.return_value.pages = [MagicMock()] * 5
+        mock_pool.return_value.submit.side_effect = lambda fn, path, start, stop: MagicMock(
+            result=lambda: [f"Page {i}" for i in range(start, stop)]
+        )
+        processor = DocumentProcessor(max_workers=2, pages_per_task=2)
+        self.assertEqual(processor.process_pdf("test.pdf"), [f"Page {i}" for i in range(5)])
+        self.assertEqual(mock_pool.return_value.submit.call_count, 3)
+        self.assertEqual(mock_pool.call_args.kwargs["mp_context"].get_start_method(), "spawn")
+
+    def test_iter_chunks_offsets(self):
+        """Test that paragraph chunks carry their page and char offsets"""
+        with open("test.txt", "w", encoding="utf-8") as f:
+            f.write("First paragraph\n\nSecond paragraph")
+        result = list(self.processor.iter_chunks("test.txt"))
+        os.remove("test.txt")  # Clean up after test
+        self.assertEqual(result[1], ("Second paragraph", {"page": 1, "char_start": 17, "char_end": 33}))
+
+    def test_iter_chunks_from_memory(self):
+        """Test that documents are parsed from bytes or a file object, left open"""
+        content = "Premier paragraphe\n\nDeuxième paragraphe".encode("utf-8")
+        from_bytes = list(self.processor.iter_chunks("missing.txt", content=content))
+        self.assertEqual([text for text, _ in from_bytes], ["Premier paragraphe", "Deuxième paragraphe"])
+
+        stream = io.BytesIO(content)
+        stream.read()
+        self.assertEqual(list(self.processor.iter_chunks("missing.txt", content=stream)), from_bytes)
+        self.assertFalse(stream.closed)
+
+    @patch("rag_system.ProcessPoolExecutor")
+    @patch("rag_system.PdfReader")
+    def test_iter_pdf_from_memory(self, mock_pdf_reader, mock_pool):
+        """Test that PDFs held in memory are read by the reader, not reopened by worker processes"""
+        mock_pdf_reader.return_value.pages = [MagicMock(extract_text=lambda: "Page")] * 5
+        processor = DocumentProcessor(max_workers=2, pages_per_task=2)
+        blocks = list(processor.iter_blocks("upload.pdf", content=b"%PDF-1.4"))
+        self.assertEqual(len(blocks), 5)
+        self.assertIsInstance(mock_pdf_reader.call_args.args[0], io.BytesIO)
+        mock_pool.return_value.submit.assert_not_called()
+
 class TestVectorStore(unittest.TestCase):
     """Tests for VectorStore"""
 
-    @patch("rag_system.SentenceTransformer")
-    @patch("rag_system.chromadb.Client")
+    @patch("embedding_backends.SentenceTransformer")
+    @patch("vector_index.chromadb.Client")
     def setUp(self, mock_chromadb, mock_embedder):
         """Set up test environment"""
         self.mock_embedder = mock_embedder.return_value
-        self.mock_embedder.encode.return_value = [[0.1, 0.2, 0.3]]
+        self.mock_embedder.encode.side_effect = lambda texts, **kwargs: [[0.1, 0.2, 0.3] for _ in texts]
         self.mock_chromadb = mock_chromadb.return_value
         self.mock_collection = MagicMock()
         self.mock_chromadb.get_collection.return_value = self.mock_collection
-        self.store = VectorStore()
+        self.store = VectorStore(embedding_cache=EmbeddingCache(":memory:"), lexical_index=BM25Index(None))
+        self.store.warmup()
+
+    @patch("embedding_backends.SentenceTransformer")
+    @patch("vector_index.chromadb.Client")
+    def test_models_load_lazily(self, mock_chromadb, mock_embedder):
+        """Test that nothing heavy is loaded before first use or warmup"""
+        store = VectorStore(embedding_cache=EmbeddingCache(":memory:"), lexical_index=BM25Index(None))
+        mock_embedder.assert_not_called()
+        mock_chromadb.assert_not_called()
+        store.warmup(models_only=True)
+        mock_embedder.assert_called_once()
+        mock_chromadb.assert_not_called()
 
     def test_add_documents(self):
         """Test adding documents to vector store"""
         self.store.add_documents(["Test document"], [{"source": "test.txt"}])
-        self.mock_collection.add.assert_called_once()
+        self.mock_collection.upsert.assert_called_once()
+
+    def test_index_records_embedding_model(self):
+        """Test that the first write records the model, and another model or dimension is refused"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, True)
+        index = QuantizedIndex(path)
+        store = VectorStore(embedding_cache=EmbeddingCache(":memory:"), lexical_index=BM25Index(None), index=index,
+                            embedder=self.mock_embedder)
+        store.add_documents(["Test document"], [{"source": "test.txt"}])
+        self.assertEqual(index.embedding_model(), {"model_id": store.model_name, "dimension": 3})
+        self.mock_collection.modify.assert_not_called()
+
+        self.mock_embedder.encode.side_effect = lambda texts, **kwargs: [[0.1, 0.2, 0.3, 0.4] for _ in texts]
+        with self.assertRaises(ValueError):
+            store.add_documents(["Another document"], [{"source": "test.txt"}])
+        other = VectorStore(model_name="intfloat/e5-small-v2", embedding_cache=EmbeddingCache(":memory:"),
+                            lexical_index=BM25Index(None), index=index)
+        with self.assertRaises(ValueError):
+            other.index.count()
+
+    def test_chroma_records_embedding_model(self):
+        """Test that the model is kept in the collection metadata"""
+        self.mock_collection.metadata = None
+        self.store.add_documents(["Test document"], [{"source": "test.txt"}])
+        self.mock_collection.modify.assert_called_once_with(metadata={
+            "embedding_model": "sentence-transformers/all-MiniLM-L6-v2", "embedding_dimension": 3
+        })
+
+    def test_quantized_embeddings_are_cached_apart(self):
+        """Test that int8 embeddings never stand in for the full precision ones"""
+        store = VectorStore(embedding_backend="onnx-int8", embedding_cache=EmbeddingCache(":memory:"))
+        self.assertNotEqual(store.embedding_cache_key, self.store.embedding_cache_key)
+        self.assertEqual(VectorStore(embedding_backend="onnx", embedding_cache=EmbeddingCache(":memory:")).embedding_cache_key, self.store.embedding_cache_key)
+
+    def test_add_documents_uses_embedding_cache(self):
+        """Test that re-added chunks are not encoded again and keep their ids"""
+        self.store.add_documents(["Doc 1", "Doc 2"])
+        first_ids = self.mock_collection.upsert.call_args.kwargs["ids"]
+        self.store.add_documents(["Doc 1", "Doc 2"])
+        self.assertEqual(self.mock_embedder.encode.call_count, 1)
+        self.assertEqual(self.mock_collection.upsert.call_args.kwargs["ids"], first_ids)
+        self.assertEqual(self.store.embedding_cache.stats()["hits"], 2)
+
+    def test_add_documents_with_ids_and_delete(self):
+        """Test that given chunk ids are stored and deleted from both indexes"""
+        self.store.add_documents(["Doc 1", "Doc 1"], [{"source": "a.txt"}, {"source": "b.txt"}], ids=["a", "b"])
+        self.assertEqual(self.mock_collection.upsert.call_args.kwargs["ids"], ["a", "b"])
+        self.assertEqual(self.mock_embedder.encode.call_count, 1)
+        self.store.delete(["a"])
+        self.mock_collection.delete.assert_called_once_with(ids=["a"])
+        self.assertEqual([doc_id for doc_id, _ in self.store.lexical_index.search("Doc", 5)], ["b"])
+
+    def test_add_documents_skips_duplicate_chunks(self):
+        """Test that repeated chunks within one document are stored once"""
+        self.store.add_documents(["Same chunk", "Same  chunk", "Other chunk"])
+        self.assertEqual(self.mock_collection.upsert.call_args.kwargs["documents"], ["Same chunk", "Other chunk"])
+
+    def test_add_documents_batches_with_progress(self):
+        """Test batched insertion with progress reporting"""
+        progress = MagicMock()
+        self.store.add_documents(["Doc 1", "Doc 2", "Doc 3"], batch_size=2, progress=progress)
+        self.assertEqual(self.mock_collection.upsert.call_count, 2)
+        self.assertEqual(self.mock_collection.upsert.call_args.kwargs["documents"], ["Doc 3"])
+        progress.assert_any_call("chunks_embedded", 2)
+        progress.assert_called_with("chunks_stored", 1)
 
     def test_search(self):
         """Test searching in vector store"""
         self.mock_collection.query.return_value = {
+            "ids": [["id-1"]],
             "documents": [["Relevant document"]],
             "metadatas": [[{"source": "test.txt"}]]
         }
         results = self.store.search("query")
         self.assertEqual(results, [{"content": "Relevant document", "metadata": {"source": "test.txt"}}])
 
+    def test_hybrid_search_fuses_rankings(self):
+        """Test that keyword-only matches are fused with the dense results"""
+        self.store.lexical_index.add(["id-2", "id-3"], ["Error code XK-42 on startup", "Unrelated text"])
+        self.mock_collection.query.return_value = {
+            "ids": [["id-1", "id-2"]],
+            "documents": [["Dense match", "Error code XK-42 on startup"]],
+            "metadatas": [[{"source": "a.txt"}, {"source": "b.txt"}]]
+        }
+        results = self.store.search("XK-42", top_k=2)
+        self.assertEqual(results[0], {"content": "Error code XK-42 on startup", "metadata": {"source": "b.txt"}})
+        self.mock_collection.get.assert_not_called()
+
+    def test_lexical_search(self):
+        """Test keyword-only search fetching the chunks from the collection"""
+        self.store.lexical_index.add(["id-2"], ["Error code XK-42 on startup"])
+        self.mock_collection.get.return_value = {
+            "ids": ["id-2"], "documents": ["Error code XK-42 on startup"], "metadatas": [{"source": "b.txt"}]
+        }
+        results = self.store.search("xk-42", mode="lexical")
+        self.assertEqual([r["metadata"]["source"] for r in results], ["b.txt"])
+        self.mock_collection.query.assert_not_called()
+
+    def test_search_batch(self):
+        """Test that several queries share one embedding call and one index query"""
+        self.store.lexical_index.add(["id-2"], ["Error code XK-42 on startup"])
+        self.mock_collection.query.return_value = {
+            "ids": [["id-1"], ["id-1"]],
+            "documents": [["Dense match"], ["Dense match"]],
+            "metadatas": [[{"source": "a.txt"}], [{"source": "a.txt"}]]
+        }
+        self.mock_collection.get.return_value = {
+            "ids": ["id-2"], "documents": ["Error code XK-42 on startup"], "metadatas": [{"source": "b.txt"}]
+        }
+        results = self.store.search_batch(["first question", "XK-42"], top_k=2)
+        self.mock_embedder.encode.assert_called_once()
+        self.mock_collection.query.assert_called_once()
+        self.assertEqual(len(self.mock_collection.query.call_args.kwargs["query_embeddings"]), 2)
+        self.assertEqual([r["metadata"]["source"] for r in results[0]], ["a.txt"])
+        self.assertEqual(sorted(r["metadata"]["source"] for r in results[1]), ["a.txt", "b.txt"])
+
+    def test_search_with_filter(self):
+        """Test that a filter reaches the dense query and scopes the lexical ranking"""
+        self.store.lexical_index.add(["id-2", "id-3"], ["Error code XK-42 on startup", "XK-42 again"])
+        self.mock_collection.query.return_value = {
+            "ids": [["id-2"]], "documents": [["Error code XK-42 on startup"]], "metadatas": [[{"source": "b.txt"}]]
+        }
+        self.mock_collection.get.return_value = {"ids": ["id-2"]}
+        where = {"source": "b.txt"}
+        results = self.store.search("XK-42", top_k=2, where=where)
+        self.assertEqual(self.mock_collection.query.call_args.kwargs["where"], where)
+        self.mock_collection.get.assert_called_once_with(where=where, include=[])
+        self.assertEqual(results, [{"content": "Error code XK-42 on startup", "metadata": {"source": "b.txt"}}])
+        with self.assertRaises(ValueError):
+            self.store.search("XK-42", where={"source": {"$like": "b"}})
+
+    def test_add_documents_updates_lexical_index(self):
+        """Test that stored chunks are indexed for keyword search"""
+        self.store.add_documents(["Facture numéro 2024-117"])
+        self.assertEqual(len(self.store.lexical_index.search("numero 117")), 1)
+
 class TestRAGSystem(unittest.TestCase):
     """Tests for RAGSystem"""
 
@@ -75,25 +296,345 @@ class TestRAGSystem(unittest.TestCase):
     def setUp(self, mock_processor, mock_vector_store):
         """Set up test environment"""
         self.mock_processor = mock_processor.return_value
-        self.mock_processor.process_document.return_value = ["Processed text"]
+        self.mock_processor.iter_chunks.return_value = iter([("Processed text", {"page": 1})])
         self.mock_vector_store = mock_vector_store.return_value
         self.mock_vector_store.add_documents.return_value = None
         self.mock_vector_store.search.return_value = [{"content": "Relevant doc", "metadata": {"source": "test.pdf"}}]
-        self.rag_system = RAGSystem(api_key="fake-key")
+        self.mock_vector_store.embed_query.return_value = [0.1, 0.2, 0.3]
+        self.mock_vector_store.count_tokens.side_effect = lambda text: len(text.split())
+        self.rag_system = RAGSystem(api_key="fake-key", document_registry=DocumentRegistry(":memory:"))
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, True)
+        self.pdf = os.path.join(tmp, "test.pdf")
+        with open(self.pdf, "wb") as f:
+            f.write(b"%PDF")
+
+    def test_given_vector_store(self):
+        """Test that a given vector store is used as is"""
+        store = MagicMock()
+        rag_system = RAGSystem(llm=MagicMock(), document_registry=DocumentRegistry(":memory:"), vector_store=store)
+        self.assertIs(rag_system.vector_store, store)
+        self.assertEqual(rag_system.context_builder.count_tokens, rag_system.count_context_tokens)
+
+    def test_context_tokens_are_llm_tokens(self):
+        """Test that the context is counted by the LLM tokenizer, or estimated with a margin without one"""
+        with patch.object(self.rag_system.llm, "count_tokens", return_value=7):
+            self.assertEqual(self.rag_system.context_builder.count_tokens("four words of text"), 7)
+        with patch.object(self.rag_system.llm, "count_tokens", return_value=None):
+            self.assertEqual(self.rag_system.context_builder.count_tokens("four words of text"), 5)
 
     def test_add_document(self):
         """Test adding a document to RAG system"""
-        count = self.rag_system.add_document("test.pdf")
-        self.mock_processor.process_document.assert_called_once_with("test.pdf")
+        count = self.rag_system.add_document(self.pdf)
+        self.mock_processor.iter_chunks.assert_called_once_with(self.pdf)
         self.mock_vector_store.add_documents.assert_called_once()
         self.assertEqual(count, 1)
 
-    @patch("rag_system.openai.chat.completions.create")
+    def test_add_document_reports_pages(self):
+        """Test that page progress is forwarded from the document processor"""
+        def iter_chunks(file_path, on_page):
+            on_page(2)
+            yield "Processed text", {"page": 1}
+        self.mock_processor.iter_chunks.side_effect = iter_chunks
+        progress = MagicMock()
+        self.rag_system.add_document(self.pdf, progress=progress)
+        progress.assert_called_once_with("pages_parsed", 2)
+        self.assertIs(self.mock_vector_store.add_documents.call_args.kwargs["progress"], progress)
+
+    def test_add_document_streams_batches(self):
+        """Test that chunks are stored in batches while the document is parsed"""
+        self.mock_processor.iter_chunks.return_value = iter([(f"Chunk {i}", {"page": i}) for i in range(1, 4)])
+        count = self.rag_system.add_document(self.pdf, batch_size=2)
+        self.assertEqual(count, 3)
+        self.assertEqual(self.mock_vector_store.add_documents.call_count, 2)
+        self.assertEqual(self.mock_vector_store.add_documents.call_args.args[0], ["Chunk 3"])
+        self.assertEqual(self.mock_vector_store.add_documents.call_args.args[1], [{"source": "test.pdf", "page": 3}])
+
+    def test_add_document_failure_drops_written_chunks(self):
+        """Test that a parser failing partway removes the chunks stored so far, not the previous ones"""
+        self.rag_system.add_document(self.pdf)
+        previous = self.rag_system.document_registry.chunks("test.pdf")
+        
+        def iter_chunks(file_path):
+            yield "Processed text", {"page": 1}
+            yield "New text", {"page": 2}
+            raise ValueError("Corrupt page 3")
+        self.mock_processor.iter_chunks.side_effect = iter_chunks
+        self.rag_system.query_cache = MagicMock()
+        with self.assertRaises(ValueError):
+            self.rag_system.add_document(self.pdf, batch_size=2)
+        
+        deleted = self.mock_vector_store.delete.call_args.args[0]
+        self.assertEqual(len(deleted), 1)
+        self.assertNotIn(deleted[0], previous)
+        self.rag_system.query_cache.clear.assert_called_once()
+        self.assertEqual(self.rag_system.document_registry.chunks("test.pdf"), previous)
+
+    def test_prompt_context_is_deduplicated(self):
+        """Test that a chunk retrieved twice, from two uploads, is given to the LLM once"""
+        text = "Les ventes ont augmenté de dix pour cent au troisième trimestre"
+        self.mock_vector_store.search.return_value = [
+            {"content": text, "metadata": {"source": "a.pdf"}},
+            {"content": text, "metadata": {"source": "copy of a.pdf"}},
+        ]
+        self.rag_system.llm = MagicMock()
+        self.rag_system.llm.generate.return_value = "Réponse"
+        self.rag_system.generate_response("Ventes ?")
+        prompt = self.rag_system.llm.generate.call_args.args[0][-1]["content"]
+        self.assertEqual(prompt.count(text), 1)
+        self.assertEqual(self.rag_system.metrics.snapshot()["counters"]["context_duplicates"], 1)
+
+    def write_document(self, directory, name, lines):
+        """Write a document whose chunks are its lines, as the mocked processor reads them"""
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        return path
+
+    def chunk_lines(self):
+        def iter_chunks(file_path):
+            with open(file_path, encoding="utf-8") as f:
+                for i, line in enumerate(f.read().split("\n")):
+                    yield line, {"page": i + 1}
+        self.mock_processor.iter_chunks.side_effect = iter_chunks
+
+    def test_update_document_only_stores_changes(self):
+        """Test that an edited document only re-stores new and moved chunks and deletes removed ones"""
+        self.chunk_lines()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_document(tmp, "doc.txt", ["A", "B", "C"])
+            changes = self.rag_system.update_document(path)
+            self.assertEqual((changes["added"], changes["removed"], changes["skipped"]), (3, 0, False))
+
+            self.mock_vector_store.reset_mock()
+            self.write_document(tmp, "doc.txt", ["A", "C", "D"])
+            changes = self.rag_system.update_document(path)
+        self.assertEqual({k: changes[k] for k in ("chunks", "added", "updated", "removed", "unchanged")},
+                         {"chunks": 3, "added": 1, "updated": 1, "removed": 1, "unchanged": 1})
+        self.assertEqual(self.mock_vector_store.add_documents.call_args.args[0], ["C", "D"])
+        self.mock_vector_store.delete.assert_called_once()
+        self.assertEqual(len(self.mock_vector_store.delete.call_args.args[0]), 1)
+
+    def test_update_document_skips_unchanged_file(self):
+        """Test that a file with the same content is not parsed again"""
+        self.chunk_lines()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_document(tmp, "doc.txt", ["A", "B"])
+            self.rag_system.update_document(path)
+            self.mock_processor.iter_chunks.reset_mock()
+            changes = self.rag_system.update_document(path)
+        self.assertTrue(changes["skipped"])
+        self.assertEqual(changes["unchanged"], 2)
+        self.mock_processor.iter_chunks.assert_not_called()
+
+    def test_delete_document(self):
+        """Test that deleting a document removes its chunks and clears the query cache"""
+        self.rag_system.add_document(self.pdf)
+        self.rag_system.query_cache = MagicMock()
+        self.assertEqual(self.rag_system.delete_document("test.pdf"), 1)
+        self.assertEqual(len(self.mock_vector_store.delete.call_args.args[0]), 1)
+        self.rag_system.query_cache.clear.assert_called_once()
+        self.assertIsNone(self.rag_system.delete_document("test.pdf"))
+
+    def test_update_document_from_memory(self):
+        """Test that a document given as content is hashed and parsed from it"""
+        self.rag_system.update_document("uploads/doc.pdf", content=b"version 1")
+        self.assertEqual(self.mock_processor.iter_chunks.call_args.kwargs["content"], b"version 1")
+        self.assertEqual(self.rag_system.document_registry.get("doc.pdf")["path"], os.path.abspath("uploads/doc.pdf"))
+        self.assertTrue(self.rag_system.update_document("uploads/doc.pdf", content=io.BytesIO(b"version 1"))["skipped"])
+
+    def test_sync_directory(self):
+        """Test that a sync indexes new files, skips unchanged ones and deletes missing ones"""
+        self.chunk_lines()
+        with tempfile.TemporaryDirectory() as tmp:
+            self.write_document(tmp, "a.txt", ["A"])
+            removed = self.write_document(tmp, os.path.join("sub", "b.txt"), ["B1", "B2"])
+            result = self.rag_system.sync_directory(tmp, num_workers=2)
+            self.assertEqual((result["files"], result["added"], result["skipped"]), (2, 3, 0))
+            self.assertIsNotNone(self.rag_system.document_registry.get("sub/b.txt"))
+
+            os.remove(removed)
+            self.write_document(tmp, "c.txt", ["C"])
+            result = self.rag_system.sync_directory(tmp, num_workers=2)
+        self.assertEqual((result["files"], result["added"], result["skipped"]), (2, 1, 1))
+        self.assertEqual((result["deleted"], result["removed"]), (["sub/b.txt"], 2))
+        self.assertEqual([d["source"] for d in self.rag_system.document_registry.documents()], ["a.txt", "c.txt"])
+
+    @patch("rag_system.VectorStore")
+    @patch("rag_system.DocumentProcessor")
+    def test_generate_response_with_reranker(self, mock_processor, mock_vector_store):
+        """Test that the reranker trims over-fetched candidates and is timed"""
+        mock_vector_store.return_value.search.return_value = [
+            {"content": f"Doc {i}", "metadata": {"source": f"{i}.pdf"}} for i in range(20)
+        ]
+        mock_vector_store.return_value.embed_query.return_value = [0.1, 0.2, 0.3]
+        reranker = MagicMock(count_tokens=None)
+        reranker.rerank.return_value = [{"content": "Doc 7", "metadata": {"source": "7.pdf"}}]
+        rag_system = RAGSystem(llm=StubBackend("Réponse"), reranker=reranker, rerank_candidates=20)
+
+        timings = {}
+        response = rag_system.generate_response("What is AI?", timings=timings)
+        self.assertEqual(response, "Réponse\n\nSources: 7.pdf")
+        self.assertEqual(mock_vector_store.return_value.search.call_args.kwargs["top_k"], 20)
+        self.assertIn("rerank_ms", timings)
+        self.assertIn("generation_ms", timings)
+
+    def test_ingest_directory(self):
+        """Test bulk ingestion of the supported files of a directory"""
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "sub"))
+            for name in ["a.txt", "sub/b.pdf", "notes.md"]:
+                open(os.path.join(tmp, name), "w").close()
+            with patch.object(self.rag_system, "add_document", side_effect=[2, ValueError("bad pdf")]) as add:
+                result = self.rag_system.ingest_directory(tmp, num_workers=1)
+        self.assertEqual(add.call_count, 2)
+        self.assertEqual(result["files"], 1)
+        self.assertEqual(result["chunks"], 2)
+        self.assertEqual(list(result["failed"].values()), ["bad pdf"])
+
+    def test_ingest_directory_keeps_same_named_files_apart(self):
+        """Test that files with one name in two directories are two documents"""
+        self.chunk_lines()
+        with tempfile.TemporaryDirectory() as tmp:
+            self.write_document(tmp, os.path.join("a", "readme.txt"), ["A1", "A2"])
+            self.write_document(tmp, os.path.join("b", "readme.txt"), ["B1"])
+            result = self.rag_system.ingest_directory(tmp, num_workers=1)
+        self.assertEqual((result["files"], result["chunks"]), (2, 3))
+        self.mock_vector_store.delete.assert_called_with([])
+        registry = self.rag_system.document_registry
+        self.assertEqual([d["source"] for d in registry.documents()], ["a/readme.txt", "b/readme.txt"])
+        self.assertEqual(len(registry.chunks("a/readme.txt")), 2)
+
+    @patch("llm_backends.openai.chat.completions.create")
     def test_generate_response(self, mock_openai):
         """Test response generation"""
         mock_openai.return_value.choices = [MagicMock(message=MagicMock(content="Generated response"))]
         response = self.rag_system.generate_response("What is AI?")
         self.assertIn("Generated response", response)
 
+    def test_generate_response_with_history(self):
+        """Test that earlier turns are sent before the question and the answer is not cached"""
+        backend = self.rag_system.llm = StubBackend("Réponse")
+        backend.generate = MagicMock(wraps=backend.generate)
+        history = [{"query": "What is AI?", "response": "L'IA est...\n\nSources: a.pdf"}]
+        self.rag_system.generate_response("And ML?", history=history)
+        self.rag_system.generate_response("And ML?", history=history)
+        messages = backend.generate.call_args.args[0]
+        self.assertEqual([m["role"] for m in messages], ["system", "user", "assistant", "user"])
+        self.assertEqual(messages[2]["content"], "L'IA est...")
+        self.assertEqual(backend.generate.call_count, 2)
+
+    def test_agenerate_response(self):
+        """Test the async path: same answer, cached, with the same stages"""
+        self.rag_system.llm = StubBackend("Réponse")
+        timings = {}
+        answer = asyncio.run(self.rag_system.agenerate_response("What is AI?", timings=timings))
+        self.assertEqual(answer, "Réponse\n\nSources: test.pdf")
+        self.assertEqual(set(timings), {"embed_ms", "retrieval_ms", "prompt_ms", "generation_ms", "total_ms"})
+        self.assertEqual(asyncio.run(self.rag_system.agenerate_response("What is AI?")), answer)
+        self.assertEqual(self.rag_system.llm.calls, 1)
+
+    def test_aretrieve(self):
+        """Test that async retrieval embeds the query and searches the store"""
+        docs = asyncio.run(self.rag_system.aretrieve("What is AI?"))
+        self.assertEqual(docs[0]["content"], "Relevant doc")
+        self.mock_vector_store.search.assert_called_once()
+        self.assertEqual(self.mock_vector_store.search.call_args.kwargs["query_embedding"], [0.1, 0.2, 0.3])
+
+    @patch("llm_backends.openai.chat.completions.create")
+    def test_generate_response_is_cached(self, mock_openai):
+        """Test that repeated and similar questions reuse the cached answer"""
+        mock_openai.return_value.choices = [MagicMock(message=MagicMock(content="Generated response"))]
+        first = self.rag_system.generate_response("What is AI?")
+        self.assertEqual(self.rag_system.generate_response("  what is AI? "), first)
+        self.mock_vector_store.embed_query.return_value = [0.1, 0.2, 0.31]
+        self.assertEqual(self.rag_system.generate_response("What's AI?"), first)
+        mock_openai.assert_called_once()
+
+    @patch("llm_backends.openai.chat.completions.create")
+    def test_generate_response_records_metrics(self, mock_openai):
+        """Test that every query stage is timed and cache hits are counted"""
+        mock_openai.return_value.choices = [MagicMock(message=MagicMock(content="Generated response"))]
+        self.rag_system.llm.count_tokens = lambda text: len(text.split())
+        timings = {}
+        self.rag_system.generate_response("What is AI?", timings=timings)
+        self.rag_system.generate_response("What is AI?")
+        self.assertEqual(set(timings), {"embed_ms", "retrieval_ms", "prompt_ms", "generation_ms", "total_ms"})
+        snapshot = self.rag_system.metrics.snapshot()
+        self.assertEqual(snapshot["counters"], {"queries": 2, "query_cache_hits": 1, "context_chunks": 1,
+                                                "context_tokens": 2, "context_duplicates": 0, "context_trimmed": 0})
+        self.assertEqual(snapshot["stages"]["total"]["count"], 2)
+        self.assertEqual(snapshot["stages"]["generation"]["count"], 1)
+
+    @patch("llm_backends.openai.chat.completions.create")
+    def test_generate_response_with_filter(self, mock_openai):
+        """Test that filtered answers are retrieved in scope and never cached"""
+        mock_openai.return_value.choices = [MagicMock(message=MagicMock(content="Generated response"))]
+        where = {"source": {"$in": ["test.pdf"]}}
+        self.rag_system.generate_response("What is AI?", where=where)
+        self.rag_system.generate_response("What is AI?", where=where)
+        self.assertEqual(self.mock_vector_store.search.call_args.kwargs["where"], where)
+        self.assertEqual(mock_openai.call_count, 2)
+        self.rag_system.generate_response("What is AI?")
+        self.assertEqual(mock_openai.call_count, 3)
+
+    def test_generate_responses(self):
+        """Test batched answers: cache reuse, deduplication and order"""
+        self.rag_system.llm = StubBackend("Réponse")
+        self.mock_vector_store.embed_queries.side_effect = lambda queries: [[float(len(q)), 1.0, 0.0] for q in queries]
+        self.mock_vector_store.search_batch.side_effect = lambda queries, **kwargs: [
+            [{"content": "Relevant doc", "metadata": {"source": "test.pdf"}}] for _ in queries
+        ]
+        self.rag_system.query_cache.put("Cached?", [0.0, 0.0, 1.0], "Cached answer")
+
+        timings = {}
+        answers = self.rag_system.generate_responses(["What is AI?", "Cached?", "what is  AI?", "Why?"],
+                                                     timings=timings)
+        self.assertEqual(answers, ["Réponse\n\nSources: test.pdf", "Cached answer",
+                                   "Réponse\n\nSources: test.pdf", "Réponse\n\nSources: test.pdf"])
+        self.assertEqual(self.rag_system.llm.calls, 2)
+        self.mock_vector_store.search_batch.assert_called_once()
+        self.assertIn("batch_generation_ms", timings)
+        self.assertEqual(self.rag_system.generate_response("Why?"), "Réponse\n\nSources: test.pdf")
+
+    @patch("llm_backends.openai.chat.completions.create")
+    def test_generate_response_stream(self, mock_openai):
+        """Test that tokens are yielded as they arrive, then sources and timings"""
+        mock_openai.return_value = fake_stream(["Bonjour", " le", " monde"])
+        events = list(self.rag_system.generate_response_stream("What is AI?"))
+        self.assertEqual([e["content"] for e in events[:-1]], ["Bonjour", " le", " monde"])
+        self.assertEqual(events[-1]["type"], "done")
+        self.assertEqual(events[-1]["sources"], ["test.pdf"])
+        self.assertIn("first_token_ms", events[-1]["timings"])
+        self.assertTrue(mock_openai.call_args.kwargs["stream"])
+
+    @patch("llm_backends.openai.chat.completions.create")
+    def test_generate_response_stream_uses_cache(self, mock_openai):
+        """Test that a streamed answer is cached for later questions"""
+        mock_openai.return_value = fake_stream(["Bonjour"])
+        list(self.rag_system.generate_response_stream("What is AI?"))
+        self.assertEqual(self.rag_system.generate_response("What is AI?"), "Bonjour\n\nSources: test.pdf")
+        mock_openai.assert_called_once()
+
+    @patch("rag_system.VectorStore")
+    @patch("rag_system.DocumentProcessor")
+    def test_generate_response_with_backend(self, mock_processor, mock_vector_store):
+        """Test that a custom backend replaces OpenAI and needs no API key"""
+        mock_vector_store.return_value.search.return_value = []
+        mock_vector_store.return_value.embed_query.return_value = [0.1, 0.2, 0.3]
+        with patch.dict(os.environ, {}, clear=True):
+            rag_system = RAGSystem(llm=StubBackend("Réponse locale"))
+        self.assertEqual(rag_system.generate_response("What is AI?"), "Réponse locale")
+
+    @patch("llm_backends.openai.chat.completions.create")
+    def test_add_document_invalidates_cache(self, mock_openai):
+        """Test that adding a document drops cached answers"""
+        mock_openai.return_value.choices = [MagicMock(message=MagicMock(content="Generated response"))]
+        self.rag_system.generate_response("What is AI?")
+        self.rag_system.add_document(self.pdf)
+        self.rag_system.generate_response("What is AI?")
+        self.assertEqual(mock_openai.call_count, 2)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import MagicMock
+from reranker import Reranker
+
+def make_docs(*contents):
+    return [{"content": content, "metadata": {"source": f"{i}.txt"}} for i, content in enumerate(contents)]
+
+class TestReranker(unittest.TestCase):
+    """Tests for Reranker"""
+
+    def make_reranker(self, scores, **kwargs):
+        reranker = Reranker(**kwargs)
+        reranker._model = MagicMock()
+        reranker._model.predict.side_effect = lambda pairs, batch_size: [scores[doc] for _, doc in pairs]
+        return reranker
+
+    def test_reorders_by_score(self):
+        """Test that candidates are sorted by cross-encoder score and cut to top_k"""
+        reranker = self.make_reranker({"a": 0.1, "b": 0.9, "c": 0.5}, top_k=2)
+        results = reranker.rerank("query", make_docs("a", "b", "c"))
+        self.assertEqual([doc["content"] for doc in results], ["b", "c"])
+        self.assertEqual(results[0]["score"], 0.9)
+
+    def test_score_threshold(self):
+        """Test that chunks below the threshold are dropped"""
+        reranker = self.make_reranker({"a": -2.0, "b": 3.0}, score_threshold=0.0)
+        self.assertEqual([doc["content"] for doc in reranker.rerank("query", make_docs("a", "b"))], ["b"])
+
+    def test_token_budget(self):
+        """Test that chunks are kept only while they fit the token budget"""
+        reranker = self.make_reranker({"one two": 0.9, "three four five": 0.8, "six": 0.7}, token_budget=3)
+        results = reranker.rerank("query", make_docs("one two", "three four five", "six"))
+        self.assertEqual([doc["content"] for doc in results], ["one two"])
+
+    def test_adaptive_depth(self):
+        """Test that scoring stops once a batch has nothing relevant"""
+        scores = {"a": 5.0, "b": -1.0, "c": 5.0}
+        reranker = self.make_reranker(scores, batch_size=1, top_k=1, score_threshold=0.0)
+        results = reranker.rerank("query", make_docs("a", "b", "c"))
+        self.assertEqual([doc["content"] for doc in results], ["a"])
+        self.assertEqual(reranker._model.predict.call_count, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+from session_store import MemorySessionStore, SQLiteSessionStore, create_session_store
+
+def turn(i):
+    return {"query": f"Q{i}", "response": f"R{i}", "timestamp": "2024-01-01 00:00:00"}
+
+class SessionStoreTests:
+    """Tests shared by every session store backend"""
+
+    def make_store(self, **kwargs):
+        raise NotImplementedError
+
+    def setUp(self):
+        """Set up a small store"""
+        self.store = self.make_store(max_sessions=3, ttl=3600, max_turns=4, max_files=2)
+        self.addCleanup(self.store.close)
+
+    def test_append_and_history(self):
+        """Test that turns are returned oldest first and paginated"""
+        self.store.append("s1", [turn(0), turn(1)])
+        self.store.append("s1", [turn(2)])
+        self.assertEqual([t["query"] for t in self.store.history("s1")], ["Q0", "Q1", "Q2"])
+        self.assertEqual([t["query"] for t in self.store.history("s1", offset=1, limit=1)], ["Q1"])
+        self.assertEqual([t["query"] for t in self.store.recent("s1", 2)], ["Q1", "Q2"])
+        self.assertEqual(self.store.message_count("s1"), 3)
+        self.assertIsNone(self.store.history("unknown"))
+        self.assertIn("s1", self.store)
+
+    def test_turns_are_bounded(self):
+        """Test that only the last max_turns turns are kept"""
+        for i in range(6):
+            self.store.append("s1", [turn(i)])
+        self.assertEqual([t["query"] for t in self.store.history("s1")], ["Q2", "Q3", "Q4", "Q5"])
+        self.assertEqual(self.store.sessions()[0]["message_count"], 4)
+
+    def test_least_recently_active_are_evicted(self):
+        """Test that max_sessions is enforced, evicting the least recently active"""
+        for session_id in ("a", "b", "c"):
+            self.store.ensure(session_id)
+        self.store.append("a", [turn(0)])
+        self.store.ensure("d")
+        self.assertEqual([s["id"] for s in self.store.sessions()], ["d", "a", "c"])
+        self.assertNotIn("b", self.store)
+        self.assertEqual(self.store.count(), 3)
+        self.assertEqual([s["id"] for s in self.store.sessions(offset=1, limit=1)], ["a"])
+
+    def test_idle_sessions_expire(self):
+        """Test that sessions idle for longer than ttl are dropped"""
+        self.store.append("s1", [turn(0)])
+        self.store.ttl = -1
+        self.assertIsNone(self.store.history("s1"))
+        self.assertEqual(self.store.recent("s1", 2), [])
+        self.assertEqual(self.store.count(), 0)
+
+    def test_files(self):
+        """Test that uploads are listed in order, updated, removed and bounded"""
+        for name in ("a", "b", "c"):
+            self.store.add_file({"stored_name": name, "status": "queued"})
+        self.store.update_file("c", status="completed", chunks=3)
+        self.assertEqual(self.store.files(), [{"stored_name": "b", "status": "queued"},
+                                              {"stored_name": "c", "status": "completed", "chunks": 3}])
+        self.store.remove_file("b")
+        self.assertEqual([f["stored_name"] for f in self.store.files(limit=5)], ["c"])
+
+class TestMemorySessionStore(SessionStoreTests, unittest.TestCase):
+    """Tests for MemorySessionStore"""
+
+    def make_store(self, **kwargs):
+        return MemorySessionStore(**kwargs)
+
+class TestSQLiteSessionStore(SessionStoreTests, unittest.TestCase):
+    """Tests for SQLiteSessionStore"""
+
+    def make_store(self, **kwargs):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "sessions.db")
+        self.kwargs = kwargs
+        return SQLiteSessionStore(self.path, **kwargs)
+
+    def test_sessions_persist(self):
+        """Test that sessions survive a restart and are shared through the file"""
+        self.store.append("s1", [turn(0)])
+        self.store.add_file({"stored_name": "a"})
+        self.store.close()
+        other = SQLiteSessionStore(self.path, **self.kwargs)
+        self.addCleanup(other.close)
+        self.assertEqual(other.history("s1"), [turn(0)])
+        self.assertEqual(other.files(), [{"stored_name": "a"}])
+
+    def test_wal_mode(self):
+        """Test that the database is opened in WAL mode"""
+        self.store.ensure("s1")
+        with self.store._lock:
+            self.assertEqual(self.store._conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+class TestCreateSessionStore(unittest.TestCase):
+    """Tests for create_session_store"""
+
+    def test_unknown_backend(self):
+        """Test that unknown backend names are rejected"""
+        with self.assertRaises(ValueError):
+            create_session_store("unknown")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import sqlite3
+import threading
+from vector_index import ChromaIndex, QuantizedIndex, create_index, validate_where, where_to_sql
+
+def random_vectors(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class TestQuantizedIndex(unittest.TestCase):
+    """Tests for QuantizedIndex"""
+
+    def setUp(self):
+        """Set up test environment"""
+        self.path = os.path.join(tempfile.mkdtemp(), "index")
+        self.index = QuantizedIndex(self.path, train_size=200, nprobe=16)
+        self.vectors = random_vectors(500)
+        self.ids = [f"id{i}" for i in range(500)]
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+
+    def add_all(self):
+        for start in range(0, 500, 100):
+            self.index.upsert(self.ids[start:start + 100], self.vectors[start:start + 100],
+                              [f"doc {i}" for i in range(start, start + 100)],
+                              [{"source": f"{i}.txt"} for i in range(start, start + 100)])
+
+    def test_query_returns_nearest(self):
+        """Test that each stored vector is its own nearest neighbour"""
+        self.add_all()
+        self.assertIsNotNone(self.index._centroids)
+        results = self.index.query(self.vectors[[3, 250]], n_results=3)
+        self.assertEqual([ids[0] for ids in results["ids"]], ["id3", "id250"])
+        self.assertEqual(results["documents"][0][0], "doc 3")
+        self.assertEqual(results["metadatas"][1][0], {"source": "250.txt"})
+        self.assertAlmostEqual(results["distances"][0][0], 0.0, places=5)
+
+    def test_recall_against_exact_search(self):
+        """Test that int8 codes with re-scoring keep recall high"""
+        self.add_all()
+        queries = random_vectors(20, seed=1)
+        hits = 0
+        for query in queries:
+            exact = np.argsort(((self.vectors - query) ** 2).sum(1))[:5]
+            found = self.index.query([query], n_results=5)["ids"][0]
+            hits += len(set(found) & {f"id{i}" for i in exact})
+        self.assertGreaterEqual(hits / 100, 0.8)
+
+    def test_upsert_replaces_and_get(self):
+        """Test that upserting an id replaces it"""
+        self.index.upsert(["a", "b"], self.vectors[:2], ["A", "B"], [{"n": 1}, {"n": 2}])
+        self.index.upsert(["a"], self.vectors[2:3], ["A2"], [{"n": 3}])
+        self.assertEqual(self.index.count(), 2)
+        self.assertEqual(self.index.get(["a"]), {"ids": ["a"], "documents": ["A2"], "metadatas": [{"n": 3}]})
+        self.assertEqual(self.index.query([self.vectors[2]], n_results=1)["ids"], [["a"]])
+
+    def test_delete_and_compaction(self):
+        """Test that deleted rows disappear and are compacted away"""
+        self.add_all()
+        self.index.delete(self.ids[:200])
+        self.assertEqual(self.index.count(), 300)
+        self.assertEqual(self.index.rows, 300)
+        self.assertEqual(self.index.get(["id0", "id300"])["ids"], ["id300"])
+        self.assertEqual(self.index.query([self.vectors[300]], n_results=1)["ids"], [["id300"]])
+
+    def test_reopen(self):
+        """Test that the index is persisted"""
+        self.add_all()
+        self.index.close()
+        self.index = QuantizedIndex(self.path, train_size=200, nprobe=16)
+        self.assertEqual(self.index.count(), 500)
+        self.assertEqual(self.index.query([self.vectors[42]], n_results=1)["ids"], [["id42"]])
+
+    def test_dimension_mismatch(self):
+        """Test that embeddings of another model are rejected"""
+        self.index.upsert(["a"], self.vectors[:1], ["A"], [{}])
+        with self.assertRaises(ValueError):
+            self.index.upsert(["b"], random_vectors(1, dim=8), ["B"], [{}])
+
+    def test_empty(self):
+        """Test querying an empty index"""
+        self.assertEqual(self.index.query([self.vectors[0]], n_results=3)["ids"], [[]])
+        self.assertEqual(self.index.count(), 0)
+
+    def add_tenants(self):
+        """Every vector in one of 5 sources and 2 languages"""
+        self.index.upsert(self.ids, self.vectors, [f"doc {i}" for i in range(500)],
+                          [{"source": f"{i % 5}.txt", "lang": "fr" if i % 2 else "en", "page": i}
+                           for i in range(500)])
+
+    def test_query_within_partitions(self):
+        """Test that a query filtered on sources only returns their chunks, exactly ranked"""
+        self.add_tenants()
+        query = random_vectors(1, seed=1)[0]
+        results = self.index.query([query], n_results=5, where={"source": {"$in": ["1.txt", "3.txt"]}})
+        rows = [i for i in range(500) if i % 5 in (1, 3)]
+        exact = [f"id{rows[i]}" for i in np.argsort(((self.vectors[rows] - query) ** 2).sum(1))[:5]]
+        self.assertEqual(results["ids"][0], exact)
+        self.assertEqual(self.index.query([query], n_results=5, where={"source": "9.txt"})["ids"], [[]])
+
+    def test_query_with_metadata_filter(self):
+        """Test filters on other keys, combined with a partition or not"""
+        self.add_tenants()
+        where = {"$and": [{"source": "2.txt"}, {"lang": "fr"}, {"page": {"$gte": 400}}]}
+        ids = self.index.query([self.vectors[457]], n_results=50, where=where)["ids"][0]
+        self.assertEqual(ids[0], "id457")
+        self.assertEqual(sorted(ids), sorted(f"id{i}" for i in range(400, 500) if i % 5 == 2 and i % 2))
+        self.assertEqual(len(self.index.ids({"$or": [{"lang": "en"}, {"page": {"$lt": 3}}]})), 251)
+
+    def test_large_partition_probes_lists(self):
+        """Test that a partition bigger than train_size is only scanned in the probed lists"""
+        self.index = QuantizedIndex(self.path, train_size=100, nprobe=2, nlist=20)
+        self.add_tenants()
+        scope = self.index._filter_rows({"source": "0.txt"})
+        self.assertEqual(len(scope), 100)
+        self.assertLess(len(self.index._candidates(self.vectors[0], self.index._filter_rows({"source": {"$in": ["0.txt", "1.txt"]}}))), 200)
+        self.assertEqual(self.index.query([self.vectors[0]], n_results=1, where={"source": "0.txt"})["ids"], [["id0"]])
+
+    def test_partitions_follow_writes(self):
+        """Test that deleted and moved chunks leave their partition"""
+        self.add_tenants()
+        self.assertEqual(len(self.index.ids({"source": "0.txt"})), 100)
+        self.index.delete(["id0", "id5"])
+        self.index.upsert(["id10"], self.vectors[10:11], ["moved"], [{"source": "1.txt"}])
+        self.assertEqual(len(self.index.ids({"source": "0.txt"})), 97)
+        self.assertIn("id10", self.index.ids({"source": "1.txt"}))
+
+    def test_partition_column_is_added_to_old_indexes(self):
+        """Test that indexes written before partitions get them on open"""
+        self.add_tenants()
+        self.index.close()
+        with sqlite3.connect(os.path.join(self.path, "rows.db")) as conn:
+            conn.execute("DROP INDEX rows_partition")
+            conn.execute("ALTER TABLE rows DROP COLUMN partition")
+        self.index = QuantizedIndex(self.path, train_size=200, nprobe=16)
+        self.assertEqual(len(self.index.ids({"source": "4.txt"})), 100)
+
+    def test_many_ids_are_queried_in_chunks(self):
+        """Test that get, ids and delete take more ids than fit in one IN (...)"""
+        self.add_all()
+        with patch("vector_index.IN_CHUNK", 64):
+            self.assertEqual(sorted(self.index.get(self.ids)["ids"]), sorted(self.ids))
+            self.assertEqual(sorted(self.index.ids({"source": {"$ne": ""}})), sorted(self.ids))
+            self.index.delete(self.ids[:450])
+            self.assertEqual(self.index.count(), 50)
+            self.assertEqual(sorted(self.index.get(self.ids)["ids"]), sorted(self.ids[450:]))
+
+    def test_instances_share_path(self):
+        """Test that instances on the same path see each other's writes"""
+        other = QuantizedIndex(self.path, train_size=200, nprobe=16)
+        self.addCleanup(other.close)
+        self.index.upsert(self.ids[:10], self.vectors[:10], ["doc"] * 10, None)
+        other.upsert(self.ids[10:20], self.vectors[10:20], ["doc"] * 10, None)
+        self.index.upsert(self.ids[20:30], self.vectors[20:30], ["doc"] * 10, None)
+        self.assertEqual((self.index.count(), other.count()), (30, 30))
+        self.assertEqual(self.index.query([self.vectors[15]], n_results=1)["ids"], [["id15"]])
+        self.assertEqual(other.query([self.vectors[25]], n_results=1)["ids"], [["id25"]])
+
+        other.delete(self.ids[:5])
+        self.assertEqual(sorted(self.index.get(self.ids[:10])["ids"]), sorted(self.ids[5:10]))
+        self.index.drop()
+        self.assertEqual(other.count(), 0)
+
+    def test_concurrent_writers(self):
+        """Test that writers in parallel keep the vector files and the rows aligned"""
+        indexes = [QuantizedIndex(self.path, train_size=200, nprobe=16) for _ in range(3)]
+        for index in indexes:
+            self.addCleanup(index.close)
+
+        def write(k, index):
+            for start in range(k * 150, k * 150 + 150, 10):
+                index.upsert(self.ids[start:start + 10], self.vectors[start:start + 10], ["doc"] * 10, None)
+        threads = [threading.Thread(target=write, args=(k, index)) for k, index in enumerate(indexes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.index.count(), 450)
+        results = self.index.query(self.vectors[:450:7], n_results=1)["ids"]
+        self.assertEqual([ids[0] for ids in results], self.ids[:450:7])
+
+    def test_failed_write_is_dropped(self):
+        """Test that a write failing after appending its vectors leaves the index consistent"""
+        self.index.upsert(self.ids[:10], self.vectors[:10], ["doc"] * 10, None)
+        with self.assertRaises(TypeError):
+            self.index.upsert(self.ids[10:20], self.vectors[10:20], ["doc"] * 10, [{"x": object()}] * 10)
+        self.assertEqual(self.index.count(), 10)
+        self.index.upsert(self.ids[20:30], self.vectors[20:30], ["doc"] * 10, None)
+        self.assertEqual(self.index.count(), 20)
+        self.assertEqual(self.index.query([self.vectors[25]], n_results=1)["ids"], [["id25"]])
+        self.assertEqual(os.path.getsize(os.path.join(self.path, "norms.bin")), 20 * 4)
+
+    def test_validate_where(self):
+        """Test that malformed filters are rejected"""
+        validate_where({"$and": [{"source": "a"}, {"page": {"$in": [1, 2]}}]})
+        for where in ({}, {"$not": {}}, {"page": {"$regex": "x"}}, {"page": {"$in": []}},
+                      {"page": {"$gt": 1, "$lt": 3}}, {"$or": []}, {"source": ["a"]}, {'page"': 1}, {"": 1},
+                      {"page": {"$in": [[1]]}}, {"source": {"$nin": ["a", {"b": 1}]}}, {"page": {"$gt": [1]}}):
+            with self.assertRaises(ValueError):
+                validate_where(where)
+        with self.assertRaises(ValueError):
+            where_to_sql({"$or": [{"source": "a"}, {'x") OR 1 = 1 OR ("': 1}]})
+
+class TestChromaIndex(unittest.TestCase):
+    """Tests for ChromaIndex"""
+
+    @patch("vector_index.chromadb.Client")
+    def test_forwards_to_collection(self, mock_client):
+        """Test that calls go to the Chroma collection"""
+        collection = mock_client.return_value.get_collection.return_value
+        index = ChromaIndex("docs")
+        index.upsert(["a"], [[0.1]], ["A"], [{}])
+        collection.upsert.assert_called_once_with(documents=["A"], embeddings=[[0.1]], ids=["a"], metadatas=[{}])
+        index.query([[0.1]], n_results=2)
+        collection.query.assert_called_once_with(query_embeddings=[[0.1]], n_results=2)
+        index.query([[0.1]], n_results=2, where={"source": "a.txt"})
+        self.assertEqual(collection.query.call_args.kwargs["where"], {"source": "a.txt"})
+        collection.get.return_value = {"ids": ["a"]}
+        self.assertEqual(index.ids({"source": "a.txt"}), ["a"])
+        collection.get.assert_called_with(where={"source": "a.txt"}, include=[])
+
+    def test_create_index(self):
+        """Test building an index by name"""
+        with tempfile.TemporaryDirectory() as tmp:
+            index = create_index("quantized", "docs", path=tmp)
+            self.assertIsInstance(index, QuantizedIndex)
+            self.assertTrue(os.path.isdir(os.path.join(tmp, "docs")))
+            index.close()
+        self.assertIsInstance(create_index("chroma"), ChromaIndex)
+        with self.assertRaises(ValueError):
+            create_index("faiss")
+
+if __name__ == '__main__':
+    unittest.main()
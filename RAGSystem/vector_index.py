@@ -0,0 +1,765 @@
+import fcntl
+import json
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from lazy import LazyImport
+from process_local import SQLiteConnection
+
+chromadb = LazyImport("chromadb")
+Settings = LazyImport("chromadb.config", "Settings")
+
+# Operators of the metadata filters, the subset of Chroma "where" clauses both indexes support
+COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+LIST_OPERATORS = {"$in": "IN", "$nin": "NOT IN"}
+
+# Types of the values a filter compares metadata to
+SCALARS = (str, int, float, bool)
+
+# Most ids bound to one IN (...), SQLite limits the parameters of a statement
+IN_CHUNK = 500
+
+# Metadata keys a filter may name, they end up in a JSON path
+METADATA_KEY = re.compile(r"[A-Za-z0-9_.-]+")
+
+
+def validate_where(where: Dict[str, Any]):
+    """Raise ValueError unless where is a metadata filter the indexes support
+
+    A filter maps metadata keys to a value, which must be equal, or to
+    {operator: value} with one of $eq, $ne, $gt, $gte, $lt, $lte, $in and
+    $nin, or combines filters with {"$and": [...]} or {"$or": [...]}. Keys
+    are made of letters, digits, "_", "." and "-".
+    """
+    if not isinstance(where, dict) or not where:
+        raise ValueError("A filter must be a non-empty object")
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            if not isinstance(condition, list) or not condition:
+                raise ValueError(f"{key} takes a non-empty list of filters")
+            for clause in condition:
+                validate_where(clause)
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported filter operator: {key}")
+        elif not METADATA_KEY.fullmatch(key):
+            raise ValueError(f"Unsupported metadata key: {key!r}")
+        elif isinstance(condition, dict):
+            if len(condition) != 1:
+                raise ValueError(f"Filter on {key} must have exactly one operator")
+            operator, value = next(iter(condition.items()))
+            if operator in LIST_OPERATORS:
+                if not isinstance(value, list) or not value:
+                    raise ValueError(f"{operator} takes a non-empty list")
+                if not all(isinstance(item, SCALARS) for item in value):
+                    raise ValueError(f"Unsupported filter value for {key}")
+            elif operator not in COMPARISONS:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            elif not isinstance(value, SCALARS):
+                raise ValueError(f"Unsupported filter value for {key}")
+        elif not isinstance(condition, SCALARS):
+            raise ValueError(f"Unsupported filter value for {key}")
+
+
+def where_to_sql(where: Dict[str, Any], column: str = "metadata") -> Tuple[str, List[Any]]:
+    """SQLite condition and parameters matching the rows whose JSON column satisfies where"""
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(clause, column) for clause in condition]
+            clauses.append("(" + f" {key[1:].upper()} ".join(sql for sql, _ in parts) + ")")
+            params += [param for _, clause_params in parts for param in clause_params]
+            continue
+        if not METADATA_KEY.fullmatch(key):
+            raise ValueError(f"Unsupported metadata key: {key!r}")
+        operator, value = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+        field = f"json_extract({column}, ?)"
+        params.append(f'$."{key}"')
+        if operator in LIST_OPERATORS:
+            clauses.append(f"{field} {LIST_OPERATORS[operator]} ({','.join('?' * len(value))})")
+            params += list(value)
+        else:
+            clauses.append(f"{field} {COMPARISONS[operator]} ?")
+            params.append(value)
+    return " AND ".join(clauses), params
+
+
+class VectorIndex:
+    """Interface for the stores of chunk embeddings used by VectorStore
+
+    The methods mirror the subset of the Chroma collection API that
+    VectorStore relies on: query() returns {"ids", "documents", "metadatas",
+    "distances"} with one list per query embedding, get() returns the same
+    keys with flat lists. Distances are squared L2. where is a metadata
+    filter, see validate_where().
+    """
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+               metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 5,
+              where: Dict[str, Any] = None) -> Dict[str, List]:
+        raise NotImplementedError
+
+    def ids(self, where: Dict[str, Any]) -> List[str]:
+        """Ids of the chunks whose metadata matches where"""
+        raise NotImplementedError
+
+    def get(self, ids: List[str]) -> Dict[str, List]:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def embedding_model(self) -> Optional[Dict[str, Any]]:
+        """{"model_id", "dimension"} of the model the stored embeddings come from, None if not recorded"""
+        raise NotImplementedError
+
+    def set_embedding_model(self, model_id: str, dimension: int):
+        raise NotImplementedError
+
+    def drop(self):
+        """Delete everything stored by the index"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ChromaIndex(VectorIndex):
+    """Chroma collection, the client and collection are opened on first use"""
+
+    def __init__(self, collection_name: str = "documents", persist_directory: str = "./chroma_db"):
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self._client = None
+        self._collection = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = chromadb.Client(Settings(
+                        chroma_db_impl="duckdb+parquet",
+                        persist_directory=self.persist_directory
+                    ))
+        return self._client
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            client = self.client
+            with self._lock:
+                if self._collection is None:
+                    # Create or get collection
+                    try:
+                        self._collection = client.get_collection(self.collection_name)
+                    except:
+                        self._collection = client.create_collection(self.collection_name)
+        return self._collection
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(documents=documents, embeddings=embeddings, ids=ids, metadatas=metadatas)
+
+    def query(self, query_embeddings, n_results=5, where=None):
+        if where is None:
+            return self.collection.query(query_embeddings=query_embeddings, n_results=n_results)
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+    def ids(self, where):
+        return self.collection.get(where=where, include=[])["ids"]
+
+    def get(self, ids):
+        return self.collection.get(ids=ids)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def count(self):
+        return self.collection.count()
+
+    def embedding_model(self):
+        metadata = self.collection.metadata or {}
+        if "embedding_model" not in metadata:
+            return None
+        return {"model_id": metadata["embedding_model"], "dimension": metadata["embedding_dimension"]}
+
+    def set_embedding_model(self, model_id, dimension):
+        metadata = {key: value for key, value in (self.collection.metadata or {}).items()
+                    if not key.startswith("hnsw:")}
+        self.collection.modify(metadata={**metadata, "embedding_model": model_id,
+                                         "embedding_dimension": dimension})
+
+    def drop(self):
+        self.client.delete_collection(self.collection_name)
+        self._collection = None
+
+
+class QuantizedIndex(SQLiteConnection, VectorIndex):
+    """Local int8 index in memory-mapped files with an IVF coarse quantizer
+
+    Every embedding is stored twice in append-only files under path: as
+    int8 codes with a per-vector scale, scanned to find candidates, and as
+    float32, read back only to re-score the rescore_factor * n_results best
+    candidates exactly. Once train_size vectors are stored, k-means
+    centroids split them into nlist lists and a query only scans the
+    nprobe lists closest to it. Documents and metadata live in SQLite.
+
+    Upserts and deletes leave tombstones; the files are compacted once
+    more than compact_ratio of the rows are dead, and the lists retrained
+    when the index has grown retrain_growth times since the last training.
+    Only the SQLite file is read at startup, the vectors are paged in by
+    the OS as they are searched.
+
+    Rows are partitioned by the partition_key metadata value. A query
+    filtered on it only scans the rows of the partitions it names, listed
+    once and kept until the next write, and only their rows in the nprobe
+    closest lists when there are more than train_size of them. Filters on
+    other keys are evaluated by SQLite on the JSON metadata.
+
+    Instances in any number of processes may share path: writes hold the
+    lock file path + ".lock" exclusively and reads hold it shared, and an
+    instance reloads what it keeps in memory once another one has written.
+    """
+
+    def __init__(self, path: str = "./vector_index", nlist: int = None, nprobe: int = 16,
+                 rescore_factor: int = 4, train_size: int = 4096, compact_ratio: float = 0.25,
+                 retrain_growth: float = 4.0, block_rows: int = 65536, partition_key: str = "source"):
+        self.path = path
+        self.partition_key = partition_key
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rescore_factor = rescore_factor
+        self.train_size = train_size
+        self.compact_ratio = compact_ratio
+        self.retrain_growth = retrain_growth
+        self.block_rows = block_rows
+
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+        self._lock_file_pid = None
+        self._generation = None
+        self._database = None
+        os.makedirs(path, exist_ok=True)
+
+        # Load the state, and drop rows a crashed writer appended but never committed
+        with self._locked(exclusive=True):
+            pass
+
+    # Public API
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("embeddings must be one vector per id")
+        if metadatas is None:
+            metadatas = [None] * len(ids)
+
+        with self._locked(exclusive=True):
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_info("dim", self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected embeddings of dimension {self.dim}, got {vectors.shape[1]}")
+
+            self._tombstone(ids)
+            first_row = self.rows
+            self._append(vectors)
+            self._conn.executemany(
+                "INSERT INTO rows (row, id, document, metadata, partition) VALUES (?, ?, ?, ?, ?)",
+                [(first_row + i, doc_id, document, json.dumps(metadata), (metadata or {}).get(self.partition_key))
+                 for i, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas))]
+            )
+            self._commit()
+
+            # Rows only count once committed
+            self.rows += len(vectors)
+            self._deleted = np.concatenate([self._deleted, np.zeros(len(vectors), dtype=bool)])
+            self._list_rows = None
+            self._partitions = {}
+            self._maintain()
+
+    def query(self, query_embeddings, n_results=5, where=None):
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._locked():
+            scope = self._filter_rows(where) if where is not None else None
+            for query_embedding in query_embeddings:
+                rows, distances = self._search(np.asarray(query_embedding, dtype=np.float32), n_results, scope)
+                records = self._records(rows)
+                results["ids"].append([records[row][0] for row in rows])
+                results["documents"].append([records[row][1] for row in rows])
+                results["metadatas"].append([records[row][2] for row in rows])
+                results["distances"].append([float(distance) for distance in distances])
+        return results
+
+    def ids(self, where):
+        with self._locked():
+            return [doc_id for doc_id, _, _ in self._records(self._filter_rows(where)).values()]
+
+    def get(self, ids):
+        with self._locked():
+            found = self._select_in("SELECT id, document, metadata FROM rows WHERE deleted = 0 AND id IN ({})", ids)
+        return {
+            "ids": [row[0] for row in found],
+            "documents": [row[1] for row in found],
+            "metadatas": [json.loads(row[2]) for row in found]
+        }
+
+    def delete(self, ids):
+        with self._locked(exclusive=True):
+            self._tombstone(ids)
+            self._commit()
+            self._maintain()
+
+    def count(self) -> int:
+        with self._locked():
+            return self.rows - int(self._deleted.sum())
+
+    def embedding_model(self):
+        with self._locked():
+            model_id = self._get_info("embedding_model")
+            if model_id is None:
+                return None
+            return {"model_id": model_id, "dimension": int(self._get_info("embedding_dimension"))}
+
+    def set_embedding_model(self, model_id, dimension):
+        with self._locked(exclusive=True):
+            self._set_info("embedding_model", model_id)
+            self._set_info("embedding_dimension", dimension)
+
+    def compact(self):
+        """Rewrite the files without dead rows and retrain the lists"""
+        with self._locked(exclusive=True):
+            if self.dim is None:
+                return
+            live = np.flatnonzero(~self._deleted)
+            for name, dtype, width in self._files():
+                source = self._mapped(name, dtype, width)
+                with open(self._file(name) + ".tmp", "wb") as f:
+                    for start in range(0, len(live), self.block_rows):
+                        f.write(np.ascontiguousarray(source[live[start:start + self.block_rows]]).tobytes())
+            self._maps = {}
+            for name, _, _ in self._files():
+                os.replace(self._file(name) + ".tmp", self._file(name))
+
+            # Renumber in ascending order, a row only ever moves down to a free number
+            self._conn.execute("DELETE FROM rows WHERE deleted = 1")
+            self._conn.executemany("UPDATE rows SET row = ? WHERE row = ?",
+                                   [(new, int(old)) for new, old in enumerate(live) if new != old])
+            self._commit()
+
+            self.rows = len(live)
+            self._deleted = np.zeros(self.rows, dtype=bool)
+            self._partitions = {}
+            self._train()
+
+    def drop(self):
+        with self._locked(exclusive=True):
+            self._maps = {}
+            super().close()
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path, exist_ok=True)
+            self._load()
+
+    def close(self):
+        with self._lock:
+            self._maps = {}
+            if self._lock_file is not None and self._lock_file_pid == os.getpid():
+                self._lock_file.close()
+            self._lock_file, self._lock_file_pid = None, None
+            super().close()
+
+    # Sharing path
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        """Hold the instance lock and, outermost, the lock file, after reloading the state if it is stale
+
+        A write that fails is rolled back and the state reloaded on next use,
+        the rows it appended to the files are dropped by the next write.
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            lock_file = self._shared_lock_file()
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth = 1
+            try:
+                self._sync(exclusive)
+                yield
+            except BaseException:
+                if exclusive:
+                    self._conn.rollback()
+                    self._generation = None
+                raise
+            finally:
+                self._lock_depth = 0
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _shared_lock_file(self):
+        """The lock file of path, opened once per process so a forked child never shares its lock"""
+        if self._lock_file_pid != os.getpid():
+            self._lock_file = open(self.path.rstrip(os.sep) + ".lock", "ab")
+            self._lock_file_pid = os.getpid()
+        return self._lock_file
+
+    def _sync(self, exclusive: bool):
+        """Reload the state if another instance wrote since it was loaded (caller holds the lock file)"""
+        if self._database is not None and self._database != self._database_id():
+            # Dropped and created again, the open connection is to the deleted file
+            super().close()
+            self._generation = None
+        if self._generation is None or (self._get_info("generation") or "") != self._generation:
+            self._load()
+        if exclusive:
+            self._drop_uncommitted()
+
+    def _database_id(self):
+        try:
+            stat = os.stat(os.path.join(self.path, "rows.db"))
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _commit(self):
+        """Commit a write, and a new generation telling the other instances to reload (caller writes)"""
+        self._generation = uuid.uuid4().hex
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('generation', ?)", (self._generation,))
+        self._conn.commit()
+
+    def _drop_uncommitted(self):
+        """Truncate the rows a failed or crashed writer appended to the files but never committed"""
+        if self.dim is None:
+            return
+        for name, dtype, width in self._files():
+            size = self.rows * width * np.dtype(dtype).itemsize
+            if os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) > size:
+                self._maps.pop(name, None)
+                with open(self._file(name), "r+b") as f:
+                    f.truncate(size)
+
+    # Storage
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(os.path.join(self.path, "rows.db"), check_same_thread=False)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, id TEXT NOT NULL, "
+            "document TEXT, metadata TEXT, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS rows_id ON rows (id)")
+        connection.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        if "partition" not in [column[1] for column in connection.execute("PRAGMA table_info(rows)")]:
+            # Indexes written before partitions, fill the column from the metadata
+            connection.execute("ALTER TABLE rows ADD COLUMN partition")
+            connection.execute("UPDATE rows SET partition = json_extract(metadata, ?)",
+                               (f'$."{self.partition_key}"',))
+        connection.execute("CREATE INDEX IF NOT EXISTS rows_partition ON rows (partition, row)")
+        connection.commit()
+        return connection
+
+    def _files(self):
+        """(name, dtype, values per row) of the append-only row files"""
+        return [("codes", np.int8, self.dim), ("vectors", np.float32, self.dim),
+                ("scales", np.float32, 1), ("norms", np.float32, 1), ("lists", np.int32, 1)]
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _mapped(self, name: str, dtype, width: int) -> np.ndarray:
+        """Read-only memory map of the first self.rows rows of a file"""
+        mapped = self._maps.get(name)
+        if mapped is None or len(mapped) != self.rows:
+            if self.rows == 0:
+                mapped = np.zeros((0, width), dtype=dtype)
+            else:
+                with open(self._file(name), "rb") as f:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                # Rows are read scattered, readahead would only fill memory
+                if width > 1 and hasattr(buffer, "madvise"):
+                    buffer.madvise(mmap.MADV_RANDOM)
+                mapped = np.frombuffer(buffer, dtype=dtype, count=self.rows * width).reshape(self.rows, width)
+            self._maps[name] = mapped
+        return mapped if width > 1 else mapped.reshape(-1)
+
+    def _read_vectors(self, rows) -> np.ndarray:
+        """Float vectors of a few rows, read rather than mapped so they do not stay resident"""
+        size = self.dim * 4
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        with open(self._file("vectors"), "rb", buffering=0) as f:
+            for i, row in enumerate(rows):
+                vectors[i] = np.frombuffer(os.pread(f.fileno(), size, int(row) * size), dtype=np.float32)
+        return vectors
+
+    def _load(self):
+        self._maps = {}
+        self._generation = self._get_info("generation") or ""
+        self._database = self._database_id()
+        dim = self._get_info("dim")
+        self.dim = int(dim) if dim is not None else None
+        self.rows = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+        self._deleted = np.zeros(self.rows, dtype=bool)
+        dead = [row for row, in self._conn.execute("SELECT row FROM rows WHERE deleted = 1")]
+        self._deleted[dead] = True
+
+        centroids = os.path.join(self.path, "centroids.npy")
+        self._centroids = np.load(centroids) if os.path.exists(centroids) else None
+        trained_rows = self._get_info("trained_rows")
+        self._trained_rows = int(trained_rows) if trained_rows is not None else 0
+        self._list_rows = None
+        self._partitions = {}  # partition value -> its live rows, sorted
+
+    def _get_info(self, key: str):
+        row = self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, str(value)))
+        self._conn.commit()
+
+    def _append(self, vectors: np.ndarray):
+        scales = np.abs(vectors).max(axis=1)
+        codes = np.round(vectors / np.maximum(scales, 1e-12)[:, None] * 127).astype(np.int8)
+        norms = np.einsum("ij,ij->i", vectors, vectors)
+        lists = self._assign(vectors) if self._centroids is not None else np.full(len(vectors), -1)
+
+        for name, values, dtype in [("codes", codes, np.int8), ("vectors", vectors, np.float32),
+                                    ("scales", scales, np.float32), ("norms", norms, np.float32),
+                                    ("lists", lists, np.int32)]:
+            with open(self._file(name), "ab") as f:
+                f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+    def _tombstone(self, ids: List[str]):
+        """Mark the live rows of ids dead (caller holds the lock and commits)"""
+        found = self._select_in("SELECT row FROM rows WHERE deleted = 0 AND id IN ({})", ids)
+        if found:
+            self._conn.executemany("UPDATE rows SET deleted = 1 WHERE row = ?", found)
+            self._deleted[[row for row, in found]] = True
+            self._partitions = {}
+
+    def _select_in(self, query: str, values: List[Any]) -> List[tuple]:
+        """Rows of query with its IN ({}) bound to values, IN_CHUNK at a time (caller holds the lock)"""
+        found = []
+        for start in range(0, len(values), IN_CHUNK):
+            chunk = list(values[start:start + IN_CHUNK])
+            found += self._conn.execute(query.format(",".join("?" * len(chunk))), chunk).fetchall()
+        return found
+
+    def _maintain(self):
+        live = self.rows - int(self._deleted.sum())
+        if self.rows and self._deleted.sum() > self.compact_ratio * self.rows:
+            self.compact()
+        elif live >= self.train_size and (self._centroids is None or
+                                          live > self.retrain_growth * self._trained_rows):
+            self._train()
+
+    def _filter_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        """Live rows matching where, sorted (caller holds the lock)"""
+        values = self._partition_values(where)
+        if values is not None:
+            rows = np.unique(np.concatenate([self._partition_rows(value) for value in values]))
+            if set(where) == {self.partition_key} or not len(rows):
+                return rows
+            sql, params = where_to_sql(where)
+            partitions = ",".join("?" * len(values))
+            found = self._conn.execute(
+                f"SELECT row FROM rows WHERE deleted = 0 AND partition IN ({partitions}) AND {sql}",
+                list(values) + params
+            )
+        else:
+            sql, params = where_to_sql(where)
+            found = self._conn.execute(f"SELECT row FROM rows WHERE deleted = 0 AND {sql}", params)
+        return np.sort(np.fromiter((row for row, in found), dtype=np.int64))
+
+    def _partition_values(self, where: Dict[str, Any]) -> Optional[List[Any]]:
+        """Partitions every row matching where belongs to, None if where does not restrict them"""
+        condition = where.get(self.partition_key)
+        if condition is not None:
+            if not isinstance(condition, dict):
+                return [condition]
+            operator, value = next(iter(condition.items()))
+            if operator == "$eq":
+                return [value]
+            if operator == "$in":
+                return list(value)
+        for clause in where.get("$and", ()):
+            values = self._partition_values(clause)
+            if values is not None:
+                return values
+        return None
+
+    def _partition_rows(self, value) -> np.ndarray:
+        """Live rows of one partition, listed by SQLite on first use after a write"""
+        rows = self._partitions.get(value)
+        if rows is None:
+            found = self._conn.execute("SELECT row FROM rows WHERE partition = ? AND deleted = 0", (value,))
+            rows = self._partitions[value] = np.fromiter((row for row, in found), dtype=np.int64)
+        return rows
+
+    def _records(self, rows) -> Dict[int, tuple]:
+        found = self._select_in("SELECT row, id, document, metadata FROM rows WHERE row IN ({})",
+                                [int(row) for row in rows])
+        return {row: (doc_id, document, json.loads(metadata)) for row, doc_id, document, metadata in found}
+
+    # IVF
+
+    def _train(self, iterations: int = 10, seed: int = 0):
+        """Cluster the live vectors with k-means and assign every row to its closest centroid"""
+        live = np.flatnonzero(~self._deleted)
+        if len(live) < self.train_size:
+            # Too few vectors left for lists to pay off, scan them all
+            self._centroids = None
+            self._list_rows = None
+            if os.path.exists(os.path.join(self.path, "centroids.npy")):
+                os.remove(os.path.join(self.path, "centroids.npy"))
+            return
+
+        nlist = self.nlist or max(1, int(2 * np.sqrt(len(live))))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(live, size=min(len(live), nlist * 64), replace=False))
+        vectors = np.asarray(self._mapped("vectors", np.float32, self.dim)[sample])
+
+        centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = self._nearest(vectors, centroids)
+            # Mean of every non-empty cluster, summing the vectors sorted by cluster
+            order = np.argsort(assignment, kind="stable")
+            sizes = np.bincount(assignment, minlength=nlist)
+            filled = np.flatnonzero(sizes)
+            starts = (np.cumsum(sizes) - sizes)[filled]
+            centroids[filled] = np.add.reduceat(vectors[order], starts) / sizes[filled, None]
+
+        self._centroids = centroids
+        np.save(os.path.join(self.path, "centroids.npy"), centroids)
+
+        # Rewrite the list of every row, dead ones included so the file stays aligned
+        all_vectors = self._mapped("vectors", np.float32, self.dim)
+        self._maps.pop("lists", None)
+        with open(self._file("lists"), "wb") as f:
+            for start in range(0, self.rows, self.block_rows):
+                block = np.asarray(all_vectors[start:start + self.block_rows])
+                f.write(self._nearest(block, centroids).astype(np.int32).tobytes())
+
+        self._trained_rows = len(live)
+        self._set_info("trained_rows", self._trained_rows)
+        self._list_rows = None
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 4096) -> np.ndarray:
+        # argmin |v - c|^2 == argmax v.c - |c|^2 / 2, a block at a time to bound memory
+        half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+        nearest = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block_rows):
+            scores = vectors[start:start + block_rows] @ centroids.T
+            scores -= half_norms
+            nearest[start:start + block_rows] = np.argmax(scores, axis=1)
+        return nearest
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return self._nearest(vectors, self._centroids)
+
+    def _candidates(self, query: np.ndarray, scope: np.ndarray = None):
+        """Rows in the nprobe lists closest to query, or None to scan everything
+
+        With scope, the sorted rows a filter allows, only those rows are
+        candidates: all of them when they are few, else the ones in the
+        probed lists.
+        """
+        if scope is not None:
+            if self._centroids is None or len(scope) <= self.train_size:
+                return scope
+            return scope[np.isin(self._mapped("lists", np.int32, 1)[scope], self._probes(query))]
+        if self._centroids is None:
+            return None
+        if self._list_rows is None:
+            lists = self._mapped("lists", np.int32, 1)
+            order = np.argsort(lists, kind="stable")
+            bounds = np.searchsorted(lists[order], np.arange(len(self._centroids) + 1))
+            self._list_rows = (order, bounds)
+        order, bounds = self._list_rows
+        return np.sort(np.concatenate([order[bounds[p]:bounds[p + 1]] for p in self._probes(query)]))
+
+    def _probes(self, query: np.ndarray) -> np.ndarray:
+        """The nprobe lists whose centroids are closest to query"""
+        nprobe = min(self.nprobe, len(self._centroids))
+        scores = query @ self._centroids.T - 0.5 * np.einsum("ij,ij->i", self._centroids, self._centroids)
+        return np.argpartition(-scores, nprobe - 1)[:nprobe]
+
+    def _search(self, query: np.ndarray, n_results: int, scope: np.ndarray = None):
+        """Closest live rows to query, among scope if given, and their squared L2 distances"""
+        if self.dim is None or self.rows == 0 or (scope is not None and not len(scope)):
+            return [], []
+
+        codes = self._mapped("codes", np.int8, self.dim)
+        scales = self._mapped("scales", np.float32, 1)
+        norms = self._mapped("norms", np.float32, 1)
+
+        # Approximate distances from the int8 codes, up to the constant |q|^2
+        depth = n_results * self.rescore_factor
+        candidates = self._candidates(query, scope)
+        best_rows, best_distances = [], []
+        total = self.rows if candidates is None else len(candidates)
+        for start in range(0, total, self.block_rows):
+            if candidates is None:
+                rows = np.arange(start, min(start + self.block_rows, total))
+                block_codes = codes[start:start + self.block_rows]
+            else:
+                rows = candidates[start:start + self.block_rows]
+                block_codes = codes[rows]
+            rows = rows[~self._deleted[rows]] if self._deleted.any() else rows
+            if not len(rows):
+                continue
+            if len(rows) != len(block_codes):
+                block_codes = codes[rows]
+            dots = block_codes.astype(np.float32) @ query * (scales[rows] / 127)
+            distances = norms[rows] - 2 * dots
+            if len(rows) > depth:
+                keep = np.argpartition(distances, depth - 1)[:depth]
+                rows, distances = rows[keep], distances[keep]
+            best_rows.append(rows)
+            best_distances.append(distances)
+
+        if not best_rows:
+            return [], []
+        rows = np.concatenate(best_rows)
+        distances = np.concatenate(best_distances)
+        if len(rows) > depth:
+            rows = rows[np.argpartition(distances, depth - 1)[:depth]]
+
+        # Exact re-scoring of the best candidates with the float vectors
+        rows = np.sort(rows)
+        exact = self._read_vectors(rows) - query
+        distances = np.einsum("ij,ij->i", exact, exact)
+        order = np.argsort(distances)[:n_results]
+        return [int(row) for row in rows[order]], distances[order]
+
+
+def create_index(name: str = "chroma", collection_name: str = "documents", path: str = None,
+                 partition_key: str = "source") -> VectorIndex:
+    """Build a vector index from its name ("chroma" or "quantized")"""
+    if name == "chroma":
+        return ChromaIndex(collection_name, persist_directory=path or "./chroma_db")
+    elif name == "quantized":
+        return QuantizedIndex(os.path.join(path or "./vector_index", collection_name), partition_key=partition_key)
+    else:
+        raise ValueError(f"Unknown vector index: {name}")